@@ -0,0 +1,419 @@
+"""
+Order quote PDF rendering.
+
+Runs in the worker processes of the server's PDF pool: `init_worker` registers the
+DejaVu fonts once per process and `render_order_pdf` turns a plain render spec (order,
+items, template settings and bank accounts as JSON-compatible dicts) into PDF bytes.
+The logo arrives as a file decoded by the server and is read once per process.
+Nothing here touches the database.
+"""
+
+import io
+import logging
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.platypus import (BaseDocTemplate, Frame, HRFlowable, KeepTogether, PageTemplate, Paragraph,
+                                Spacer, Table, TableStyle)
+
+logger = logging.getLogger(__name__)
+
+# Part of the server's PDF cache key: bump when the layout changes
+RENDERER_VERSION = "2"
+
+# Fallback to Helvetica if DejaVu not available
+FONT_NAME = 'Helvetica'
+FONT_NAME_BOLD = 'Helvetica-Bold'
+
+# Frames place flowables exactly where the hand-drawn layout did
+NO_PADDING = dict(leftPadding=0, rightPadding=0, topPadding=0, bottomPadding=0)
+
+# Items table rows: reportlab's default 12pt cell leading plus top/bottom padding
+HEADER_ROW_HEIGHT = 12 + 16
+ITEM_ROW_HEIGHT = 12 + 12
+
+# Logo image of this process by sha256; only the current logo is kept
+_logo_images: Dict[str, ImageReader] = {}
+
+def register_fonts():
+    """Register UTF-8 fonts for Turkish characters"""
+    global FONT_NAME, FONT_NAME_BOLD
+    if FONT_NAME == 'DejaVuSans':
+        return
+    try:
+        pdfmetrics.registerFont(TTFont('DejaVuSans', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'))
+        pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'))
+        FONT_NAME = 'DejaVuSans'
+        FONT_NAME_BOLD = 'DejaVuSans-Bold'
+    except Exception as e:
+        logger.warning(f"DejaVu fonts not available, using Helvetica: {e}")
+
+def init_worker():
+    """ProcessPoolExecutor initializer"""
+    register_fonts()
+
+def logo_image(logo: Optional[Dict[str, str]]) -> Optional[ImageReader]:
+    """ImageReader of the logo file described by `logo` ({"sha256", "path"})"""
+    if not logo:
+        return None
+    image = _logo_images.get(logo['sha256'])
+    if image is None:
+        image = ImageReader(logo['path'])
+        _logo_images.clear()
+        _logo_images[logo['sha256']] = image
+    return image
+
+def customer_lines(order: Dict[str, Any], template: SimpleNamespace) -> List[str]:
+    """Lines of the customer block of the first page"""
+    if not (template.show_customer_info and order.get('customer_name')):
+        return []
+    lines = [f"Firma/Müşteri: {order['customer_name']}"]
+    if order.get('customer_phone'):
+        lines.append(f"Telefon: {order['customer_phone']}")
+    if order.get('customer_email'):
+        lines.append(f"E-posta: {order['customer_email']}")
+    if order.get('customer_address'):
+        lines.append(f"Adres: {order['customer_address']}")
+    if order.get('tax_office') or order.get('tax_number'):
+        tax_info = []
+        if order.get('tax_office'):
+            tax_info.append(f"V.D: {order['tax_office']}")
+        if order.get('tax_number'):
+            tax_info.append(f"V.No: {order['tax_number']}")
+        lines.append(" / ".join(tax_info))
+    return lines
+
+def first_page_content_top(customer_lines: List[str]) -> float:
+    """Where the items table starts on the first page, below everything draw_first_page draws"""
+    _, height = A4
+    y_position = height - 8.5*cm
+    if customer_lines:
+        y_position -= 1*cm + 0.45*cm * len(customer_lines)
+    return y_position - 1.5*cm
+
+def draw_first_page(pdf: canvas.Canvas, order: Dict[str, Any], template: SimpleNamespace,
+                    logo: Optional[Dict[str, str]], customer_lines: List[str]):
+    """Logo, company, title, document and customer info of the first page"""
+    width, height = A4
+    pdf.saveState()
+    
+    # ==================== HEADER SECTION ====================
+    y_position = height - 1.5*cm
+    
+    # Draw Logo if exists
+    logo_height = 0
+    if logo:
+        try:
+            logo_reader = logo_image(logo)
+            logo_width_px = 120
+            logo_height_px = 60
+            pdf.drawImage(logo_reader, 2*cm, y_position - logo_height_px + 15, width=logo_width_px, height=logo_height_px, preserveAspectRatio=True, mask='auto')
+            logo_height = logo_height_px
+        except Exception as e:
+            logger.error(f"Logo render error: {e}")
+    
+    # Company Info (right side - top)
+    pdf.setFont(FONT_NAME_BOLD, 14)
+    company_x = width - 2*cm
+    y_company = height - 1.5*cm
+    
+    if template.company_name:
+        pdf.drawRightString(company_x, y_company, template.company_name)
+        y_company -= 0.5*cm
+    
+    pdf.setFont(FONT_NAME, 9)
+    if template.company_address:
+        # Split address if too long
+        address_lines = template.company_address.split('\n') if '\n' in template.company_address else [template.company_address]
+        for line in address_lines:
+            pdf.drawRightString(company_x, y_company, line.strip())
+            y_company -= 0.4*cm
+    
+    if template.company_phone:
+        pdf.drawRightString(company_x, y_company, f"Tel: {template.company_phone}")
+        y_company -= 0.4*cm
+    
+    if template.company_email:
+        pdf.drawRightString(company_x, y_company, f"E-posta: {template.company_email}")
+        y_company -= 0.4*cm
+    
+    if template.company_website:
+        pdf.drawRightString(company_x, y_company, template.company_website)
+        y_company -= 0.4*cm
+    
+    if template.company_tax_office and template.company_tax_number:
+        pdf.drawRightString(company_x, y_company, f"V.D: {template.company_tax_office} / {template.company_tax_number}")
+        y_company -= 0.4*cm
+    
+    # ==================== TITLE SECTION ====================
+    y_position = height - 4.5*cm
+    
+    # Title with underline
+    pdf.setFont(FONT_NAME_BOLD, 18)
+    title_width = pdf.stringWidth(template.title, FONT_NAME_BOLD, 18)
+    title_x = (width - title_width) / 2
+    pdf.drawString(title_x, y_position, template.title)
+    
+    # Underline
+    pdf.setStrokeColor(colors.HexColor("#333333"))
+    pdf.setLineWidth(1)
+    pdf.line(title_x - 10, y_position - 5, title_x + title_width + 10, y_position - 5)
+    
+    # ==================== DOCUMENT INFO ====================
+    y_position -= 1.5*cm
+    
+    # Info box background
+    pdf.setFillColor(colors.HexColor("#f8f9fa"))
+    pdf.rect(2*cm, y_position - 1.2*cm, width - 4*cm, 1.5*cm, fill=True, stroke=False)
+    pdf.setFillColor(colors.black)
+    
+    pdf.setFont(FONT_NAME, 10)
+    created_date = datetime.fromisoformat(order['created_at']).strftime('%d.%m.%Y')
+    validity_date = (datetime.fromisoformat(order['created_at']) + timedelta(days=template.validity_days)).strftime('%d.%m.%Y')
+    
+    pdf.drawString(2.5*cm, y_position - 0.3*cm, f"Teklif No: {order['order_number']}")
+    pdf.drawString(2.5*cm, y_position - 0.8*cm, f"Tarih: {created_date}")
+    pdf.drawRightString(width - 2.5*cm, y_position - 0.3*cm, f"Geçerlilik: {template.validity_days} gün")
+    pdf.drawRightString(width - 2.5*cm, y_position - 0.8*cm, f"Son Geçerlilik: {validity_date}")
+    
+    # ==================== CUSTOMER INFO ====================
+    y_position -= 2.5*cm
+    
+    if customer_lines:
+        pdf.setFont(FONT_NAME_BOLD, 11)
+        pdf.drawString(2*cm, y_position, "MÜŞTERİ BİLGİLERİ")
+        y_position -= 0.5*cm
+        
+        pdf.setStrokeColor(colors.HexColor("#dee2e6"))
+        pdf.setLineWidth(0.5)
+        pdf.line(2*cm, y_position, width - 2*cm, y_position)
+        y_position -= 0.5*cm
+        
+        pdf.setFont(FONT_NAME, 10)
+        for line in customer_lines:
+            pdf.drawString(2*cm, y_position, line)
+            y_position -= 0.45*cm
+    
+    # ==================== ITEMS HEADING ====================
+    y_position -= 1*cm
+    
+    pdf.setFont(FONT_NAME_BOLD, 11)
+    pdf.drawString(2*cm, y_position, "ÜRÜN/HİZMET DETAYLARI")
+    pdf.restoreState()
+
+def draw_footer(pdf: canvas.Canvas, template: SimpleNamespace, page_count: int):
+    """Footer of every page"""
+    width, _ = A4
+    pdf.saveState()
+    pdf.setFont(FONT_NAME, 8)
+    pdf.setFillColor(colors.HexColor("#6c757d"))
+    pdf.drawString(2*cm, 1.5*cm, template.footer_text)
+    pdf.drawRightString(width - 2*cm, 1.5*cm, f"Sayfa {pdf.getPageNumber()} / {page_count}")
+    
+    # Footer line
+    pdf.setStrokeColor(colors.HexColor("#dee2e6"))
+    pdf.line(2*cm, 1.8*cm, width - 2*cm, 1.8*cm)
+    pdf.restoreState()
+
+def numbered_canvas(template: SimpleNamespace):
+    """Canvas class that draws the footer once the page count is known.
+
+    Finished pages are held back until save, then each gets its "Sayfa X / Y" footer.
+    """
+    class NumberedCanvas(canvas.Canvas):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._saved_page_states = []
+
+        def showPage(self):
+            self._saved_page_states.append(dict(self.__dict__))
+            self._startPage()
+
+        def save(self):
+            page_count = len(self._saved_page_states)
+            for state in self._saved_page_states:
+                self.__dict__.update(state)
+                draw_footer(self, template, page_count)
+                super().showPage()
+            super().save()
+
+    return NumberedCanvas
+
+def section(title: str, styles: Dict[str, ParagraphStyle]) -> List[Any]:
+    """Bold section title with a rule under it"""
+    return [
+        Spacer(1, 0.5*cm),
+        Paragraph(title, styles['section']),
+        HRFlowable(width="100%", thickness=0.5, color=colors.HexColor("#dee2e6"), spaceBefore=2, spaceAfter=6),
+    ]
+
+def single_line(text: str) -> str:
+    return " ".join(text.split())
+
+def items_table(items: List[Dict[str, Any]], template: SimpleNamespace) -> Tuple[Table, float]:
+    """One table of every item with a header row repeated on each page, and the grand total"""
+    if template.show_prices:
+        headers = ['S.No', 'Ürün/Hizmet Adı', 'Miktar', 'Birim', 'Birim Fiyat', 'Toplam']
+        col_widths = [1*cm, 8*cm, 1.5*cm, 1.5*cm, 2.5*cm, 2.5*cm]
+    else:
+        headers = ['S.No', 'Ürün/Hizmet Adı', 'Miktar', 'Birim', 'Notlar']
+        col_widths = [1*cm, 10*cm, 2*cm, 2*cm, 2*cm]
+    
+    # Single-line string cells of fixed height: splitting the table at each page then needs
+    # no re-measuring of the remaining rows
+    table_data = [headers]
+    grand_total = 0.0
+    for idx, item in enumerate(items, 1):
+        unit_price = item.get('unit_price', 0) or 0
+        quantity = item.get('quantity', 0) or 0
+        total = item.get('total_price', 0) or (quantity * unit_price)
+        grand_total += total
+        
+        if template.show_prices:
+            row = [
+                str(idx),
+                single_line(item['product_name'])[:60],
+                str(quantity),
+                'Adet',
+                f"{unit_price:,.2f} ₺",
+                f"{total:,.2f} ₺"
+            ]
+        else:
+            row = [
+                str(idx),
+                single_line(item['product_name'])[:60],
+                str(quantity),
+                'Adet',
+                single_line(item['notes'])[:20] if item.get('notes') else ''
+            ]
+        table_data.append(row)
+    
+    row_heights = [HEADER_ROW_HEIGHT] + [ITEM_ROW_HEIGHT] * len(items)
+    table = Table(table_data, colWidths=col_widths, rowHeights=row_heights, repeatRows=1, hAlign='LEFT')
+    table.setStyle(TableStyle([
+        # Header style
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#343a40")),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), FONT_NAME_BOLD),
+        ('FONTSIZE', (0, 0), (-1, 0), 9),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+        ('TOPPADDING', (0, 0), (-1, 0), 8),
+        
+        # Body style
+        ('FONTNAME', (0, 1), (-1, -1), FONT_NAME),
+        ('FONTSIZE', (0, 1), (-1, -1), 9),
+        ('ALIGN', (0, 1), (0, -1), 'CENTER'),  # S.No centered
+        ('ALIGN', (2, 1), (2, -1), 'CENTER'),  # Quantity centered
+        ('ALIGN', (3, 1), (3, -1), 'CENTER'),  # Unit centered
+        ('ALIGN', (-2, 1), (-1, -1), 'RIGHT'),  # Prices right aligned
+        ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
+        ('TOPPADDING', (0, 1), (-1, -1), 6),
+        
+        # Grid
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor("#dee2e6")),
+        
+        # Alternating row colors
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor("#f8f9fa")]),
+    ]))
+    return table, grand_total
+
+def render_order_pdf(spec: Dict[str, Any]) -> bytes:
+    """Render the quote PDF described by `spec`.
+
+    The first page carries the fixed header; the items table and the sections after it
+    flow over as many pages as needed, with the table header repeated on each page.
+    """
+    register_fonts()
+    order = spec['order']
+    items = spec['items']
+    template = SimpleNamespace(**spec['template'])
+    bank_accounts = [SimpleNamespace(**ba) for ba in spec['bank_accounts']]
+    customer = customer_lines(order, template)
+    width, height = A4
+    
+    # Create PDF in memory
+    buffer = io.BytesIO()
+    doc = BaseDocTemplate(buffer, pagesize=A4, title=template.title)
+    content_top = first_page_content_top(customer)
+    doc.addPageTemplates([
+        PageTemplate(id='first', frames=[Frame(2*cm, 2.2*cm, width - 4*cm, content_top - 2.2*cm, id='first', **NO_PADDING)],
+                     onPage=lambda pdf, _: draw_first_page(pdf, order, template, spec.get('logo'), customer),
+                     autoNextPageTemplate='later'),
+        PageTemplate(id='later', frames=[Frame(2*cm, 2.2*cm, width - 4*cm, height - 4.2*cm, id='later', **NO_PADDING)]),
+    ])
+    styles = {
+        'section': ParagraphStyle('section', fontName=FONT_NAME_BOLD, fontSize=10, leading=12),
+        'body': ParagraphStyle('body', fontName=FONT_NAME, fontSize=9, leading=12),
+        'bank': ParagraphStyle('bank', fontName=FONT_NAME_BOLD, fontSize=9, leading=12),
+    }
+    
+    # ==================== ITEMS TABLE ====================
+    table, grand_total = items_table(items, template)
+    story: List[Any] = [table]
+    
+    # ==================== TOTALS SECTION ====================
+    if template.show_prices:
+        label, amount = "GENEL TOPLAM:", f"{grand_total:,.2f} ₺"
+        label_width = pdfmetrics.stringWidth(label, FONT_NAME_BOLD, 10) + 0.6*cm
+        amount_width = max(5*cm - label_width, pdfmetrics.stringWidth(amount, FONT_NAME_BOLD, 10) + 0.6*cm)
+        totals = Table([[label, amount]], colWidths=[label_width, amount_width], rowHeights=[1*cm], hAlign='RIGHT')
+        totals.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor("#343a40")),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.white),
+            ('FONTNAME', (0, 0), (-1, -1), FONT_NAME_BOLD),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
+            ('LEFTPADDING', (0, 0), (-1, -1), 0.3*cm),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 0.3*cm),
+        ]))
+        story += [Spacer(1, 0.5*cm), totals]
+    
+    # ==================== TERMS SECTION ====================
+    if template.payment_terms or template.delivery_terms:
+        terms = section("ŞARTLAR VE KOŞULLAR", styles)
+        if template.payment_terms:
+            terms.append(Paragraph(escape(f"Ödeme Koşulları: {template.payment_terms}"), styles['body']))
+        if template.delivery_terms:
+            terms.append(Paragraph(escape(f"Teslimat Koşulları: {template.delivery_terms}"), styles['body']))
+        story.append(KeepTogether(terms))
+    
+    # ==================== BANK ACCOUNTS SECTION ====================
+    if template.show_bank_accounts and bank_accounts:
+        heading = section("BANKA HESAP BİLGİLERİ", styles)
+        for n, ba in enumerate(bank_accounts):
+            lines = [
+                Paragraph(escape(f"{ba.bank_name}"), styles['bank']),
+                Paragraph(escape(f"Hesap Sahibi: {ba.account_holder}"), styles['body']),
+                Paragraph(escape(f"IBAN: {ba.iban}"), styles['body']),
+            ]
+            if ba.branch_code or ba.account_number:
+                extra_info = []
+                if ba.branch_code:
+                    extra_info.append(f"Şube: {ba.branch_code}")
+                if ba.account_number:
+                    extra_info.append(f"Hesap No: {ba.account_number}")
+                lines.append(Paragraph(escape(" / ".join(extra_info)), styles['body']))
+            lines.append(Spacer(1, 0.3*cm))
+            # The heading stays with the first account
+            story.append(KeepTogether(heading + lines if n == 0 else lines))
+    
+    # ==================== NOTES SECTION ====================
+    if template.notes:
+        notes = [Paragraph(escape(line) or '&nbsp;', styles['body']) for line in template.notes.split('\n')]
+        story.append(KeepTogether(section("NOTLAR", styles) + notes[:1]))
+        story += notes[1:]
+    
+    doc.build(story, canvasmaker=numbered_canvas(template))
+    return buffer.getvalue()
@@ -1,39 +1,44 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Form, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Form, Query, Request, Response, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr, model_validator
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable, Iterator, AsyncIterator, Tuple, Callable, Awaitable, Hashable
+from urllib.parse import quote
 import uuid
+import asyncio
+import re
+import time
+import shutil
+import socket
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
 import bcrypt
 import jwt
+from PIL import Image, ImageOps, UnidentifiedImageError
 import csv
 import io
+import itertools
 import base64
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import cm
-from reportlab.pdfgen import canvas
-from reportlab.lib import colors
-from reportlab.platypus import Table, TableStyle
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from fastapi.responses import StreamingResponse
-
-# Register UTF-8 font for Turkish characters
-try:
-    pdfmetrics.registerFont(TTFont('DejaVuSans', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'))
-    pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'))
-    FONT_NAME = 'DejaVuSans'
-    FONT_NAME_BOLD = 'DejaVuSans-Bold'
-except:
-    # Fallback to Helvetica if DejaVu not available
-    FONT_NAME = 'Helvetica'
-    FONT_NAME_BOLD = 'Helvetica-Bold'
+import binascii
+import hashlib
+import json
+import multiprocessing
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from pdf_renderer import RENDERER_VERSION as PDF_RENDERER_VERSION, init_worker as init_pdf_worker, render_order_pdf
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -48,6 +53,38 @@ SECRET_KEY = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production'
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
+# Password hashing (bcrypt ~250ms CPU per call, kept off the event loop)
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', '2'))
+
+# Failed login throttling
+LOGIN_THROTTLE_WINDOW_SECONDS = int(os.environ.get('LOGIN_THROTTLE_WINDOW_SECONDS', '300'))
+LOGIN_MAX_FAILURES_PER_USER = int(os.environ.get('LOGIN_MAX_FAILURES_PER_USER', '5'))
+LOGIN_MAX_FAILURES_PER_IP = int(os.environ.get('LOGIN_MAX_FAILURES_PER_IP', '20'))
+LOGIN_THROTTLE_MAX_KEYS = int(os.environ.get('LOGIN_THROTTLE_MAX_KEYS', '100000'))
+# Proxies in front of the app that append to X-Forwarded-For (0 = use the socket peer address)
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', '1'))
+
+# Authenticated principal cache (bounds how long a deactivated user can keep using a token)
+AUTH_CACHE_TTL_SECONDS = float(os.environ.get('AUTH_CACHE_TTL_SECONDS', '30'))
+AUTH_CACHE_MAX_ENTRIES = int(os.environ.get('AUTH_CACHE_MAX_ENTRIES', '2048'))
+
+# PDF rendering (reportlab is CPU bound, so it runs in worker processes)
+PDF_RENDER_WORKERS = int(os.environ.get('PDF_RENDER_WORKERS', str(min(2, os.cpu_count() or 1))))
+PDF_RENDER_QUEUE_SIZE = int(os.environ.get('PDF_RENDER_QUEUE_SIZE', '8'))
+PDF_CACHE_DIR = Path(os.environ.get('PDF_CACHE_DIR', str(ROOT_DIR / 'uploads' / 'pdf_cache')))
+PDF_CACHE_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_BYTES', str(200 * 1024 * 1024)))
+PDF_BATCH_MAX_ORDERS = int(os.environ.get('PDF_BATCH_MAX_ORDERS', '500'))
+# How often a worker checks whether another worker changed the PDF template or bank accounts
+PDF_SETTINGS_SYNC_SECONDS = float(os.environ.get('PDF_SETTINGS_SYNC_SECONDS', '15'))
+
+# Presence tracking (last_active_at is flushed in bulk instead of written per request)
+PRESENCE_FLUSH_SECONDS = float(os.environ.get('PRESENCE_FLUSH_SECONDS', '30'))
+PRESENCE_MIN_DELTA_SECONDS = 60
+ONLINE_WINDOW_MINUTES = 5
+
+# Polled read endpoints (dashboard, online stats) share results for a few seconds
+READ_CACHE_TTL_SECONDS = float(os.environ.get('READ_CACHE_TTL_SECONDS', '3'))
+
 # Create the main app
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
@@ -106,6 +143,18 @@ class Product(BaseModel):
     supplier: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class ProductSummary(BaseModel):
+    """Ürün seçici / liste satırı"""
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    web_service_code: Optional[str] = None
+    product_name: str
+    barcode: Optional[str] = None
+    stock: int = 0
+    stock_unit: Optional[str] = None
+    is_active: bool = True
+    brand: Optional[str] = None
+
 class ProductCreate(BaseModel):
     product_id: Optional[int] = None
     web_service_code: Optional[str] = None
@@ -202,17 +251,44 @@ class Order(BaseModel):
     bank_transfer: bool = False  # Banka havalesi ile ödendi
     online_payment_ref: Optional[str] = None  # Site ödemesi işlem numarası
     whatsapp_content: Optional[str] = None
-    attachments: List[Dict[str, Any]] = []  # file URLs or base64
+    attachments: List[Dict[str, Any]] = []  # metadata; bytes in the attachment blob store
     notes: Optional[str] = None
     history: List[OrderHistoryEntry] = []  # Sipariş geçmişi
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     payment_start_at: Optional[datetime] = None  # Ödeme vadesi başlangıç zamanı
     payment_term_days: Optional[int] = None  # Ödeme vadesi (gün)
+    payment_due_at: Optional[datetime] = None  # Vade sonu; sunucu hesaplar
     # Sorumlu kullanıcı atama
     assigned_user_id: Optional[str] = None
     assigned_user_name: Optional[str] = None
 
+class OrderSummary(BaseModel):
+    """Sipariş listesi satırı: geçmiş, ekler ve WhatsApp içeriği olmadan"""
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    order_number: int
+    order_code: str = ""
+    order_type: str
+    customer_name: Optional[str] = None
+    customer_phone: Optional[str] = None
+    company_name: Optional[str] = None
+    created_by: Optional[str] = None
+    created_by_name: Optional[str] = None
+    delivery_method: Optional[str] = None
+    invoice_status: Optional[str] = None
+    waybill_status: Optional[str] = None
+    cargo_status: Optional[str] = None
+    cargo_barcode_status: Optional[str] = None
+    general_status: Optional[str] = None
+    payment_start_at: Optional[datetime] = None
+    payment_term_days: Optional[int] = None
+    payment_due_at: Optional[datetime] = None
+    assigned_user_id: Optional[str] = None
+    assigned_user_name: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
 
 class Notification(BaseModel):
 
@@ -353,6 +429,18 @@ class OrderItem(BaseModel):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class OrderItemSummary(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    order_id: str
+    product_id: Optional[str] = None
+    product_name: str
+    quantity: int
+    unit_price: float = 0.0
+    total_price: float = 0.0
+    item_type: Optional[str] = None
+    item_status: Optional[str] = None
+
 class OrderItemCreate(BaseModel):
     order_id: str
     product_id: Optional[str] = None
@@ -424,6 +512,7 @@ class PDFTemplateSettings(BaseModel):
     company_tax_office: Optional[str] = None
     company_website: Optional[str] = None
     logo_base64: Optional[str] = None  # Base64 encoded logo image
+    logo_sha256: Optional[str] = None  # digest of the decoded logo
     header_color: str = "#000000"
     show_prices: bool = True
     show_customer_info: bool = True
@@ -456,6 +545,296 @@ class PDFTemplateUpdate(BaseModel):
     payment_terms: Optional[str] = None
     delivery_terms: Optional[str] = None
 
+# ==================== DATABASE INDEXES ====================
+
+# CSV imports upsert on the code, so it must be unique; legacy products may have none
+PRODUCT_CODE_INDEX = IndexModel(
+    [("web_service_code", ASCENDING)],
+    unique=True,
+    partialFilterExpression={"web_service_code": {"$type": "string", "$gt": ""}},
+)
+
+# Every filter/sort the API runs is backed by an index declared here.
+# Applied idempotently at startup and via `python server.py ensure-indexes`.
+INDEX_REGISTRY: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("username", ASCENDING)], unique=True),
+        IndexModel([("is_active", ASCENDING), ("last_active_at", DESCENDING)]),
+    ],
+    "orders": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("order_number", DESCENDING)], unique=True),
+        # Legacy orders may have an empty order_code
+        IndexModel(
+            [("order_code", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"order_code": {"$type": "string", "$gt": ""}},
+        ),
+        # get_orders filters, all sorted by order_number desc
+        IndexModel([("general_status", ASCENDING), ("order_number", DESCENDING)]),
+        IndexModel([("order_type", ASCENDING), ("order_number", DESCENDING)]),
+        IndexModel([("invoice_status", ASCENDING), ("order_number", DESCENDING)]),
+        IndexModel([("waybill_status", ASCENDING), ("order_number", DESCENDING)]),
+        IndexModel([("cargo_status", ASCENDING), ("order_number", DESCENDING)]),
+        IndexModel([("cargo_barcode_status", ASCENDING), ("order_number", DESCENDING)]),
+        IndexModel([("assigned_user_id", ASCENDING), ("order_number", DESCENDING)]),
+        # get_dashboard_stats counters
+        IndexModel([("delivery_method", ASCENDING), ("cargo_barcode_status", ASCENDING), ("general_status", ASCENDING)]),
+        # overdue count and GET /orders/overdue
+        IndexModel([("order_type", ASCENDING), ("payment_due_at", ASCENDING), ("id", ASCENDING)]),
+    ],
+    "order_items": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("order_id", ASCENDING)]),
+        IndexModel([("item_status", ASCENDING), ("order_id", ASCENDING)]),
+    ],
+    "order_history": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("order_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "notifications": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "products": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        PRODUCT_CODE_INDEX,
+        IndexModel([("barcode", ASCENDING)]),
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)]),
+    ],
+    "jobs": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("status", ASCENDING), ("heartbeat_at", ASCENDING)]),
+    ],
+    "order_types": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("code", ASCENDING)], unique=True),
+    ],
+    "bank_accounts": [
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+}
+
+async def ensure_indexes():
+    """Create missing indexes; existing ones with the same spec are left untouched"""
+    for collection_name, indexes in INDEX_REGISTRY.items():
+        for index in indexes:
+            try:
+                # One index per command so a single conflict doesn't block the rest
+                await db[collection_name].create_indexes([index])
+            except OperationFailure as e:
+                logger.error(f"Index {collection_name}.{index.document['name']} could not be created: {e}")
+    logger.info("Database indexes ensured")
+
+# ==================== MIGRATIONS ====================
+
+# One-time data migrations, recorded in the `migrations` collection once applied.
+# Run at startup and via `python server.py migrate`; each must be idempotent since
+# several workers may start at the same time.
+MIGRATIONS: List[tuple] = []
+
+def migration(name: str):
+    def register(fn):
+        MIGRATIONS.append((name, fn))
+        return fn
+    return register
+
+async def run_migrations():
+    for name, fn in MIGRATIONS:
+        if await db.migrations.find_one({"_id": name}):
+            continue
+        logger.info(f"Running migration {name}")
+        await fn()
+        await db.migrations.update_one(
+            {"_id": name},
+            {"$set": {"applied_at": datetime.now(timezone.utc).isoformat()}},
+            upsert=True
+        )
+
+# ==================== SEQUENCES ====================
+
+async def next_sequence(name: str) -> int:
+    """Atomically increment and return counter `name` in a single round trip"""
+    try:
+        doc = await db.counters.find_one_and_update(
+            {"_id": name},
+            {"$inc": {"seq": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Two first-time upserts raced; the counter exists now
+        doc = await db.counters.find_one_and_update(
+            {"_id": name},
+            {"$inc": {"seq": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+    return doc["seq"]
+
+@migration("backfill_sequences")
+async def backfill_sequences():
+    """Seed counters from the order numbers/codes and KodsuzA codes already in use"""
+    ops = []
+
+    last_order = await db.orders.find_one({}, {"_id": 0, "order_number": 1}, sort=[("order_number", -1)])
+    if last_order and last_order.get("order_number"):
+        ops.append(UpdateOne({"_id": "order_number"}, {"$max": {"seq": int(last_order["order_number"])}}, upsert=True))
+
+    # order_code = prefix + ggaayy + 6 digit sequence; highest sequence per prefix+day
+    code_len = {"$strLenCP": "$order_code"}
+    pipeline = [
+        {"$match": {"order_code": {"$regex": r"\d{12}$"}}},
+        {"$project": {
+            "key": {"$substrCP": ["$order_code", 0, {"$subtract": [code_len, 6]}]},
+            "num": {"$toInt": {"$substrCP": ["$order_code", {"$subtract": [code_len, 6]}, 6]}},
+        }},
+        {"$group": {"_id": "$key", "max": {"$max": "$num"}}},
+    ]
+    async for row in db.orders.aggregate(pipeline):
+        ops.append(UpdateOne({"_id": f"order_code:{row['_id']}"}, {"$max": {"seq": row["max"]}}, upsert=True))
+
+    last_kodsuz = await db.products.find_one(
+        {"web_service_code": {"$regex": "^KodsuzA"}},
+        {"_id": 0, "web_service_code": 1},
+        sort=[("web_service_code", -1)]
+    )
+    if last_kodsuz:
+        try:
+            number = int(last_kodsuz["web_service_code"].replace("KodsuzA", ""))
+            ops.append(UpdateOne({"_id": "kodsuz:KodsuzA"}, {"$max": {"seq": number}}, upsert=True))
+        except ValueError:
+            pass
+
+    if ops:
+        await db.counters.bulk_write(ops, ordered=False)
+    logger.info(f"Sequences backfilled ({len(ops)} counters)")
+
+@migration("unique_product_codes")
+async def unique_product_codes():
+    """Resolve duplicate web_service_codes, then swap the plain code index for the unique one.
+
+    The oldest product keeps the code; later duplicates are deactivated and renamed to
+    <code>-DUP<n> so nothing is deleted and an admin can merge them by hand.
+    """
+    pipeline = [
+        {"$match": {"web_service_code": {"$type": "string", "$gt": ""}}},
+        {"$sort": {"created_at": 1, "id": 1}},
+        {"$group": {"_id": "$web_service_code", "ids": {"$push": "$id"}}},
+        {"$match": {"ids.1": {"$exists": True}}},
+    ]
+    ops = []
+    async for row in db.products.aggregate(pipeline, allowDiskUse=True):
+        for n, product_id in enumerate(row["ids"][1:], 1):
+            ops.append(UpdateOne(
+                {"id": product_id},
+                {"$set": {"web_service_code": f"{row['_id']}-DUP{n}", "is_active": False},
+                 "$unset": {"content_hash": ""}}
+            ))
+    if ops:
+        await db.products.bulk_write(ops, ordered=False)
+        await mark_catalog_changed()
+        logger.warning(f"Renamed and deactivated {len(ops)} products with duplicate web_service_code")
+
+    # ensure_indexes can't replace an existing non-unique index of the same name
+    name = PRODUCT_CODE_INDEX.document['name']
+    existing = (await db.products.index_information()).get(name)
+    if existing and not existing.get('unique'):
+        await db.products.drop_index(name)
+    await db.products.create_indexes([PRODUCT_CODE_INDEX])
+
+# ==================== SINGLE ROUND-TRIP UPDATES ====================
+
+async def update_and_fetch(collection, query: Dict[str, Any], update: Dict[str, Any],
+                           projection: Optional[Dict[str, int]] = None,
+                           return_document=ReturnDocument.AFTER, upsert: bool = False) -> Optional[Dict[str, Any]]:
+    """find → update → find again in one round trip.
+
+    `query` may carry preconditions on the current state; when the document is missing or
+    no longer matches, nothing is written and None is returned. ReturnDocument.BEFORE gives
+    the pre-update state for callers that diff old against new values.
+    """
+    return await collection.find_one_and_update(
+        query,
+        update,
+        projection={"_id": 0, **(projection or {})},
+        return_document=return_document,
+        upsert=upsert
+    )
+
+# ==================== PAGINATION ====================
+
+# List endpoints page with opaque keyset cursors: the token holds the sort key of the last
+# row, so every page is a bounded index range scan however deep it is. The next token is
+# returned in the X-Next-Cursor header (absent on the last page); `skip` keeps working for
+# older clients but is ignored once a cursor is passed.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(doc: Dict[str, Any], sort: List[Tuple[str, int]]) -> str:
+    # Some collections keep BSON dates (notifications), others isoformat strings
+    values = [doc.get(field) for field, _ in sort]
+    values = [{"$date": v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    payload = json.dumps(values, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str, sort: List[Tuple[str, int]]) -> List[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if isinstance(values, list):
+            values = [datetime.fromisoformat(v["$date"]) if isinstance(v, dict) else v for v in values]
+    except (ValueError, KeyError, TypeError):
+        values = None
+    if not isinstance(values, list) or len(values) != len(sort):
+        raise HTTPException(status_code=400, detail="Geçersiz sayfa imleci (cursor)")
+    return values
+
+def keyset_query(query: Dict[str, Any], sort: List[Tuple[str, int]], cursor: str) -> Dict[str, Any]:
+    """Narrow `query` to the rows that come after `cursor` in `sort` order"""
+    values = decode_cursor(cursor, sort)
+    branches = []
+    for i, (field, direction) in enumerate(sort):
+        branch = {f: values[j] for j, (f, _) in enumerate(sort[:i])}
+        branch[field] = {"$lt" if direction == DESCENDING else "$gt": values[i]}
+        branches.append(branch)
+    after = branches[0] if len(branches) == 1 else {"$or": branches}
+    return {"$and": [query, after]} if query else after
+
+def set_next_cursor(response: Response, docs: List[Dict[str, Any]], limit: int, sort: List[Tuple[str, int]]) -> Optional[str]:
+    """Set the next-page header on `response`; the token is also returned for endpoints
+    that build their own Response (which would drop headers set on the injected one)"""
+    if limit > 0 and len(docs) >= limit:
+        next_cursor = encode_cursor(docs[-1], sort)
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return next_cursor
+    return None
+
+# ==================== SPARSE FIELDSETS ====================
+
+# List endpoints take `fields=summary` (a predefined slim model) or `fields=a,b,c`.
+# The selection is pushed down as a Mongo projection and the rows are returned as-is,
+# skipping validation of the full model and its nested data.
+SUMMARY_FIELDSET = "summary"
+
+def fieldset_projection(fields: Optional[str], model, summary_model, always: Tuple[str, ...] = ("id",)) -> Optional[Dict[str, int]]:
+    """Mongo projection for `fields`, None for the full document"""
+    if not fields:
+        return None
+    if fields == SUMMARY_FIELDSET:
+        names = list(summary_model.model_fields)
+    else:
+        names = [name.strip() for name in fields.split(',') if name.strip()]
+        unknown = [name for name in names if name not in model.model_fields]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Bilinmeyen alan(lar): {', '.join(unknown)}")
+    # Sort keys stay in so cursors can still be built from the last row
+    return {"_id": 0, **{name: 1 for name in (*always, *names)}}
+
+def fieldset_response(docs: List[Dict[str, Any]], fields: str, summary_model, next_cursor: Optional[str] = None) -> JSONResponse:
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+    if fields == SUMMARY_FIELDSET:
+        return JSONResponse([summary_model(**doc).model_dump(mode="json") for doc in docs], headers=headers)
+    return JSONResponse(jsonable_encoder(docs), headers=headers)
+
 # ==================== AUTH UTILITIES ====================
 
 def hash_password(password: str) -> str:
@@ -464,12 +843,243 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
+# bcrypt releases the GIL, so a small dedicated thread pool keeps hashing off the
+# event loop; its size caps how many CPU cores login traffic can consume.
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_CONCURRENCY, thread_name_prefix="bcrypt")
+
+async def hash_password_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, hash_password, password)
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, verify_password, password, hashed)
+
+class LoginThrottle:
+    """Sliding-window counter of failed logins per username and per client IP.
+
+    Expired keys are pruned once per window and at most `max_keys` are tracked, so
+    spraying distinct usernames or addresses can't grow memory without bound.
+    """
+
+    def __init__(self, window_seconds: int, max_per_user: int, max_per_ip: int, max_keys: int = 100000):
+        self.window_seconds = window_seconds
+        self.max_per_user = max_per_user
+        self.max_per_ip = max_per_ip
+        self.max_keys = max_keys
+        self._failures: Dict[str, deque] = {}
+        self._pruned_at = time.monotonic()
+
+    def _prune(self, now: float):
+        cutoff = now - self.window_seconds
+        for key in [key for key, attempts in self._failures.items() if attempts[-1] <= cutoff]:
+            del self._failures[key]
+        self._pruned_at = now
+
+    def _recent(self, key: str, now: float) -> deque:
+        attempts = self._failures.get(key)
+        if attempts is None:
+            return deque()
+        while attempts and attempts[0] <= now - self.window_seconds:
+            attempts.popleft()
+        if not attempts:
+            del self._failures[key]
+        return attempts
+
+    def retry_after(self, username: str, ip: str) -> int:
+        """Seconds until another attempt is allowed, 0 if allowed now"""
+        now = time.monotonic()
+        wait = 0.0
+        for key, limit in ((f"user:{username.lower()}", self.max_per_user), (f"ip:{ip}", self.max_per_ip)):
+            attempts = self._recent(key, now)
+            if len(attempts) >= limit:
+                wait = max(wait, attempts[0] + self.window_seconds - now)
+        return int(wait) + 1 if wait > 0 else 0
+
+    def record_failure(self, username: str, ip: str):
+        now = time.monotonic()
+        if now - self._pruned_at >= self.window_seconds:
+            self._prune(now)
+        for key in (f"user:{username.lower()}", f"ip:{ip}"):
+            self._failures.setdefault(key, deque()).append(now)
+        # Still too many live keys: forget the ones first seen longest ago
+        while len(self._failures) > self.max_keys:
+            del self._failures[next(iter(self._failures))]
+
+    def reset(self, username: str):
+        self._failures.pop(f"user:{username.lower()}", None)
+
+login_throttle = LoginThrottle(LOGIN_THROTTLE_WINDOW_SECONDS, LOGIN_MAX_FAILURES_PER_USER, LOGIN_MAX_FAILURES_PER_IP,
+                               LOGIN_THROTTLE_MAX_KEYS)
+
+def get_client_ip(request: Request) -> str:
+    # Clients can send any X-Forwarded-For; only the entries our own proxies appended
+    # (the right-most TRUSTED_PROXY_HOPS) can be trusted
+    forwarded = request.headers.get('x-forwarded-for')
+    if forwarded and TRUSTED_PROXY_HOPS > 0:
+        entries = [entry.strip() for entry in forwarded.split(',') if entry.strip()]
+        if entries:
+            return entries[-min(TRUSTED_PROXY_HOPS, len(entries))]
+    return request.client.host if request.client else "unknown"
+
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+class PrincipalCache:
+    """In-process TTL/LRU cache of authenticated users keyed by (user id, token)"""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id: str, token: str) -> Optional[User]:
+        key = (user_id, token)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, user_id: str, token: str, user: User):
+        self._entries[(user_id, token)] = (time.monotonic() + self.ttl_seconds, user)
+        self._entries.move_to_end((user_id, token))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: str):
+        """Drop every cached token of a user (after update, deactivation or delete)"""
+        for key in [k for k in self._entries if k[0] == user_id]:
+            del self._entries[key]
+        self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+principal_cache = PrincipalCache(AUTH_CACHE_TTL_SECONDS, AUTH_CACHE_MAX_ENTRIES)
+
+class PresenceTracker:
+    """Records user activity in memory and flushes last_active_at with one bulk_write per interval.
+
+    Every flush also reloads the recently active users from Mongo, which contains what all
+    uvicorn workers have flushed; online stats merge that snapshot with local activity.
+    """
+
+    def __init__(self, flush_seconds: float, min_delta_seconds: float):
+        self.flush_seconds = flush_seconds
+        self.min_delta_seconds = min_delta_seconds
+        self._seen: Dict[str, datetime] = {}      # activity observed by this worker
+        self._flushed: Dict[str, datetime] = {}   # last value this worker wrote to Mongo
+        self._snapshot: Dict[str, datetime] = {}  # recently active users across all workers
+        self._total_active = 0
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.writes = 0
+
+    def touch(self, user_id: str):
+        self._seen[user_id] = datetime.now(timezone.utc)
+
+    def forget(self, user_id: str):
+        self._seen.pop(user_id, None)
+        self._flushed.pop(user_id, None)
+        self._snapshot.pop(user_id, None)
+
+    async def flush(self):
+        cutoff = datetime.now(timezone.utc) - timedelta(minutes=ONLINE_WINDOW_MINUTES)
+        ops = []
+        pending = {}
+        for user_id, seen in self._seen.items():
+            last = self._flushed.get(user_id)
+            # Activity leaving the online window is written even within min_delta, so the
+            # final timestamp is persisted and the entry can be evicted below
+            if (last is None or (seen - last).total_seconds() >= self.min_delta_seconds
+                    or (seen < cutoff and seen != last)):
+                # $max keeps the newest timestamp when several workers flush the same user
+                ops.append(UpdateOne({"id": user_id}, {"$max": {"last_active_at": seen.isoformat()}}))
+                pending[user_id] = seen
+        if ops:
+            await db.users.bulk_write(ops, ordered=False)
+            self._flushed.update(pending)
+            self.writes += len(ops)
+        self.flushes += 1
+
+        # Forget activity that has left the online window and is already persisted
+        for user_id in [u for u, seen in self._seen.items() if seen < cutoff and self._flushed.get(u) == seen]:
+            del self._seen[user_id]
+            del self._flushed[user_id]
+
+    async def refresh(self):
+        """Reload the flushed state of all workers"""
+        window_start = datetime.now(timezone.utc) - timedelta(minutes=ONLINE_WINDOW_MINUTES)
+        self._total_active = await db.users.count_documents({"is_active": True})
+        cursor = db.users.find(
+            {"is_active": True, "last_active_at": {"$gte": window_start.isoformat()}},
+            {"_id": 0, "id": 1, "last_active_at": 1}
+        )
+        snapshot = {}
+        for doc in await cursor.to_list(1000):
+            last_active = doc.get("last_active_at")
+            if isinstance(last_active, str):
+                last_active = datetime.fromisoformat(last_active)
+            if last_active is not None and last_active.tzinfo is None:
+                last_active = last_active.replace(tzinfo=timezone.utc)
+            snapshot[doc["id"]] = last_active
+        self._snapshot = snapshot
+
+    def online_stats(self) -> Dict[str, int]:
+        window_start = datetime.now(timezone.utc) - timedelta(minutes=ONLINE_WINDOW_MINUTES)
+        online = {u for u, seen in self._snapshot.items() if seen and seen >= window_start}
+        online.update(u for u, seen in self._seen.items() if seen >= window_start)
+        total = max(self._total_active, len(online))
+        return {"online": len(online), "total": total}
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Presence flush error: {e}")
+
+    async def start(self):
+        await self.refresh()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tracked_users": len(self._seen),
+            "flushes": self.flushes,
+            "writes": self.writes,
+            "flush_seconds": self.flush_seconds,
+        }
+
+presence_tracker = PresenceTracker(PRESENCE_FLUSH_SECONDS, PRESENCE_MIN_DELTA_SECONDS)
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
     try:
         token = credentials.credentials
@@ -482,18 +1092,21 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except jwt.JWTError:
         raise HTTPException(status_code=401, detail="Could not validate credentials")
     
-    user_doc = await db.users.find_one({"id": user_id}, {"_id": 0})
-    if user_doc is None:
-        raise HTTPException(status_code=401, detail="User not found")
-    # Kullanıcının son aktif zamanını güncelle
-    await db.users.update_one(
-        {"id": user_doc["id"]},
-        {"$set": {"last_active_at": datetime.now(timezone.utc).isoformat()}},
-    )
+    user = principal_cache.get(user_id, token)
+    if user is None:
+        user_doc = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+        if user_doc is None:
+            raise HTTPException(status_code=401, detail="User not found")
+        user = User(**user_doc)
+        principal_cache.put(user_id, token, user)
 
+    if not user.is_active:
+        raise HTTPException(status_code=403, detail="User account is inactive")
 
+    # Kullanıcının son aktif zamanı bellekte tutulur, toplu olarak yazılır
+    presence_tracker.touch(user.id)
     
-    return User(**user_doc)
+    return user
 
 # ==================== AUTH ENDPOINTS ====================
 
@@ -505,7 +1118,7 @@ async def register(user_data: UserCreate):
         raise HTTPException(status_code=400, detail="Username already exists")
     
     # Hash password
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await hash_password_async(user_data.password)
     
     # Create user
     user = User(
@@ -519,14 +1132,29 @@ async def register(user_data: UserCreate):
     user_doc['password'] = hashed_password
     user_doc['created_at'] = user_doc['created_at'].isoformat()
     
-    await db.users.insert_one(user_doc)
+    try:
+        await db.users.insert_one(user_doc)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration of the same name
+        raise HTTPException(status_code=400, detail="Username already exists")
     return user
 
 @api_router.post("/auth/login", response_model=Token)
-async def login(credentials: UserLogin):
+async def login(credentials: UserLogin, request: Request):
+    client_ip = get_client_ip(request)
+    retry_after = login_throttle.retry_after(credentials.username, client_ip)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Çok fazla başarısız giriş denemesi. Lütfen daha sonra tekrar deneyin.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
     user_doc = await db.users.find_one({"username": credentials.username}, {"_id": 0})
-    if not user_doc or not verify_password(credentials.password, user_doc.get('password', '')):
+    if not user_doc or not await verify_password_async(credentials.password, user_doc.get('password', '')):
+        login_throttle.record_failure(credentials.username, client_ip)
         raise HTTPException(status_code=401, detail="Invalid username or password")
+    login_throttle.reset(credentials.username)
     
     if not user_doc.get('is_active', False):
         raise HTTPException(status_code=403, detail="User account is inactive")
@@ -541,25 +1169,10 @@ async def login(credentials: UserLogin):
 
 @api_router.get("/users/online-stats")
 async def get_online_stats(current_user: User = Depends(get_current_user)):
-    # Son 5 dakikada aktif olanlar online kabul edilir
-    now = datetime.now(timezone.utc)
-    five_minutes_ago = now - timedelta(minutes=5)
-
-    # Toplam aktif kullanıcı sayısı
-    total_count = await db.users.count_documents({"is_active": True})
-
-    # last_active_at alanı son 5 dakikada olan kullanıcılar
-    cursor = db.users.find(
-        {
-            "is_active": True,
-            "last_active_at": {"$gte": five_minutes_ago.isoformat()}
-        },
-        {"_id": 0, "id": 1}
-    )
-    online_users = await cursor.to_list(1000)
-    online_count = len(online_users)
-
-    return {"online": online_count, "total": total_count}
+    # Son 5 dakikada aktif olanlar online kabul edilir (bellekteki presence verisinden)
+    async def compute():
+        return presence_tracker.online_stats()
+    return await read_cache.get(("online_stats",), compute)
 
 
 @api_router.get("/auth/me", response_model=User)
@@ -584,10 +1197,6 @@ async def update_user(user_id: str, user_data: UserCreate, current_user: User =
     if current_user.role != UserRole.ADMIN:
         raise HTTPException(status_code=403, detail="Only admin can update users")
     
-    existing = await db.users.find_one({"id": user_id}, {"_id": 0})
-    if not existing:
-        raise HTTPException(status_code=404, detail="User not found")
-    
     update_data = {
         "username": user_data.username,
         "email": user_data.email,
@@ -597,11 +1206,17 @@ async def update_user(user_id: str, user_data: UserCreate, current_user: User =
     
     # Update password if provided
     if user_data.password:
-        update_data['password'] = hash_password(user_data.password)
+        update_data['password'] = await hash_password_async(user_data.password)
     
-    await db.users.update_one({"id": user_id}, {"$set": update_data})
+    # The unique username index rejects a rename to a taken name
+    try:
+        updated = await update_and_fetch(db.users, {"id": user_id}, {"$set": update_data}, {"password": 0})
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Username already exists")
+    if not updated:
+        raise HTTPException(status_code=404, detail="User not found")
+    principal_cache.invalidate_user(user_id)
     
-    updated = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
     if isinstance(updated['created_at'], str):
         updated['created_at'] = datetime.fromisoformat(updated['created_at'])
     return User(**updated)
@@ -617,6 +1232,9 @@ async def toggle_user_active(user_id: str, current_user: User = Depends(get_curr
     
     new_status = not existing.get('is_active', True)
     await db.users.update_one({"id": user_id}, {"$set": {"is_active": new_status}})
+    principal_cache.invalidate_user(user_id)
+    if not new_status:
+        presence_tracker.forget(user_id)
     
     return {"message": f"User {'activated' if new_status else 'deactivated'}", "is_active": new_status}
 
@@ -631,9 +1249,387 @@ async def delete_user(user_id: str, current_user: User = Depends(get_current_use
     result = await db.users.delete_one({"id": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    principal_cache.invalidate_user(user_id)
+    presence_tracker.forget(user_id)
     
     return {"message": "User deleted successfully"}
 
+# ==================== PRODUCT SEARCH INDEX ====================
+
+# Fields matched by product search; the first three are matched exactly as codes
+PRODUCT_SEARCH_FIELDS = ['web_service_code', 'barcode', 'supplier_product_code', 'product_name', 'brand']
+PRODUCT_CODE_FIELD_COUNT = 3
+# Shorter queries have no usable n-gram and go to the indexed code prefix lookup instead
+PRODUCT_SEARCH_MIN_CHARS = 2
+CATALOG_SYNC_SECONDS = float(os.environ.get('CATALOG_SYNC_SECONDS', '15'))
+SEARCH_CACHE_MAX_BYTES = int(os.environ.get('SEARCH_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+SEARCH_CACHE_MAX_CANDIDATES = 5000
+
+_TURKISH_FOLD = str.maketrans({
+    "İ": "i", "I": "i", "ı": "i",
+    "Ş": "s", "ş": "s",
+    "Ğ": "g", "ğ": "g",
+    "Ü": "u", "ü": "u",
+    "Ö": "o", "ö": "o",
+    "Ç": "c", "ç": "c",
+})
+
+def turkish_fold(text: Optional[str]) -> str:
+    """Case and diacritic fold for Turkish text (KILIF, kılıf, kilif -> kilif)"""
+    if not text:
+        return ""
+    return str(text).translate(_TURKISH_FOLD).lower().strip()
+
+def _trigrams(text: str) -> set:
+    # Trailing sentinel makes the last two characters a trigram prefix as well
+    padded = text + "\x00"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class ProductSearchIndex:
+    """In-process character trigram index over Turkish-folded product fields.
+
+    Results are ranked exact code/barcode match, then prefix match, then substring match.
+    Each worker keeps its own copy: local writes are applied incrementally and a
+    `catalog_version` counter tells workers when another process changed the catalog.
+    """
+
+    def __init__(self):
+        self._doc_nums: Dict[str, int] = {}       # product id -> doc number
+        self._product_ids: Dict[int, str] = {}    # doc number -> product id
+        self._fields: Dict[int, tuple] = {}       # doc number -> folded field values
+        self._postings: Dict[str, set] = {}       # trigram -> doc numbers
+        self._by_bigram: Dict[str, set] = {}      # bigram -> trigrams starting with it
+        self._exact: Dict[str, set] = {}          # folded code/barcode -> doc numbers
+        self._next_num = 0
+        self.generation = 0  # bumped on every change, invalidates cached search results
+        self.version = 0
+        self.ready = False
+        self.searches = 0
+        self.search_seconds = 0.0
+        self.last_load_seconds = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self._fields)
+
+    def upsert(self, product: Dict[str, Any]):
+        product_id = product.get('id')
+        if not product_id:
+            return
+        self.remove(product_id)
+        self.generation += 1
+        num = self._next_num
+        self._next_num += 1
+        fields = tuple(turkish_fold(product.get(f)) for f in PRODUCT_SEARCH_FIELDS)
+        self._doc_nums[product_id] = num
+        self._product_ids[num] = product_id
+        self._fields[num] = fields
+        for value in fields[:PRODUCT_CODE_FIELD_COUNT]:
+            if value:
+                self._exact.setdefault(value, set()).add(num)
+        for gram in set().union(*(_trigrams(v) for v in fields if v)):
+            postings = self._postings.get(gram)
+            if postings is None:
+                postings = self._postings[gram] = set()
+                self._by_bigram.setdefault(gram[:2], set()).add(gram)
+            postings.add(num)
+
+    def remove(self, product_id: str):
+        num = self._doc_nums.pop(product_id, None)
+        if num is None:
+            return
+        self.generation += 1
+        del self._product_ids[num]
+        fields = self._fields.pop(num)
+        for value in fields[:PRODUCT_CODE_FIELD_COUNT]:
+            if value and value in self._exact:
+                self._exact[value].discard(num)
+                if not self._exact[value]:
+                    del self._exact[value]
+        for gram in set().union(*(_trigrams(v) for v in fields if v)):
+            postings = self._postings.get(gram)
+            if postings is None:
+                continue
+            postings.discard(num)
+            if not postings:
+                del self._postings[gram]
+                self._by_bigram[gram[:2]].discard(gram)
+                if not self._by_bigram[gram[:2]]:
+                    del self._by_bigram[gram[:2]]
+
+    def _swap(self, other: 'ProductSearchIndex'):
+        for attr in ('_doc_nums', '_product_ids', '_fields', '_postings', '_by_bigram', '_exact', '_next_num'):
+            setattr(self, attr, getattr(other, attr))
+        self.generation += 1
+        self.ready = True
+
+    def clear(self):
+        self._swap(ProductSearchIndex())
+
+    def _candidates(self, query: str):
+        if len(query) < PRODUCT_SEARCH_MIN_CHARS:
+            return ()
+        if len(query) == 2:
+            docs = set()
+            for gram in self._by_bigram.get(query, ()):
+                docs |= self._postings[gram]
+            return docs
+        grams = {query[i:i + 3] for i in range(len(query) - 2)}
+        postings = []
+        for gram in grams:
+            docs = self._postings.get(gram)
+            if not docs:
+                return ()
+            postings.append(docs)
+        postings.sort(key=len)
+        smallest, others = postings[0], postings[1:]
+        return (num for num in smallest if all(num in p for p in others))
+
+    def search(self, query: str, limit: int) -> List[str]:
+        """Ranked product ids matching `query` (at most `limit`)"""
+        started = time.perf_counter()
+        query = turkish_fold(query)
+        if len(query) < PRODUCT_SEARCH_MIN_CHARS or limit <= 0:
+            return []
+        ids = self.ranked(query, self._candidates(query), limit)
+        self.searches += 1
+        self.search_seconds += time.perf_counter() - started
+        return ids
+
+    def ranked(self, query: str, nums: Iterable[int], limit: int) -> List[str]:
+        """Ranked product ids among `nums` for `query` (already folded), at most `limit`.
+
+        `nums` must include every document that matches `query` (trigram candidates or a
+        cached match list); non-matching ones are skipped. Stops as soon as the exact and
+        prefix hits fill the page instead of ranking every candidate.
+        """
+        if limit <= 0:
+            return []
+        exact = sorted(self._exact.get(query, ()))[:limit]
+        exact_set = set(exact)
+        prefix, substring = [], []
+        for num in nums:
+            if num in exact_set:
+                continue
+            fields = self._fields[num]
+            if any(value.startswith(query) for value in fields):
+                prefix.append(num)
+                # Nothing ranks above a prefix match except exact hits
+                if len(exact) + len(prefix) >= limit:
+                    break
+            elif len(substring) < limit and any(query in value for value in fields):
+                substring.append(num)
+        return self.product_ids((exact + prefix + substring)[:limit])
+
+    def product_ids(self, nums: Iterable[int]) -> List[str]:
+        return [self._product_ids[num] for num in nums]
+
+    def match(self, query: str, cap: int) -> Optional[List[int]]:
+        """All doc numbers containing `query` (already folded), None if more than `cap`"""
+        matches = []
+        for num in self._candidates(query):
+            if any(query in value for value in self._fields[num]):
+                matches.append(num)
+                if len(matches) > cap:
+                    return None
+        return matches
+
+    def refine(self, query: str, nums: List[int]) -> List[int]:
+        """Narrow the matches of a shorter prefix down to those containing `query`"""
+        return [num for num in nums if any(query in value for value in self._fields[num])]
+
+    def build(self, products: List[Dict[str, Any]]):
+        for product in products:
+            self.upsert(product)
+        self.ready = True
+
+    async def load(self):
+        """Rebuild from Mongo off the event loop and swap in the new index"""
+        started = time.perf_counter()
+        version_doc = await db.counters.find_one({"_id": "catalog_version"})
+        projection = {"_id": 0, "id": 1, **{f: 1 for f in PRODUCT_SEARCH_FIELDS}}
+        products = await db.products.find({}, projection).to_list(None)
+        fresh = ProductSearchIndex()
+        await asyncio.to_thread(fresh.build, products)
+        self._swap(fresh)
+        self.version = version_doc["seq"] if version_doc else 0
+        self.last_load_seconds = time.perf_counter() - started
+        logger.info(f"Product search index loaded: {len(self)} products in {self.last_load_seconds:.2f}s")
+
+    def observe_version(self, seq: int):
+        # Our own bump directly after the known version: nothing else changed
+        if seq == self.version + 1:
+            self.version = seq
+
+    async def _sync(self):
+        while True:
+            await asyncio.sleep(CATALOG_SYNC_SECONDS)
+            try:
+                version_doc = await db.counters.find_one({"_id": "catalog_version"})
+                if version_doc and version_doc["seq"] != self.version:
+                    await self.load()
+            except Exception as e:
+                logger.error(f"Product search index sync error: {e}")
+
+    async def start(self):
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error(f"Product search index load failed, falling back to Mongo search: {e}")
+        self._task = asyncio.create_task(self._sync())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "products": len(self),
+            "trigrams": len(self._postings),
+            "version": self.version,
+            "searches": self.searches,
+            "avg_search_ms": round(self.search_seconds / self.searches * 1000, 3) if self.searches else 0.0,
+            "last_load_seconds": round(self.last_load_seconds, 3),
+        }
+
+product_search_index = ProductSearchIndex()
+
+class SearchSessionCache:
+    """Typeahead result cache: "kab" after "ka" is answered by filtering the cached "ka" matches.
+
+    Entries hold the full match list of a query plus the product documents already fetched
+    for it, so refinements reuse them instead of querying Mongo again. LRU-evicted by
+    estimated size and dropped whenever the search index changes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()  # folded query -> entry dict
+        self._bytes = 0
+        self._generation = None
+        self.exact_hits = 0
+        self.refinement_hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+        self.evictions = 0
+        self.db_queries = 0
+        self.docs_from_cache = 0
+        self.docs_from_db = 0
+
+    def _check_generation(self):
+        if self._generation != product_search_index.generation:
+            self._entries.clear()
+            self._bytes = 0
+            self._generation = product_search_index.generation
+
+    def lookup(self, query: str) -> Optional[Dict[str, Any]]:
+        """Entry for `query`, derived from the longest cached prefix if needed"""
+        self._check_generation()
+        entry = self._entries.get(query)
+        if entry is not None:
+            self._entries.move_to_end(query)
+            self.exact_hits += 1
+            return entry
+        for end in range(len(query) - 1, 1, -1):
+            parent = self._entries.get(query[:end])
+            if parent is None:
+                continue
+            self._entries.move_to_end(query[:end])
+            nums = product_search_index.refine(query, parent["nums"])
+            kept = set(product_search_index.product_ids(nums))
+            docs = {pid: doc for pid, doc in parent["docs"].items() if pid in kept}
+            self.refinement_hits += 1
+            return self._store(query, nums, docs)
+        nums = product_search_index.match(query, SEARCH_CACHE_MAX_CANDIDATES)
+        if nums is None:
+            self.uncacheable += 1
+            return None
+        self.misses += 1
+        return self._store(query, nums, {})
+
+    def _store(self, query: str, nums: List[int], docs: Dict[str, Any]) -> Dict[str, Any]:
+        entry = {"nums": nums, "docs": docs, "bytes": 0}
+        self._entries[query] = entry
+        self._resize(query, entry)
+        return entry
+
+    def _resize(self, query: str, entry: Dict[str, Any]):
+        # Rough estimate: list slots plus the string payload of cached documents
+        size = 100 + len(query) + 8 * len(entry["nums"]) + sum(
+            200 + sum(len(str(v)) for v in doc.values()) for doc in entry["docs"].values()
+        )
+        self._bytes += size - entry["bytes"]
+        entry["bytes"] = size
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted["bytes"]
+            self.evictions += 1
+
+    async def fetch_docs(self, query: str, entry: Dict[str, Any], ids: List[str]) -> List[Dict[str, Any]]:
+        missing = [i for i in ids if i not in entry["docs"]]
+        self.docs_from_cache += len(ids) - len(missing)
+        if missing:
+            self.db_queries += 1
+            self.docs_from_db += len(missing)
+            docs = await db.products.find({"id": {"$in": missing}}, {"_id": 0}).to_list(len(missing))
+            if self._generation == product_search_index.generation and query in self._entries:
+                entry["docs"].update({doc['id']: doc for doc in docs})
+                self._resize(query, entry)
+            else:
+                entry = {"docs": {**entry["docs"], **{doc['id']: doc for doc in docs}}}
+        return [dict(entry["docs"][i]) for i in ids if i in entry["docs"]]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "exact_hits": self.exact_hits,
+            "refinement_hits": self.refinement_hits,
+            "misses": self.misses,
+            "uncacheable": self.uncacheable,
+            "evictions": self.evictions,
+            "db_queries": self.db_queries,
+            "docs_from_cache": self.docs_from_cache,
+            "docs_from_db": self.docs_from_db,
+        }
+
+search_session_cache = SearchSessionCache(SEARCH_CACHE_MAX_BYTES)
+
+async def mark_catalog_changed():
+    """Bump the shared catalog version after a product write"""
+    product_search_index.observe_version(await next_sequence("catalog_version"))
+
+async def find_products_by_search(query: str, limit: int, skip: int = 0) -> List[Dict[str, Any]]:
+    folded = turkish_fold(query)
+    entry = search_session_cache.lookup(folded) if product_search_index.ready and len(folded) >= 2 else None
+    if len(folded) < PRODUCT_SEARCH_MIN_CHARS:
+        # A single character matches most of the catalog: only code prefixes, via their indexes
+        prefixes = [re.compile('^' + re.escape(variant)) for variant in {query, query.upper(), query.lower()}]
+        query_filter = {"$or": [{field: {"$in": prefixes}} for field in ('web_service_code', 'barcode')]}
+        products = await db.products.find(query_filter, {"_id": 0}).skip(skip).limit(limit).to_list(limit)
+    elif entry is not None:
+        ids = product_search_index.ranked(folded, entry["nums"], skip + limit)[skip:]
+        products = await search_session_cache.fetch_docs(folded, entry, ids)
+    elif product_search_index.ready:
+        # Too broad to cache: early-exit index search
+        ids = product_search_index.search(query, skip + limit)[skip:]
+        if not ids:
+            return []
+        docs = await db.products.find({"id": {"$in": ids}}, {"_id": 0}).to_list(len(ids))
+        by_id = {doc['id']: doc for doc in docs}
+        products = [by_id[i] for i in ids if i in by_id]
+    else:
+        pattern = {"$regex": re.escape(query), "$options": "i"}
+        query_filter = {"$or": [{field: pattern} for field in PRODUCT_SEARCH_FIELDS]}
+        products = await db.products.find(query_filter, {"_id": 0}).skip(skip).limit(limit).to_list(limit)
+
+    for product in products:
+        if isinstance(product.get('created_at'), str):
+            product['created_at'] = datetime.fromisoformat(product['created_at'])
+    return products
+
 # ==================== PRODUCT ENDPOINTS ====================
 
 @api_router.post("/products", response_model=Product)
@@ -641,27 +1637,45 @@ async def create_product(product_data: ProductCreate, current_user: User = Depen
     product = Product(**product_data.model_dump())
     doc = product.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
-    await db.products.insert_one(doc)
+    try:
+        await db.products.insert_one(doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Product with this web service code already exists")
+    product_search_index.upsert(doc)
+    await mark_catalog_changed()
     return product
 
+PRODUCT_LIST_SORT = [("created_at", ASCENDING), ("id", ASCENDING)]
+
 @api_router.get("/products", response_model=List[Product])
 async def get_products(
+    response: Response,
     search: Optional[str] = None,
     limit: int = 100,
     skip: int = 0,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
-    query = {}
+    projection = fieldset_projection(fields, Product, ProductSummary, ("id", "created_at"))
     if search:
-        query['$or'] = [
-            {"name": {"$regex": search, "$options": "i"}},
-            {"product_name": {"$regex": search, "$options": "i"}},
-            {"web_service_code": {"$regex": search, "$options": "i"}},
-            {"barcode": {"$regex": search, "$options": "i"}},
-            {"supplier_product_code": {"$regex": search, "$options": "i"}}
-        ]
-    
-    products = await db.products.find(query, {"_id": 0}).skip(skip).limit(limit).to_list(limit)
+        # Search results are ranked, not keyset-ordered: these still page with skip
+        products = await find_products_by_search(search, limit, skip)
+        if projection:
+            # Matches come from the search cache as whole documents, trim them here
+            products = [{k: p[k] for k in projection if k in p} for p in products]
+            return fieldset_response(products, fields, ProductSummary)
+        return products
+    
+    projection = projection or {"_id": 0}
+    if cursor:
+        find = db.products.find(keyset_query({}, PRODUCT_LIST_SORT, cursor), projection)
+    else:
+        find = db.products.find({}, projection).skip(skip)
+    products = await find.sort(PRODUCT_LIST_SORT).limit(limit).to_list(limit)
+    next_cursor = set_next_cursor(response, products, limit, PRODUCT_LIST_SORT)
+    if fields:
+        return fieldset_response(products, fields, ProductSummary, next_cursor)
     for product in products:
         if isinstance(product.get('created_at'), str):
             product['created_at'] = datetime.fromisoformat(product['created_at'])
@@ -677,21 +1691,7 @@ async def search_products(
     if not q or len(q) < 2:
         return []
     
-    query = {
-        '$or': [
-            {"name": {"$regex": q, "$options": "i"}},
-            {"product_name": {"$regex": q, "$options": "i"}},
-            {"web_service_code": {"$regex": q, "$options": "i"}},
-            {"barcode": {"$regex": q, "$options": "i"}},
-            {"brand": {"$regex": q, "$options": "i"}}
-        ]
-    }
-    
-    products = await db.products.find(query, {"_id": 0}).limit(limit).to_list(limit)
-    for product in products:
-        if isinstance(product.get('created_at'), str):
-            product['created_at'] = datetime.fromisoformat(product['created_at'])
-    return products
+    return await find_products_by_search(q, limit)
 
 # IMPORTANT: Static routes MUST come before dynamic {product_id} routes
 class BulkDeleteRequest(BaseModel):
@@ -707,6 +1707,9 @@ async def bulk_delete_products(request: BulkDeleteRequest, current_user: User =
         raise HTTPException(status_code=400, detail="No product IDs provided")
     
     result = await db.products.delete_many({"id": {"$in": request.ids}})
+    for product_id in request.ids:
+        product_search_index.remove(product_id)
+    await mark_catalog_changed()
     
     return {
         "message": f"{result.deleted_count} ürün silindi",
@@ -720,6 +1723,8 @@ async def delete_all_products(current_user: User = Depends(get_current_user)):
         raise HTTPException(status_code=403, detail="Only admin can delete all products")
     
     result = await db.products.delete_many({})
+    product_search_index.clear()
+    await mark_catalog_changed()
     
     return {
         "message": f"Tüm ürünler silindi ({result.deleted_count} adet)",
@@ -738,14 +1743,17 @@ async def get_product(product_id: str, current_user: User = Depends(get_current_
 
 @api_router.put("/products/{product_id}", response_model=Product)
 async def update_product(product_id: str, product_data: ProductCreate, current_user: User = Depends(get_current_user)):
-    existing = await db.products.find_one({"id": product_id}, {"_id": 0})
-    if not existing:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
     update_data = product_data.model_dump()
-    await db.products.update_one({"id": product_id}, {"$set": update_data})
+    # Dropping the import hash lets the next CSV import overwrite manual edits as before
+    try:
+        updated = await update_and_fetch(db.products, {"id": product_id}, {"$set": update_data, "$unset": {"content_hash": ""}})
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Product with this web service code already exists")
+    if not updated:
+        raise HTTPException(status_code=404, detail="Product not found")
     
-    updated = await db.products.find_one({"id": product_id}, {"_id": 0})
+    product_search_index.upsert(updated)
+    await mark_catalog_changed()
     if isinstance(updated.get('created_at'), str):
         updated['created_at'] = datetime.fromisoformat(updated['created_at'])
     return Product(**updated)
@@ -755,6 +1763,8 @@ async def delete_product(product_id: str, current_user: User = Depends(get_curre
     result = await db.products.delete_one({"id": product_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    product_search_index.remove(product_id)
+    await mark_catalog_changed()
     return {"message": "Product deleted successfully"}
 
 # ==================== SETTINGS / ORDER TYPES ====================
@@ -788,14 +1798,11 @@ async def update_order_type(order_type_id: str, order_type_data: OrderTypeCreate
     if current_user.role != UserRole.ADMIN:
         raise HTTPException(status_code=403, detail="Only admin can manage order types")
     
-    existing = await db.order_types.find_one({"id": order_type_id}, {"_id": 0})
-    if not existing:
-        raise HTTPException(status_code=404, detail="Order type not found")
-    
     update_data = order_type_data.model_dump()
-    await db.order_types.update_one({"id": order_type_id}, {"$set": update_data})
+    updated = await update_and_fetch(db.order_types, {"id": order_type_id}, {"$set": update_data})
+    if not updated:
+        raise HTTPException(status_code=404, detail="Order type not found")
     
-    updated = await db.order_types.find_one({"id": order_type_id}, {"_id": 0})
     if isinstance(updated.get('created_at'), str):
         updated['created_at'] = datetime.fromisoformat(updated['created_at'])
     return OrderTypeModel(**updated)
@@ -814,20 +1821,7 @@ async def delete_order_type(order_type_id: str, current_user: User = Depends(get
 
 async def get_next_kodsuz_code() -> str:
     """Generate next KodsuzA#### code"""
-    # Find the highest kodsuz code
-    result = await db.products.find(
-        {"web_service_code": {"$regex": "^KodsuzA"}},
-        {"_id": 0, "web_service_code": 1}
-    ).sort("web_service_code", -1).limit(1).to_list(1)
-    
-    if result:
-        last_code = result[0]['web_service_code']
-        # Extract number from KodsuzA0001
-        number = int(last_code.replace('KodsuzA', ''))
-        next_number = number + 1
-    else:
-        next_number = 1
-    
+    next_number = await next_sequence("kodsuz:KodsuzA")
     return f"KodsuzA{next_number:04d}"
 
 class ManualProductCreate(BaseModel):
@@ -849,11 +1843,406 @@ async def create_manual_product(data: ManualProductCreate, current_user: User =
     doc = product.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
     await db.products.insert_one(doc)
+    product_search_index.upsert(doc)
+    await mark_catalog_changed()
     
     return product
 
+# ==================== READ CACHE ====================
+
+class SingleFlightCache:
+    """Short-lived cache of async computations.
+
+    Concurrent callers of a key that is not cached share one in-flight computation instead
+    of each running the same queries; the result is then served for `ttl_seconds`
+    (0: coalescing only, nothing is kept). Failures are not cached.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    async def get(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = self._inflight[key] = asyncio.create_task(self._compute(key, compute))
+        # A caller that disconnects must not cancel the computation the others wait for
+        return await asyncio.shield(task)
+
+    async def _compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await compute()
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        if self.ttl_seconds <= 0:
+            return value
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+read_cache = SingleFlightCache(READ_CACHE_TTL_SECONDS)
+
 # ==================== PDF GENERATION ====================
 
+class PdfPoolSaturated(Exception):
+    pass
+
+class PdfRenderPool:
+    """Process pool for PDF rendering with a bounded backlog.
+
+    At most `workers` renders run at once and `queue_size` more may wait; beyond that
+    render() raises PdfPoolSaturated instead of letting requests pile up.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self.rendered = 0
+        self.rejected = 0
+        self.failed = 0
+        self.render_seconds = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: workers must not inherit the event loop and Mongo client threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_pdf_worker,
+            )
+        return self._executor
+
+    async def render(self, spec: Dict[str, Any]) -> bytes:
+        if self._pending >= self.workers + self.queue_size:
+            self.rejected += 1
+            raise PdfPoolSaturated()
+        self._pending += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            pdf_bytes = await loop.run_in_executor(self._get_executor(), render_order_pdf, spec)
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); start a fresh pool for the next request
+            self.failed += 1
+            self.stop()
+            raise
+        finally:
+            self._pending -= 1
+        self.rendered += 1
+        self.render_seconds += time.perf_counter() - started
+        return pdf_bytes
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "pending": self._pending,
+            "rendered": self.rendered,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "avg_render_seconds": round(self.render_seconds / self.rendered, 4) if self.rendered else 0.0,
+        }
+
+pdf_render_pool = PdfRenderPool(PDF_RENDER_WORKERS, PDF_RENDER_QUEUE_SIZE)
+
+PDF_ORDER_FIELDS = ('order_number', 'created_at', 'customer_name', 'customer_phone', 'customer_email',
+                    'customer_address', 'tax_office', 'tax_number')
+PDF_ITEM_FIELDS = ('product_name', 'quantity', 'unit_price', 'total_price', 'notes')
+
+class PdfSettings(BaseModel):
+    """Everything a quote is rendered from besides the order itself"""
+    template: PDFTemplateSettings
+    bank_accounts: List[BankAccount] = []
+    logo: Optional[Dict[str, str]] = None  # {"sha256", "path"} of the decoded logo file
+    version: str  # digest of all of the above, part of the PDF cache key
+
+def pdf_render_spec(order: Dict[str, Any], items: List[Dict[str, Any]], settings: PdfSettings) -> Dict[str, Any]:
+    """Plain, picklable input of render_order_pdf; the logo travels as a file path"""
+    return {
+        "order": {field: order.get(field) for field in PDF_ORDER_FIELDS},
+        "items": [{field: item.get(field) for field in PDF_ITEM_FIELDS} for item in items],
+        "template": settings.template.model_dump(mode="json", exclude={"bank_accounts", "logo_base64", "logo_sha256"}),
+        "bank_accounts": [account.model_dump() for account in settings.bank_accounts],
+        "logo": settings.logo,
+    }
+
+class PdfCache:
+    """Rendered PDFs on local disk at <root>/<key>.pdf, least recently used evicted past max_bytes.
+
+    Keys are digests of everything a PDF is rendered from, so entries never go stale; a
+    changed order or template simply stops being asked for and ages out. Several uvicorn
+    workers may share the directory: writes are atomic renames and a file evicted by
+    another worker is just a miss. Each worker only sees its own writes between scans, so
+    a put that crosses max_bytes re-scans the directory before evicting; the limit then
+    holds for the shared directory, not per process. get/put run in threadpool threads,
+    so the index and size bookkeeping is guarded by a lock; file I/O happens outside it.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._index: Optional[OrderedDict] = None  # key -> size, least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+        self._renders = SingleFlightCache(0)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path(self, key: str) -> Path:
+        return self.root / f"{key}.pdf"
+
+    def _scan(self) -> OrderedDict:
+        """All cached files of every worker, least recently used (oldest mtime) first"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        files = []
+        for f in self.root.glob('*.pdf'):
+            try:
+                stat = f.stat()
+            except FileNotFoundError:  # evicted by another worker meanwhile
+                continue
+            files.append((stat.st_mtime, f.stem, stat.st_size))
+        return OrderedDict((key, size) for _, key, size in sorted(files))
+
+    def _load_index(self) -> OrderedDict:
+        # Called with self._lock held
+        if self._index is None:
+            self._index = self._scan()
+            self._size = sum(self._index.values())
+        return self._index
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Cached PDF or None (blocking, run in a thread)"""
+        with self._lock:
+            index = self._load_index()
+        try:
+            data = self.path(key).read_bytes()
+            os.utime(self.path(key))
+        except FileNotFoundError:
+            with self._lock:
+                self._size -= index.pop(key, 0)
+            return None
+        with self._lock:
+            if key not in index:
+                index[key] = len(data)
+                self._size += len(data)
+            index.move_to_end(key)
+        return data
+
+    def put(self, key: str, data: bytes):
+        with self._lock:
+            index = self._load_index()
+        tmp_path = self.root / f".render-{uuid.uuid4()}"
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, self.path(key))
+        with self._lock:
+            self._size += len(data) - index.pop(key, 0)
+            index[key] = len(data)
+            over_limit = self._size > self.max_bytes
+        if not over_limit:
+            return
+        scanned = self._scan()
+        evicted = []
+        with self._lock:
+            self._index = index = scanned
+            self._size = sum(index.values())
+            if key in index:  # just written, whatever the mtime resolution says
+                index.move_to_end(key)
+            while self._size > self.max_bytes and len(index) > 1:
+                old_key, size = index.popitem(last=False)
+                evicted.append(old_key)
+                self._size -= size
+                self.evictions += 1
+        for old_key in evicted:
+            self.path(old_key).unlink(missing_ok=True)
+
+    async def get_or_render(self, key: str, render: Callable[[], Awaitable[bytes]]) -> bytes:
+        data = await run_in_threadpool(self.get, key)
+        if data is not None:
+            self.hits += 1
+            return data
+        self.misses += 1
+
+        async def render_and_store() -> bytes:
+            data = await render()
+            await run_in_threadpool(self.put, key, data)
+            return data
+        # Concurrent downloads of the same version wait for one render
+        return await self._renders.get(key, render_and_store)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._index or ()),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self._renders.coalesced,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+pdf_cache = PdfCache(PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES)
+
+PDF_ORDER_PROJECTION = {"_id": 0, "id": 1, "updated_at": 1, **{field: 1 for field in PDF_ORDER_FIELDS}}
+PDF_ITEM_PROJECTION = {"_id": 0, "id": 1, "updated_at": 1, **{field: 1 for field in PDF_ITEM_FIELDS}}
+
+def pdf_cache_key(order: Dict[str, Any], items: List[Dict[str, Any]], settings_version: str) -> str:
+    """Digest of the renderer version and every input of the PDF"""
+    parts = [
+        PDF_RENDERER_VERSION,
+        order,
+        sorted(items, key=lambda item: item.get('id') or ''),
+        settings_version,
+    ]
+    payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+async def load_pdf_template() -> PDFTemplateSettings:
+    template_doc = await db.pdf_settings.find_one({"id": "pdf_template_settings"}, {"_id": 0})
+    if not template_doc:
+        return PDFTemplateSettings()
+    if isinstance(template_doc.get('updated_at'), str):
+        template_doc['updated_at'] = datetime.fromisoformat(template_doc['updated_at'])
+    # Handle bank_accounts if it's a list of dicts
+    if 'bank_accounts' in template_doc and isinstance(template_doc['bank_accounts'], list):
+        template_doc['bank_accounts'] = [BankAccount(**ba) if isinstance(ba, dict) else ba for ba in template_doc['bank_accounts']]
+    return PDFTemplateSettings(**template_doc)
+
+class PdfSettingsCache:
+    """Parsed template, active bank accounts and decoded logo, shared by every PDF of this worker.
+
+    Settings endpoints call invalidate(), which drops the entry here and bumps the shared
+    `pdf_settings_version` counter; other workers compare against that counter at most
+    every `sync_seconds`. The logo is decoded once per change into a file the render
+    workers open (and keep) by digest.
+    """
+
+    def __init__(self, asset_dir: Path, sync_seconds: float):
+        self.asset_dir = asset_dir
+        self.sync_seconds = sync_seconds
+        self._settings: Optional[PdfSettings] = None
+        self._version: Optional[int] = None  # shared counter value the entry was loaded at
+        self._checked_at = 0.0
+        self._generation = 0  # local invalidations, so an in-flight load can't store stale data
+        self._loads = SingleFlightCache(0)
+        self.hits = 0
+        self.loads = 0
+        self.invalidations = 0
+
+    async def get(self) -> PdfSettings:
+        if self._settings is not None and time.monotonic() - self._checked_at < self.sync_seconds:
+            self.hits += 1
+            return self._settings
+        return await self._loads.get("settings", self._refresh)
+
+    async def _refresh(self) -> PdfSettings:
+        generation = self._generation
+        version_doc = await db.counters.find_one({"_id": "pdf_settings_version"})
+        version = (version_doc or {}).get("seq", 0)
+        settings = self._settings
+        if settings is None or version != self._version:
+            settings = await self._load()
+            self.loads += 1
+        if generation == self._generation:
+            self._settings, self._version, self._checked_at = settings, version, time.monotonic()
+        return settings
+
+    async def _load(self) -> PdfSettings:
+        template, bank_accounts_docs = await asyncio.gather(
+            load_pdf_template(),
+            db.bank_accounts.find({"is_active": True}, {"_id": 0}).to_list(100),
+        )
+        bank_accounts = [BankAccount(**ba) for ba in bank_accounts_docs]
+        logo = None
+        if template.logo_base64:
+            try:
+                logo = await run_in_threadpool(self._write_logo, base64.b64decode(template.logo_base64),
+                                               template.logo_sha256)
+            except (ValueError, OSError) as e:
+                logger.error(f"Logo decode error: {e}")
+        parts = [
+            template.model_dump(mode="json", exclude={"logo_base64", "logo_sha256", "updated_at"}),
+            logo and logo["sha256"],
+            sorted((account.model_dump() for account in bank_accounts), key=lambda account: account["id"]),
+        ]
+        version = hashlib.sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+        return PdfSettings(template=template, bank_accounts=bank_accounts, logo=logo, version=version)
+
+    def _write_logo(self, data: bytes, sha256: Optional[str] = None) -> Dict[str, str]:
+        sha256 = sha256 or hashlib.sha256(data).hexdigest()
+        path = self.asset_dir / f"logo-{sha256}"
+        if not path.exists():
+            self.asset_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.asset_dir / f".logo-{uuid.uuid4()}"
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        return {"sha256": sha256, "path": str(path)}
+
+    async def invalidate(self):
+        self._generation += 1
+        self._settings = None
+        self.invalidations += 1
+        await next_sequence("pdf_settings_version")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": self._settings is not None,
+            "hits": self.hits,
+            "loads": self.loads,
+            "invalidations": self.invalidations,
+            "sync_seconds": self.sync_seconds,
+        }
+
+pdf_settings_cache = PdfSettingsCache(PDF_CACHE_DIR / 'assets', PDF_SETTINGS_SYNC_SECONDS)
+
+async def cached_order_pdf(key: str, order: Dict[str, Any], items: List[Dict[str, Any]], settings: PdfSettings) -> bytes:
+    async def render() -> bytes:
+        return await pdf_render_pool.render(pdf_render_spec(order, items, settings))
+    return await pdf_cache.get_or_render(key, render)
+
 @api_router.get("/settings/pdf-template", response_model=PDFTemplateSettings)
 async def get_pdf_template(current_user: User = Depends(get_current_user)):
     """Get PDF template settings"""
@@ -866,412 +2255,240 @@ async def get_pdf_template(current_user: User = Depends(get_current_user)):
         template['updated_at'] = datetime.fromisoformat(template['updated_at'])
     return PDFTemplateSettings(**template)
 
+async def pdf_template_logo_fields(logo_base64: Optional[str]) -> Dict[str, Any]:
+    """Logo fields to store for a logo_base64 sent with the template form.
+
+    Empty clears the logo; the stored logo echoed back by the form is left as is; anything
+    else goes through normalize_logo like an upload."""
+    if not logo_base64:
+        return {"logo_base64": None, "logo_sha256": None}
+    try:
+        contents = base64.b64decode(logo_base64, validate=True)
+    except binascii.Error:
+        raise HTTPException(status_code=400, detail="Invalid logo data")
+    if len(contents) > 500 * 1024:
+        raise HTTPException(status_code=400, detail="File too large. Max 500KB allowed")
+    current = await pdf_settings_cache.get()
+    if hashlib.sha256(contents).hexdigest() == current.template.logo_sha256:
+        return {}
+    try:
+        logo = await run_in_threadpool(normalize_logo, contents)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid image file")
+    return logo_fields(logo)
+
 @api_router.put("/settings/pdf-template", response_model=PDFTemplateSettings)
 async def update_pdf_template(settings: PDFTemplateUpdate, current_user: User = Depends(get_current_user)):
     """Update PDF template settings"""
     if current_user.role != UserRole.ADMIN:
         raise HTTPException(status_code=403, detail="Only admin can update PDF template")
     
-    # Check if exists
-    existing = await db.pdf_settings.find_one({"id": "pdf_template_settings"}, {"_id": 0})
-    
     update_data = settings.model_dump(exclude_none=True)
     update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
-    
-    if existing:
-        await db.pdf_settings.update_one(
-            {"id": "pdf_template_settings"},
-            {"$set": update_data}
-        )
-    else:
-        template = PDFTemplateSettings(**update_data)
-        doc = template.model_dump()
-        doc['updated_at'] = doc['updated_at'].isoformat()
-        await db.pdf_settings.insert_one(doc)
-    
-    updated = await db.pdf_settings.find_one({"id": "pdf_template_settings"}, {"_id": 0})
+    if 'logo_base64' in settings.model_fields_set:
+        update_data.update(await pdf_template_logo_fields(settings.logo_base64))
+    
+    # First save creates the document with defaults for the fields not sent
+    defaults = PDFTemplateSettings().model_dump(exclude={'id', 'updated_at', *update_data})
+    updated = await update_and_fetch(
+        db.pdf_settings,
+        {"id": "pdf_template_settings"},
+        {"$set": update_data, "$setOnInsert": defaults},
+        upsert=True
+    )
+    await pdf_settings_cache.invalidate()
     if isinstance(updated.get('updated_at'), str):
         updated['updated_at'] = datetime.fromisoformat(updated['updated_at'])
     return PDFTemplateSettings(**updated)
 
 @api_router.get("/orders/{order_id}/pdf")
-async def generate_order_pdf(order_id: str, current_user: User = Depends(get_current_user)):
-    """Generate professional PDF quote for order with Turkish character support"""
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.platypus import Paragraph, Spacer
-    from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
-    
+async def generate_order_pdf(order_id: str, request: Request, current_user: User = Depends(get_current_user)):
+    """Generate professional PDF quote for order with Turkish character support.
+
+    Only the order and its items are read per call; template, bank accounts and logo come
+    from the settings cache, and the PDF is rendered only when its version is not on disk.
+    """
     # Get order (order_id veya order_code ile)
-    order = await db.orders.find_one({"id": order_id}, {"_id": 0})
-    if not order:
-        order = await db.orders.find_one({"order_code": order_id}, {"_id": 0})
+    order = await db.orders.find_one({"$or": [{"id": order_id}, {"order_code": order_id}]}, PDF_ORDER_PROJECTION)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    actual_id = order.get('id')
-    
-    # Get order items
-    items = await db.order_items.find({"order_id": actual_id}, {"_id": 0}).to_list(1000)
-    
-    # Get PDF template settings
-    template_doc = await db.pdf_settings.find_one({"id": "pdf_template_settings"}, {"_id": 0})
-    if template_doc:
-        if isinstance(template_doc.get('updated_at'), str):
-            template_doc['updated_at'] = datetime.fromisoformat(template_doc['updated_at'])
-        # Handle bank_accounts if it's a list of dicts
-        if 'bank_accounts' in template_doc and isinstance(template_doc['bank_accounts'], list):
-            template_doc['bank_accounts'] = [BankAccount(**ba) if isinstance(ba, dict) else ba for ba in template_doc['bank_accounts']]
-        template = PDFTemplateSettings(**template_doc)
-    else:
-        template = PDFTemplateSettings()
-    
-    # Get bank accounts from settings
-    bank_accounts_docs = await db.bank_accounts.find({"is_active": True}, {"_id": 0}).to_list(100)
-    bank_accounts = [BankAccount(**ba) for ba in bank_accounts_docs] if bank_accounts_docs else []
-    
-    # Create PDF in memory
-    buffer = io.BytesIO()
-    pdf = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-    
-    # ==================== HEADER SECTION ====================
-    y_position = height - 1.5*cm
-    
-    # Draw Logo if exists
-    logo_height = 0
-    if template.logo_base64:
+    # Get order items and the PDF settings (template, bank accounts, logo)
+    items, settings = await asyncio.gather(
+        db.order_items.find({"order_id": order['id']}, PDF_ITEM_PROJECTION).to_list(None),
+        pdf_settings_cache.get(),
+    )
+    key = pdf_cache_key(order, items, settings.version)
+    etag = f'"{key}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+        "Content-Disposition": f"attachment; filename=teklif_{order['order_number']}.pdf",
+    }
+    if etag in request.headers.get('if-none-match', ''):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        pdf_bytes = await cached_order_pdf(key, order, items, settings)
+    except PdfPoolSaturated:
+        raise HTTPException(status_code=503, detail="PDF oluşturma kuyruğu dolu, lütfen biraz sonra tekrar deneyin",
+                            headers={"Retry-After": "2"})
+    
+    return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
+
+class PdfBatchRequest(BaseModel):
+    """Either order_ids (id or order_code) or GET /orders style filters"""
+    order_ids: Optional[List[str]] = None
+    order_type: Optional[str] = None
+    status: Optional[str] = None
+    invoice_status: Optional[str] = None
+    waybill_status: Optional[str] = None
+    cargo_status: Optional[str] = None
+    cargo_barcode_status: Optional[str] = None
+    assigned_user_id: Optional[str] = None
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+    format: str = "zip"  # 'zip' veya 'pdf' (tek birleşik PDF)
+
+# request field -> order field
+PDF_BATCH_FILTERS = {
+    "order_type": "order_type",
+    "status": "general_status",
+    "invoice_status": "invoice_status",
+    "waybill_status": "waybill_status",
+    "cargo_status": "cargo_status",
+    "cargo_barcode_status": "cargo_barcode_status",
+    "assigned_user_id": "assigned_user_id",
+}
+
+def pdf_batch_query(payload: PdfBatchRequest) -> Dict[str, Any]:
+    if payload.order_ids:
+        return {"$or": [{"id": {"$in": payload.order_ids}}, {"order_code": {"$in": payload.order_ids}}]}
+    query = {field: getattr(payload, name) for name, field in PDF_BATCH_FILTERS.items() if getattr(payload, name)}
+    created = {}
+    # created_at is stored as a UTC isoformat string, which sorts chronologically
+    for op, value in (("$gte", payload.created_from), ("$lt", payload.created_to)):
+        if value is not None:
+            if value.tzinfo is None:
+                value = value.replace(tzinfo=timezone.utc)
+            created[op] = value.astimezone(timezone.utc).isoformat()
+    if created:
+        query['created_at'] = created
+    if not query:
+        raise HTTPException(status_code=400, detail="Sipariş listesi veya en az bir filtre gerekli")
+    return query
+
+class ZipStreamBuffer(io.RawIOBase):
+    """Write-only sink for zipfile; drained after every entry"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+@api_router.post("/orders/pdf-batch")
+async def generate_order_pdf_batch(payload: PdfBatchRequest, current_user: User = Depends(get_current_user)):
+    """Quotes of many orders as one ZIP (default) or one merged PDF, streamed as renders finish.
+
+    Orders and their items are read with two queries; renders go through the PDF cache and
+    process pool, at most one per worker at a time, so only that many PDFs are held at once.
+    """
+    if payload.format not in ("zip", "pdf"):
+        raise HTTPException(status_code=400, detail="format 'zip' veya 'pdf' olmalı")
+    if payload.format == "pdf":
         try:
-            from reportlab.lib.utils import ImageReader
-            logo_data = base64.b64decode(template.logo_base64)
-            logo_image = ImageReader(io.BytesIO(logo_data))
-            logo_width_px = 120
-            logo_height_px = 60
-            pdf.drawImage(logo_image, 2*cm, y_position - logo_height_px + 15, width=logo_width_px, height=logo_height_px, preserveAspectRatio=True, mask='auto')
-            logo_height = logo_height_px
-        except Exception as e:
-            logger.error(f"Logo render error: {e}")
-    
-    # Company Info (right side - top)
-    pdf.setFont(FONT_NAME_BOLD, 14)
-    company_x = width - 2*cm
-    y_company = height - 1.5*cm
-    
-    if template.company_name:
-        pdf.drawRightString(company_x, y_company, template.company_name)
-        y_company -= 0.5*cm
-    
-    pdf.setFont(FONT_NAME, 9)
-    if template.company_address:
-        # Split address if too long
-        address_lines = template.company_address.split('\n') if '\n' in template.company_address else [template.company_address]
-        for line in address_lines:
-            pdf.drawRightString(company_x, y_company, line.strip())
-            y_company -= 0.4*cm
-    
-    if template.company_phone:
-        pdf.drawRightString(company_x, y_company, f"Tel: {template.company_phone}")
-        y_company -= 0.4*cm
-    
-    if template.company_email:
-        pdf.drawRightString(company_x, y_company, f"E-posta: {template.company_email}")
-        y_company -= 0.4*cm
-    
-    if template.company_website:
-        pdf.drawRightString(company_x, y_company, template.company_website)
-        y_company -= 0.4*cm
-    
-    if template.company_tax_office and template.company_tax_number:
-        pdf.drawRightString(company_x, y_company, f"V.D: {template.company_tax_office} / {template.company_tax_number}")
-        y_company -= 0.4*cm
-    
-    # ==================== TITLE SECTION ====================
-    y_position = height - 4.5*cm
-    
-    # Title with underline
-    pdf.setFont(FONT_NAME_BOLD, 18)
-    title_width = pdf.stringWidth(template.title, FONT_NAME_BOLD, 18)
-    title_x = (width - title_width) / 2
-    pdf.drawString(title_x, y_position, template.title)
-    
-    # Underline
-    pdf.setStrokeColor(colors.HexColor("#333333"))
-    pdf.setLineWidth(1)
-    pdf.line(title_x - 10, y_position - 5, title_x + title_width + 10, y_position - 5)
-    
-    # ==================== DOCUMENT INFO ====================
-    y_position -= 1.5*cm
-    
-    # Info box background
-    pdf.setFillColor(colors.HexColor("#f8f9fa"))
-    pdf.rect(2*cm, y_position - 1.2*cm, width - 4*cm, 1.5*cm, fill=True, stroke=False)
-    pdf.setFillColor(colors.black)
-    
-    pdf.setFont(FONT_NAME, 10)
-    created_date = datetime.fromisoformat(order['created_at']).strftime('%d.%m.%Y')
-    validity_date = (datetime.fromisoformat(order['created_at']) + timedelta(days=template.validity_days)).strftime('%d.%m.%Y')
-    
-    pdf.drawString(2.5*cm, y_position - 0.3*cm, f"Teklif No: {order['order_number']}")
-    pdf.drawString(2.5*cm, y_position - 0.8*cm, f"Tarih: {created_date}")
-    pdf.drawRightString(width - 2.5*cm, y_position - 0.3*cm, f"Geçerlilik: {template.validity_days} gün")
-    pdf.drawRightString(width - 2.5*cm, y_position - 0.8*cm, f"Son Geçerlilik: {validity_date}")
-    
-    # ==================== CUSTOMER INFO ====================
-    y_position -= 2.5*cm
-    
-    if template.show_customer_info and order.get('customer_name'):
-        pdf.setFont(FONT_NAME_BOLD, 11)
-        pdf.drawString(2*cm, y_position, "MÜŞTERİ BİLGİLERİ")
-        y_position -= 0.5*cm
-        
-        pdf.setStrokeColor(colors.HexColor("#dee2e6"))
-        pdf.setLineWidth(0.5)
-        pdf.line(2*cm, y_position, width - 2*cm, y_position)
-        y_position -= 0.5*cm
-        
-        pdf.setFont(FONT_NAME, 10)
-        if order.get('customer_name'):
-            pdf.drawString(2*cm, y_position, f"Firma/Müşteri: {order['customer_name']}")
-            y_position -= 0.45*cm
-        
-        if order.get('customer_phone'):
-            pdf.drawString(2*cm, y_position, f"Telefon: {order['customer_phone']}")
-            y_position -= 0.45*cm
-        
-        if order.get('customer_email'):
-            pdf.drawString(2*cm, y_position, f"E-posta: {order['customer_email']}")
-            y_position -= 0.45*cm
-        
-        if order.get('customer_address'):
-            pdf.drawString(2*cm, y_position, f"Adres: {order['customer_address']}")
-            y_position -= 0.45*cm
-        
-        if order.get('tax_office') or order.get('tax_number'):
-            tax_info = []
-            if order.get('tax_office'):
-                tax_info.append(f"V.D: {order['tax_office']}")
-            if order.get('tax_number'):
-                tax_info.append(f"V.No: {order['tax_number']}")
-            pdf.drawString(2*cm, y_position, " / ".join(tax_info))
-            y_position -= 0.45*cm
-    
-    # ==================== ITEMS TABLE ====================
-    y_position -= 1*cm
-    
-    pdf.setFont(FONT_NAME_BOLD, 11)
-    pdf.drawString(2*cm, y_position, "ÜRÜN/HİZMET DETAYLARI")
-    y_position -= 0.5*cm
-    
-    # Table header
-    table_data = []
-    if template.show_prices:
-        headers = ['S.No', 'Ürün/Hizmet Adı', 'Miktar', 'Birim', 'Birim Fiyat', 'Toplam']
-        col_widths = [1*cm, 8*cm, 1.5*cm, 1.5*cm, 2.5*cm, 2.5*cm]
-    else:
-        headers = ['S.No', 'Ürün/Hizmet Adı', 'Miktar', 'Birim', 'Notlar']
-        col_widths = [1*cm, 10*cm, 2*cm, 2*cm, 2*cm]
-    
-    table_data.append(headers)
-    
-    # Table rows
-    grand_total = 0.0
-    for idx, item in enumerate(items, 1):
-        unit_price = item.get('unit_price', 0) or 0
-        quantity = item.get('quantity', 0) or 0
-        total = item.get('total_price', 0) or (quantity * unit_price)
-        grand_total += total
-        
-        if template.show_prices:
-            row = [
-                str(idx),
-                item['product_name'][:60],
-                str(quantity),
-                'Adet',
-                f"{unit_price:,.2f} ₺",
-                f"{total:,.2f} ₺"
-            ]
-        else:
-            row = [
-                str(idx),
-                item['product_name'][:60],
-                str(quantity),
-                'Adet',
-                item.get('notes', '')[:20] if item.get('notes') else ''
-            ]
-        table_data.append(row)
-    
-    # Create table
-    table = Table(table_data, colWidths=col_widths)
-    
-    table_style = TableStyle([
-        # Header style
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#343a40")),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('FONTNAME', (0, 0), (-1, 0), FONT_NAME_BOLD),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-        ('TOPPADDING', (0, 0), (-1, 0), 8),
-        
-        # Body style
-        ('FONTNAME', (0, 1), (-1, -1), FONT_NAME),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('ALIGN', (0, 1), (0, -1), 'CENTER'),  # S.No centered
-        ('ALIGN', (2, 1), (2, -1), 'CENTER'),  # Quantity centered
-        ('ALIGN', (3, 1), (3, -1), 'CENTER'),  # Unit centered
-        ('ALIGN', (-2, 1), (-1, -1), 'RIGHT'),  # Prices right aligned
-        ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
-        ('TOPPADDING', (0, 1), (-1, -1), 6),
-        
-        # Grid
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor("#dee2e6")),
-        
-        # Alternating row colors
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor("#f8f9fa")]),
-    ])
-    table.setStyle(table_style)
-    
-    # Calculate table height and draw
-    table_width, table_height = table.wrap(0, 0)
-    
-    # Check if table fits on page
-    if y_position - table_height < 5*cm:
-        pdf.showPage()
-        y_position = height - 2*cm
-    
-    table.drawOn(pdf, 2*cm, y_position - table_height)
-    y_position -= (table_height + 0.5*cm)
-    
-    # ==================== TOTALS SECTION ====================
-    if template.show_prices:
-        # Totals box
-        totals_x = width - 7*cm
-        
-        pdf.setFont(FONT_NAME_BOLD, 10)
-        pdf.setFillColor(colors.HexColor("#343a40"))
-        pdf.rect(totals_x, y_position - 1*cm, 5*cm, 1*cm, fill=True, stroke=False)
-        pdf.setFillColor(colors.white)
-        pdf.drawString(totals_x + 0.3*cm, y_position - 0.65*cm, "GENEL TOPLAM:")
-        pdf.drawRightString(totals_x + 4.7*cm, y_position - 0.65*cm, f"{grand_total:,.2f} ₺")
-        pdf.setFillColor(colors.black)
-        
-        y_position -= 1.5*cm
-    
-    # ==================== TERMS SECTION ====================
-    if template.payment_terms or template.delivery_terms:
-        y_position -= 0.5*cm
-        
-        if y_position < 6*cm:
-            pdf.showPage()
-            y_position = height - 2*cm
-        
-        pdf.setFont(FONT_NAME_BOLD, 10)
-        pdf.drawString(2*cm, y_position, "ŞARTLAR VE KOŞULLAR")
-        y_position -= 0.4*cm
-        
-        pdf.setStrokeColor(colors.HexColor("#dee2e6"))
-        pdf.line(2*cm, y_position, width - 2*cm, y_position)
-        y_position -= 0.5*cm
-        
-        pdf.setFont(FONT_NAME, 9)
-        
-        if template.payment_terms:
-            pdf.drawString(2*cm, y_position, f"Ödeme Koşulları: {template.payment_terms}")
-            y_position -= 0.45*cm
-        
-        if template.delivery_terms:
-            pdf.drawString(2*cm, y_position, f"Teslimat Koşulları: {template.delivery_terms}")
-            y_position -= 0.45*cm
-    
-    # ==================== BANK ACCOUNTS SECTION ====================
-    if template.show_bank_accounts and bank_accounts:
-        y_position -= 0.8*cm
-        
-        if y_position < 5*cm:
-            pdf.showPage()
-            y_position = height - 2*cm
-        
-        pdf.setFont(FONT_NAME_BOLD, 10)
-        pdf.drawString(2*cm, y_position, "BANKA HESAP BİLGİLERİ")
-        y_position -= 0.4*cm
-        
-        pdf.setStrokeColor(colors.HexColor("#dee2e6"))
-        pdf.line(2*cm, y_position, width - 2*cm, y_position)
-        y_position -= 0.5*cm
-        
-        pdf.setFont(FONT_NAME, 9)
-        
-        for ba in bank_accounts:
-            if y_position < 3*cm:
-                pdf.showPage()
-                y_position = height - 2*cm
-            
-            pdf.setFont(FONT_NAME_BOLD, 9)
-            pdf.drawString(2*cm, y_position, f"{ba.bank_name}")
-            y_position -= 0.4*cm
-            
-            pdf.setFont(FONT_NAME, 9)
-            pdf.drawString(2*cm, y_position, f"Hesap Sahibi: {ba.account_holder}")
-            y_position -= 0.35*cm
-            pdf.drawString(2*cm, y_position, f"IBAN: {ba.iban}")
-            y_position -= 0.35*cm
-            
-            if ba.branch_code or ba.account_number:
-                extra_info = []
-                if ba.branch_code:
-                    extra_info.append(f"Şube: {ba.branch_code}")
-                if ba.account_number:
-                    extra_info.append(f"Hesap No: {ba.account_number}")
-                pdf.drawString(2*cm, y_position, " / ".join(extra_info))
-                y_position -= 0.35*cm
-            
-            y_position -= 0.3*cm
-    
-    # ==================== NOTES SECTION ====================
-    if template.notes:
-        y_position -= 0.5*cm
-        
-        if y_position < 4*cm:
-            pdf.showPage()
-            y_position = height - 2*cm
-        
-        pdf.setFont(FONT_NAME_BOLD, 10)
-        pdf.drawString(2*cm, y_position, "NOTLAR")
-        y_position -= 0.4*cm
-        
-        pdf.setStrokeColor(colors.HexColor("#dee2e6"))
-        pdf.line(2*cm, y_position, width - 2*cm, y_position)
-        y_position -= 0.5*cm
-        
-        pdf.setFont(FONT_NAME, 9)
-        # Handle multi-line notes
-        notes_lines = template.notes.split('\n')
-        for line in notes_lines:
-            if y_position < 2.5*cm:
-                pdf.showPage()
-                y_position = height - 2*cm
-            pdf.drawString(2*cm, y_position, line[:100])
-            y_position -= 0.4*cm
-    
-    # ==================== FOOTER ====================
-    pdf.setFont(FONT_NAME, 8)
-    pdf.setFillColor(colors.HexColor("#6c757d"))
-    pdf.drawString(2*cm, 1.5*cm, template.footer_text)
-    pdf.drawRightString(width - 2*cm, 1.5*cm, f"Sayfa 1")
-    
-    # Footer line
-    pdf.setStrokeColor(colors.HexColor("#dee2e6"))
-    pdf.line(2*cm, 1.8*cm, width - 2*cm, 1.8*cm)
-    
-    pdf.save()
-    buffer.seek(0)
-    
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={
-            "Content-Disposition": f"attachment; filename=teklif_{order['order_number']}.pdf"
-        }
+            from pypdf import PdfReader, PdfWriter
+        except ImportError:
+            raise HTTPException(status_code=501, detail="Birleşik PDF için pypdf paketi kurulu değil")
+
+    orders = await db.orders.find(pdf_batch_query(payload), PDF_ORDER_PROJECTION).sort(ORDER_LIST_SORT).to_list(PDF_BATCH_MAX_ORDERS + 1)
+    if not orders:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if len(orders) > PDF_BATCH_MAX_ORDERS:
+        raise HTTPException(status_code=400, detail=f"Tek seferde en fazla {PDF_BATCH_MAX_ORDERS} sipariş indirilebilir")
+
+    items, settings = await asyncio.gather(
+        db.order_items.find({"order_id": {"$in": [order['id'] for order in orders]}},
+                            {**PDF_ITEM_PROJECTION, "order_id": 1}).to_list(None),
+        pdf_settings_cache.get(),
     )
+    items_by_order: Dict[str, List[Dict[str, Any]]] = {}
+    for item in items:
+        items_by_order.setdefault(item.pop('order_id'), []).append(item)
+
+    async def render(order: Dict[str, Any]) -> bytes:
+        order_items = items_by_order.get(order['id'], [])
+        key = pdf_cache_key(order, order_items, settings.version)
+        while True:
+            try:
+                return await cached_order_pdf(key, order, order_items, settings)
+            except PdfPoolSaturated:
+                # Single downloads keep their slots; the batch waits for a free one
+                await asyncio.sleep(0.5)
+
+    async def rendered_in_order() -> AsyncIterator[Tuple[Dict[str, Any], bytes]]:
+        remaining = iter(orders)
+        pending: deque = deque(
+            (order, asyncio.ensure_future(render(order)))
+            for order in itertools.islice(remaining, max(1, pdf_render_pool.workers))
+        )
+        try:
+            while pending:
+                order, task = pending.popleft()
+                pdf_bytes = await task
+                next_order = next(remaining, None)
+                if next_order is not None:
+                    pending.append((next_order, asyncio.ensure_future(render(next_order))))
+                yield order, pdf_bytes
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%d')
+
+    if payload.format == "pdf":
+        async def merged() -> AsyncIterator[bytes]:
+            # The cross-reference table closes a PDF, so the merged file is written once complete
+            # Parsing, merging and serializing are CPU-bound pypdf work: keep it off the event loop
+            writer = PdfWriter()
+
+            def append(pdf_bytes: bytes):
+                writer.append(PdfReader(io.BytesIO(pdf_bytes)))
+
+            async for _, pdf_bytes in rendered_in_order():
+                await run_in_threadpool(append, pdf_bytes)
+            out = io.BytesIO()
+            await run_in_threadpool(writer.write, out)
+            out.seek(0)
+            while chunk := out.read(ATTACHMENT_CHUNK_SIZE):
+                yield chunk
+
+        return StreamingResponse(merged(), media_type="application/pdf", headers={
+            "Content-Disposition": f"attachment; filename=teklifler_{stamp}.pdf"
+        })
+
+    async def zipped() -> AsyncIterator[bytes]:
+        sink = ZipStreamBuffer()
+        # PDFs are already compressed; storing them only costs a CRC pass on the event loop
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+            async for order, pdf_bytes in rendered_in_order():
+                archive.writestr(f"teklif_{order['order_number']}.pdf", pdf_bytes)
+                yield sink.drain()
+        yield sink.drain()
+
+    return StreamingResponse(zipped(), media_type="application/zip", headers={
+        "Content-Disposition": f"attachment; filename=teklifler_{stamp}.zip"
+    })
 
 # ==================== BANK ACCOUNT ENDPOINTS ====================
 
@@ -1290,6 +2507,7 @@ async def create_bank_account(account_data: BankAccountCreate, current_user: Use
     account = BankAccount(**account_data.model_dump())
     doc = account.model_dump()
     await db.bank_accounts.insert_one(doc)
+    await pdf_settings_cache.invalidate()
     return account
 
 @api_router.put("/settings/bank-accounts/{account_id}", response_model=BankAccount)
@@ -1298,14 +2516,11 @@ async def update_bank_account(account_id: str, account_data: BankAccountCreate,
     if current_user.role != UserRole.ADMIN:
         raise HTTPException(status_code=403, detail="Only admin can manage bank accounts")
     
-    existing = await db.bank_accounts.find_one({"id": account_id}, {"_id": 0})
-    if not existing:
-        raise HTTPException(status_code=404, detail="Bank account not found")
-    
     update_data = account_data.model_dump()
-    await db.bank_accounts.update_one({"id": account_id}, {"$set": update_data})
-    
-    updated = await db.bank_accounts.find_one({"id": account_id}, {"_id": 0})
+    updated = await update_and_fetch(db.bank_accounts, {"id": account_id}, {"$set": update_data})
+    if not updated:
+        raise HTTPException(status_code=404, detail="Bank account not found")
+    await pdf_settings_cache.invalidate()
     return BankAccount(**updated)
 
 @api_router.delete("/settings/bank-accounts/{account_id}")
@@ -1317,13 +2532,64 @@ async def delete_bank_account(account_id: str, current_user: User = Depends(get_
     result = await db.bank_accounts.delete_one({"id": account_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Bank account not found")
+    await pdf_settings_cache.invalidate()
     return {"message": "Bank account deleted successfully"}
 
 # ==================== LOGO UPLOAD ENDPOINT ====================
 
+# The PDF draws the logo into a 120x60pt box; 300 DPI keeps it sharp in print
+LOGO_BOX_POINTS = (120, 60)
+LOGO_DPI = 300
+
+def normalize_logo(contents: bytes) -> bytes:
+    """Downscale a logo to the PDF logo box and re-encode it without metadata.
+
+    Transparent logos become an optimized PNG; opaque ones whichever of PNG and JPEG is
+    smaller. Raises ValueError if the upload is not a readable image.
+    """
+    box = tuple(round(points / 72 * LOGO_DPI) for points in LOGO_BOX_POINTS)
+    try:
+        with Image.open(io.BytesIO(contents)) as image:
+            image.draft('RGB', box)  # JPEGs decode straight at a reduced scale
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail(box, Image.LANCZOS)
+            transparent = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+            image = image.convert('RGBA' if transparent else 'RGB')
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise ValueError(str(e)) from e
+
+    # A fresh save carries no EXIF, ICC or text chunks from the upload
+    encoded = []
+    png = io.BytesIO()
+    image.save(png, format='PNG', optimize=True)
+    encoded.append(png.getvalue())
+    if not transparent:
+        jpeg = io.BytesIO()
+        image.save(jpeg, format='JPEG', quality=90, optimize=True)
+        encoded.append(jpeg.getvalue())
+    return min(encoded, key=len)
+
+def logo_fields(logo: bytes) -> Dict[str, str]:
+    return {"logo_base64": base64.b64encode(logo).decode('utf-8'), "logo_sha256": hashlib.sha256(logo).hexdigest()}
+
+@migration("normalize_logo")
+async def normalize_stored_logo():
+    """Downscale a logo uploaded before normalize_logo existed"""
+    settings = await db.pdf_settings.find_one({"id": "pdf_template_settings", "logo_base64": {"$nin": [None, ""]}},
+                                              {"_id": 0, "logo_base64": 1})
+    if not settings:
+        return
+    try:
+        logo = await run_in_threadpool(normalize_logo, base64.b64decode(settings['logo_base64']))
+    except ValueError as e:
+        logger.warning(f"Stored logo could not be normalized: {e}")
+        return
+    await db.pdf_settings.update_one({"id": "pdf_template_settings"}, {"$set": logo_fields(logo)})
+    await pdf_settings_cache.invalidate()
+
 @api_router.post("/settings/upload-logo")
 async def upload_logo(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
-    """Upload company logo for PDF"""
+    """Upload company logo for PDF, downscaled to the size it is printed at"""
     if current_user.role != UserRole.ADMIN:
         raise HTTPException(status_code=403, detail="Only admin can upload logo")
     
@@ -1332,14 +2598,17 @@ async def upload_logo(file: UploadFile = File(...), current_user: User = Depends
     if file.content_type not in allowed_types:
         raise HTTPException(status_code=400, detail="Invalid file type. Allowed: PNG, JPEG, GIF, WEBP")
     
-    # Read and encode to base64
     contents = await file.read()
     
     # Limit file size (max 500KB)
     if len(contents) > 500 * 1024:
         raise HTTPException(status_code=400, detail="File too large. Max 500KB allowed")
     
-    logo_base64 = base64.b64encode(contents).decode('utf-8')
+    try:
+        logo = await run_in_threadpool(normalize_logo, contents)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid image file")
+    fields = logo_fields(logo)
     
     # Update PDF settings with logo
     existing = await db.pdf_settings.find_one({"id": "pdf_template_settings"}, {"_id": 0})
@@ -1347,126 +2616,1123 @@ async def upload_logo(file: UploadFile = File(...), current_user: User = Depends
     if existing:
         await db.pdf_settings.update_one(
             {"id": "pdf_template_settings"},
-            {"$set": {"logo_base64": logo_base64, "updated_at": datetime.now(timezone.utc).isoformat()}}
+            {"$set": {**fields, "updated_at": datetime.now(timezone.utc).isoformat()}}
         )
     else:
-        template = PDFTemplateSettings(logo_base64=logo_base64)
+        template = PDFTemplateSettings(**fields)
         doc = template.model_dump()
         doc['updated_at'] = doc['updated_at'].isoformat()
         await db.pdf_settings.insert_one(doc)
+    await pdf_settings_cache.invalidate()
     
-    return {"message": "Logo uploaded successfully"}
+    return {"message": "Logo uploaded successfully", "logo_sha256": fields["logo_sha256"]}
 
-@api_router.post("/products/upload-csv")
-async def upload_products_csv(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
-    """Upload products from CSV file. Supports both comma (,) and semicolon (;) delimiters."""
-    
-    contents = await file.read()
-    csv_text = contents.decode('utf-8-sig')  # Handle BOM
-    
-    # Auto-detect delimiter (semicolon or comma)
-    first_line = csv_text.split('\n')[0]
-    delimiter = ';' if ';' in first_line else ','
-    
-    logger.info(f"CSV Upload - Detected delimiter: '{delimiter}'")
-    
-    csv_reader = csv.DictReader(io.StringIO(csv_text), delimiter=delimiter)
+# ==================== BACKGROUND JOBS ====================
+
+JOB_STORAGE_DIR = Path(os.environ.get('JOB_STORAGE_DIR', str(ROOT_DIR / 'uploads' / 'jobs')))
+JOB_STALE_SECONDS = 60  # a running job without a heartbeat for this long is considered orphaned
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+class JobStatus:
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+class Job(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    type: str
+    status: str = JobStatus.QUEUED
+    file_name: Optional[str] = None
+    params: Dict[str, Any] = {}
+    created_by: str
+    created_by_name: str
+    rows_processed: int = 0
+    products_added: int = 0
+    products_updated: int = 0
+    products_unchanged: int = 0
+    products_deactivated: int = 0
+    errors: List[str] = []
+    total_errors: int = 0
+    rows_per_second: float = 0.0
+    cancel_requested: bool = False
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class JobCancelled(Exception):
+    pass
+
+class JobLost(Exception):
+    """The job is no longer running under this worker (finished, or claimed by another)"""
+
+class JobRunner:
+    """In-process runner for long jobs whose state lives in the `jobs` collection.
+
+    While a handler runs, its worker heartbeats every JOB_STALE_SECONDS / 3 (progress writes
+    count too); a job whose worker died stops heartbeating and is claimed and resumed by
+    whichever worker notices it first.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, Any] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._watch_task: Optional[asyncio.Task] = None
+
+    def handler(self, job_type: str):
+        def register(fn):
+            self._handlers[job_type] = fn
+            return fn
+        return register
+
+    async def submit(self, job: Job, file_path: Optional[Path] = None) -> Job:
+        doc = job.model_dump()
+        doc['file_path'] = str(file_path) if file_path else None
+        for key in ('created_at', 'updated_at'):
+            doc[key] = doc[key].isoformat()
+        # Left unset rather than null so the claim's $min can fill started_at in
+        doc.pop('started_at', None)
+        doc.pop('finished_at', None)
+        await db.jobs.insert_one(doc)
+        await self._claim_and_start(job.id)
+        return job
+
+    async def _claim_and_start(self, job_id: str, stale_before: Optional[str] = None):
+        now = datetime.now(timezone.utc).isoformat()
+        claimable = [{"status": JobStatus.QUEUED}]
+        if stale_before:
+            claimable.append({"status": JobStatus.RUNNING, "heartbeat_at": {"$lt": stale_before}})
+        job_doc = await db.jobs.find_one_and_update(
+            {"id": job_id, "$or": claimable},
+            {"$set": {"status": JobStatus.RUNNING, "worker_id": WORKER_ID, "heartbeat_at": now, "updated_at": now},
+             "$min": {"started_at": now}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if job_doc:
+            self._tasks[job_id] = asyncio.create_task(self._run(job_doc))
+
+    async def progress(self, job_id: str, **fields):
+        """Persist progress; raises JobCancelled once a cancel was requested (from any worker)
+        and JobLost when another worker has taken the job over"""
+        now = datetime.now(timezone.utc).isoformat()
+        job_doc = await db.jobs.find_one_and_update(
+            {"id": job_id, "status": JobStatus.RUNNING, "worker_id": WORKER_ID},
+            {"$set": {**fields, "heartbeat_at": now, "updated_at": now}},
+            projection={"_id": 0, "cancel_requested": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if job_doc is None:
+            raise JobLost()
+        if job_doc.get('cancel_requested'):
+            raise JobCancelled()
+
+    async def _heartbeat(self, job_id: str):
+        """Keep the job claimed however long the handler goes between progress writes"""
+        while True:
+            await asyncio.sleep(JOB_STALE_SECONDS / 3)
+            now = datetime.now(timezone.utc).isoformat()
+            try:
+                await db.jobs.update_one(
+                    {"id": job_id, "status": JobStatus.RUNNING, "worker_id": WORKER_ID},
+                    {"$set": {"heartbeat_at": now}}
+                )
+            except Exception as e:
+                logger.error(f"Job {job_id} heartbeat error: {e}")
+
+    async def _finish(self, job_id: str, status: str, **fields):
+        now = datetime.now(timezone.utc).isoformat()
+        result = await db.jobs.update_one(
+            {"id": job_id, "status": JobStatus.RUNNING, "worker_id": WORKER_ID},
+            {"$set": {**fields, "status": status, "finished_at": now, "updated_at": now}}
+        )
+        if not result.matched_count:
+            logger.warning(f"Job {job_id} was taken over by another worker, {status} not recorded")
+
+    async def _run(self, job_doc: Dict[str, Any]):
+        job_id = job_doc['id']
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            try:
+                await self._handlers[job_doc['type']](job_doc)
+            finally:
+                heartbeat.cancel()
+            await self._finish(job_id, JobStatus.COMPLETED)
+        except JobCancelled:
+            await self._finish(job_id, JobStatus.CANCELLED)
+        except JobLost:
+            # The new owner resumes from the persisted progress and still needs the upload
+            logger.warning(f"Job {job_id} was taken over by another worker, stopping")
+            return
+        except asyncio.CancelledError:
+            # Worker shutting down: leave the job running so another worker resumes it
+            raise
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            await self._finish(job_id, JobStatus.FAILED, error=str(e))
+        finally:
+            self._tasks.pop(job_id, None)
+        if job_doc.get('file_path'):
+            Path(job_doc['file_path']).unlink(missing_ok=True)
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        now = datetime.now(timezone.utc).isoformat()
+        # Not yet claimed: cancel right away; running: the job stops at its next progress write
+        await db.jobs.update_one(
+            {"id": job_id, "status": JobStatus.QUEUED},
+            {"$set": {"status": JobStatus.CANCELLED, "finished_at": now}}
+        )
+        return await db.jobs.find_one_and_update(
+            {"id": job_id},
+            {"$set": {"cancel_requested": True, "updated_at": now}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def resume_orphaned(self):
+        stale_before = (datetime.now(timezone.utc) - timedelta(seconds=JOB_STALE_SECONDS)).isoformat()
+        cursor = db.jobs.find(
+            {"$or": [
+                {"status": JobStatus.QUEUED},
+                {"status": JobStatus.RUNNING, "heartbeat_at": {"$lt": stale_before}},
+            ]},
+            {"_id": 0, "id": 1}
+        )
+        async for job_doc in cursor:
+            if job_doc['id'] not in self._tasks:
+                logger.info(f"Resuming orphaned job {job_doc['id']}")
+                await self._claim_and_start(job_doc['id'], stale_before)
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(JOB_STALE_SECONDS)
+            try:
+                await self.resume_orphaned()
+            except Exception as e:
+                logger.error(f"Job watcher error: {e}")
+
+    async def start(self):
+        JOB_STORAGE_DIR.mkdir(parents=True, exist_ok=True)
+        await self.resume_orphaned()
+        self._watch_task = asyncio.create_task(self._watch())
+
+    def stop(self):
+        for task in [self._watch_task, *self._tasks.values()]:
+            if task:
+                task.cancel()
+        self._watch_task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"worker_id": WORKER_ID, "running": sorted(self._tasks)}
+
+job_runner = JobRunner()
+
+def parse_job_dates(job_doc: Dict[str, Any]) -> Dict[str, Any]:
+    for key in ('created_at', 'started_at', 'finished_at', 'updated_at'):
+        if isinstance(job_doc.get(key), str):
+            job_doc[key] = datetime.fromisoformat(job_doc[key])
+    return job_doc
+
+@api_router.get("/jobs/{job_id}", response_model=Job)
+async def get_job(job_id: str, current_user: User = Depends(get_current_user)):
+    job_doc = await db.jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job_doc:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if current_user.role != UserRole.ADMIN and job_doc.get('created_by') != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return Job(**parse_job_dates(job_doc))
+
+@api_router.post("/jobs/{job_id}/cancel", response_model=Job)
+async def cancel_job(job_id: str, current_user: User = Depends(get_current_user)):
+    job_doc = await db.jobs.find_one({"id": job_id}, {"_id": 0, "created_by": 1, "status": 1})
+    if not job_doc:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if current_user.role != UserRole.ADMIN and job_doc.get('created_by') != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if job_doc['status'] not in (JobStatus.QUEUED, JobStatus.RUNNING):
+        raise HTTPException(status_code=400, detail="Job is already finished")
+    return Job(**parse_job_dates(await job_runner.cancel(job_id)))
+
+# ==================== PRODUCT CSV IMPORT ====================
+
+CSV_IMPORT_BATCH_SIZE = int(os.environ.get('CSV_IMPORT_BATCH_SIZE', '1000'))
+CSV_IMPORT_MAX_BATCH_SIZE = 5000
+
+def parse_product_csv_row(row: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """Map a CSV row (Turkish or English headers) to product fields, None if it has no name"""
+    product_name = (
+        row.get('Ürün Adı') or 
+        row.get('Urun Adi') or 
+        row.get('Product Name') or 
+        ''
+    ).strip()
+    
+    # Skip rows without product name
+    if not product_name:
+        return None
+    
+    # Parse product_id safely
+    product_id_raw = row.get('Ürün İd') or row.get('Ürün Id') or row.get('Urun Id') or row.get('Product Id') or ''
+    try:
+        product_id = int(product_id_raw) if product_id_raw and str(product_id_raw).strip() else None
+    except (ValueError, TypeError):
+        product_id = None
     
-    products_added = 0
-    products_updated = 0
-    errors = []
+    # Parse stock safely
+    stock_raw = row.get('Stok') or row.get('Stock') or '0'
+    try:
+        stock = int(float(stock_raw)) if stock_raw and str(stock_raw).strip() else 0
+    except (ValueError, TypeError):
+        stock = 0
     
-    for row_num, row in enumerate(csv_reader, start=2):  # start=2 because row 1 is header
+    return {
+        "product_id": product_id,
+        "web_service_code": (row.get('Web Servis Kodu') or row.get('Web Service Code') or '').strip(),
+        "product_name": product_name,
+        "supplier_product_code": (row.get('Tedarikçi Ürün Kodu') or row.get('Tedarikci Urun Kodu') or row.get('Supplier Product Code') or '').strip(),
+        "barcode": (row.get('Barkod') or row.get('Barcode') or '').strip(),
+        "stock": stock,
+        "stock_unit": (row.get('Stok Birimi') or row.get('Stock Unit') or 'Adet').strip(),
+        "is_active": str(row.get('Aktif') or row.get('Active') or 'true').lower() in ['true', '1', 'yes', 'evet'],
+        "brand": (row.get('Marka') or row.get('Brand') or '').strip(),
+        "supplier": (row.get('Tedarikçi') or row.get('Tedarikci') or row.get('Supplier') or '').strip()
+    }
+
+def iter_csv_rows(binary_file) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """Stream (row number, row) pairs from an uploaded CSV without loading it into memory.
+    Supports both comma (,) and semicolon (;) delimiters."""
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')  # Handle BOM
+    try:
+        first_line = text.readline()
+        delimiter = ';' if ';' in first_line else ','
+        logger.info(f"CSV Upload - Detected delimiter: '{delimiter}'")
+        reader = csv.DictReader(itertools.chain([first_line], text), delimiter=delimiter)
+        yield from enumerate(reader, start=2)  # start=2 because row 1 is header
+    finally:
+        # Leave the upload's own file object open for its owner
+        text.detach()
+
+# Fields written by the CSV import; their hash tells whether a re-import changes anything
+PRODUCT_HASH_FIELDS = ['product_id', 'web_service_code', 'product_name', 'supplier_product_code',
+                       'barcode', 'stock', 'stock_unit', 'is_active', 'brand', 'supplier']
+MANUAL_PRODUCT_CODE_PREFIX = "KodsuzA"
+
+def product_content_hash(product_data: Dict[str, Any]) -> str:
+    payload = json.dumps([product_data.get(f) for f in PRODUCT_HASH_FIELDS], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+class ProductCsvImport:
+    """Batched upsert of CSV rows keyed on web_service_code with unordered bulk_write.
+
+    Rows whose content_hash matches the stored product are skipped, so a daily full-catalog
+    re-import only writes what actually changed. With dry_run nothing is written at all.
+    """
+
+    def __init__(self, batch_size: int = CSV_IMPORT_BATCH_SIZE, on_flush=None,
+                 deactivate_missing: bool = False, dry_run: bool = False):
+        self.batch_size = max(1, batch_size)
+        self.on_flush = on_flush  # async callback(importer) after every written batch
+        self.deactivate_missing = deactivate_missing
+        self.dry_run = dry_run
+        self.products_added = 0
+        self.products_updated = 0
+        self.products_unchanged = 0
+        self.products_deactivated = 0
+        self.rows_processed = 0
+        self.errors: List[str] = []  # first 10 only, memory stays flat
+        self.total_errors = 0
+        self._pending: Dict[str, Tuple[int, Dict[str, Any], str]] = {}
+        self._new_docs: List[Tuple[int, Dict[str, Any]]] = []
+        self._seen_codes: set = set()
+        self._counted_codes: set = set()  # dry_run: a code repeated in the file is one product
+
+    def add_error(self, row_num: Optional[int], error: Any):
+        self.total_errors += 1
+        if len(self.errors) < 10:
+            self.errors.append(f"Satır {row_num}: {error}" if row_num else str(error))
+        logger.error(f"CSV row {row_num} error: {error}")
+
+    def mark_seen(self, row: Dict[str, str]):
+        """Record a row's code without importing it (rows already written before a resume)"""
         try:
-            # Map CSV columns (Turkish) to our model - handle both Turkish and non-Turkish column names
-            product_name = (
-                row.get('Ürün Adı') or 
-                row.get('Urun Adi') or 
-                row.get('Product Name') or 
-                ''
-            ).strip()
-            
-            # Skip rows without product name
-            if not product_name:
+            product_data = parse_product_csv_row(row)
+        except Exception:
+            return
+        if product_data and product_data['web_service_code']:
+            self._seen_codes.add(product_data['web_service_code'])
+
+    async def add_row(self, row_num: int, row: Dict[str, str]):
+        # rows_processed only counts rows whose writes are queued, so after a flush
+        # it is exactly the number of rows a resumed import may skip
+        try:
+            product_data = parse_product_csv_row(row)
+        except Exception as e:
+            self.add_error(row_num, e)
+            self.rows_processed += 1
+            return
+        if product_data is None:
+            self.rows_processed += 1
+            return
+
+        content_hash = product_content_hash(product_data)
+        code = product_data['web_service_code']
+        if code:
+            # The same code twice in one batch would race inside the unordered bulk
+            if code in self._pending:
+                await self.flush()
+            self._seen_codes.add(code)
+            self._pending[code] = (row_num, product_data, content_hash)
+        else:
+            # Without a code the row can't be matched, always a new product
+            doc = Product(**product_data).model_dump()
+            doc['created_at'] = doc['created_at'].isoformat()
+            doc['content_hash'] = content_hash
+            self._new_docs.append((row_num, doc))
+        self.rows_processed += 1
+
+        if len(self._pending) + len(self._new_docs) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        pending, new_docs = self._pending, self._new_docs
+        self._pending, self._new_docs = {}, []
+
+        stored_hashes: Dict[str, Optional[str]] = {}
+        if pending:
+            cursor = db.products.find(
+                {"web_service_code": {"$in": list(pending)}},
+                {"_id": 0, "web_service_code": 1, "content_hash": 1}
+            )
+            async for doc in cursor:
+                stored_hashes[doc['web_service_code']] = doc.get('content_hash')
+
+        ops: List[Any] = []
+        row_nums: List[int] = []
+        changed_codes: List[str] = []
+        for code, (row_num, product_data, content_hash) in pending.items():
+            if self.dry_run:
+                if code in self._counted_codes:
+                    continue
+                self._counted_codes.add(code)
+            if code in stored_hashes:
+                if stored_hashes[code] == content_hash:
+                    self.products_unchanged += 1
+                    continue
+                if self.dry_run:
+                    self.products_updated += 1
+                    continue
+            elif self.dry_run:
+                self.products_added += 1
                 continue
-            
-            # Parse product_id safely
-            product_id_raw = row.get('Ürün İd') or row.get('Ürün Id') or row.get('Urun Id') or row.get('Product Id') or ''
+            ops.append(UpdateOne(
+                {"web_service_code": code},
+                {
+                    "$set": {**product_data, "content_hash": content_hash},
+                    "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": datetime.now(timezone.utc).isoformat()},
+                },
+                upsert=True
+            ))
+            row_nums.append(row_num)
+            changed_codes.append(code)
+        if self.dry_run:
+            self.products_added += len(new_docs)
+        else:
+            for row_num, doc in new_docs:
+                ops.append(InsertOne(doc))
+                row_nums.append(row_num)
+
+        if ops:
             try:
-                product_id = int(product_id_raw) if product_id_raw and str(product_id_raw).strip() else None
-            except (ValueError, TypeError):
-                product_id = None
-            
-            # Parse stock safely
-            stock_raw = row.get('Stok') or row.get('Stock') or '0'
+                result = (await db.products.bulk_write(ops, ordered=False)).bulk_api_result
+            except BulkWriteError as e:
+                result = e.details
+                for write_error in result.get('writeErrors', []):
+                    self.add_error(row_nums[write_error['index']], write_error.get('errmsg'))
+            self.products_added += result.get('nUpserted', 0) + result.get('nInserted', 0)
+            self.products_updated += result.get('nMatched', 0)
+
+            # Keep the search index in step with what was written
+            for _, doc in new_docs:
+                product_search_index.upsert(doc)
+            if changed_codes:
+                projection = {"_id": 0, "id": 1, **{f: 1 for f in PRODUCT_SEARCH_FIELDS}}
+                async for doc in db.products.find({"web_service_code": {"$in": changed_codes}}, projection):
+                    product_search_index.upsert(doc)
+
+        if self.on_flush:
+            await self.on_flush(self)
+
+    async def finish(self):
+        """Flush the last batch, then deactivate (or with dry_run count) products missing from the file"""
+        await self.flush()
+        if not (self.deactivate_missing or self.dry_run):
+            return
+        if not self._seen_codes:
+            # A file without a single code (wrong headers, empty export) must not switch off the catalog
+            self.add_error(None, "Dosyada ürün kodu bulunamadı, eksik ürünler pasifleştirilmedi")
+            return
+
+        missing: List[str] = []
+        cursor = db.products.find(
+            {"is_active": True, "web_service_code": {"$nin": ["", None]}},
+            {"_id": 0, "id": 1, "web_service_code": 1}
+        )
+        async for doc in cursor:
+            code = doc['web_service_code']
+            # Manually created products never come from the supplier file
+            if code not in self._seen_codes and not code.startswith(MANUAL_PRODUCT_CODE_PREFIX):
+                missing.append(doc['id'])
+
+        if self.dry_run:
+            self.products_deactivated = len(missing)
+            return
+        for start in range(0, len(missing), self.batch_size):
+            result = await db.products.update_many(
+                {"id": {"$in": missing[start:start + self.batch_size]}, "is_active": True},
+                {"$set": {"is_active": False}, "$unset": {"content_hash": ""}}
+            )
+            self.products_deactivated += result.modified_count
+        if self.on_flush:
+            await self.on_flush(self)
+
+    def result(self) -> Dict[str, Any]:
+        result = {
+            "message": "CSV yükleme tamamlandı",
+            "products_added": self.products_added,
+            "products_updated": self.products_updated,
+            "products_unchanged": self.products_unchanged,
+            "products_deactivated": self.products_deactivated,
+            "total": self.products_added + self.products_updated
+        }
+        if self.errors:
+            result["errors"] = self.errors  # Return first 10 errors only
+            result["total_errors"] = self.total_errors
+        return result
+
+async def import_products_csv(binary_file, batch_size: int = CSV_IMPORT_BATCH_SIZE,
+                              importer: Optional[ProductCsvImport] = None) -> Dict[str, Any]:
+    """Import a CSV stream; a pre-filled `importer` resumes after its rows_processed rows"""
+    importer = importer or ProductCsvImport(batch_size)
+    skip_rows = importer.rows_processed
+    try:
+        for row_num, row in iter_csv_rows(binary_file):
+            if row_num - 2 < skip_rows:
+                importer.mark_seen(row)
+                continue
+            await importer.add_row(row_num, row)
+        await importer.finish()
+    finally:
+        # Products written before a cancel/failure are in the index too
+        changed = importer.products_added or importer.products_updated or importer.products_deactivated
+        if changed and not importer.dry_run:
+            await mark_catalog_changed()
+    
+    logger.info(f"CSV Upload completed: {importer.products_added} added, {importer.products_updated} updated, "
+                f"{importer.products_unchanged} unchanged, {importer.products_deactivated} deactivated, {importer.total_errors} errors")
+    return importer.result()
+
+@job_runner.handler("product_csv_import")
+async def run_product_csv_import(job_doc: Dict[str, Any]):
+    job_id = job_doc['id']
+    file_path = job_doc.get('file_path')
+    if not file_path or not Path(file_path).exists():
+        raise RuntimeError("Uploaded file is no longer available")
+
+    started = time.monotonic()
+    resumed_rows = job_doc.get('rows_processed', 0)
+
+    async def report(importer: ProductCsvImport):
+        elapsed = time.monotonic() - started
+        await job_runner.progress(
+            job_id,
+            rows_processed=importer.rows_processed,
+            products_added=importer.products_added,
+            products_updated=importer.products_updated,
+            products_unchanged=importer.products_unchanged,
+            products_deactivated=importer.products_deactivated,
+            errors=importer.errors,
+            total_errors=importer.total_errors,
+            rows_per_second=round((importer.rows_processed - resumed_rows) / elapsed, 1) if elapsed else 0.0,
+        )
+
+    # Continue from the last persisted batch when a previous worker died mid-import
+    params = job_doc.get('params', {})
+    importer = ProductCsvImport(
+        params.get('batch_size', CSV_IMPORT_BATCH_SIZE),
+        on_flush=report,
+        deactivate_missing=params.get('deactivate_missing', False),
+    )
+    importer.rows_processed = resumed_rows
+    importer.products_added = job_doc.get('products_added', 0)
+    importer.products_updated = job_doc.get('products_updated', 0)
+    importer.products_unchanged = job_doc.get('products_unchanged', 0)
+    importer.products_deactivated = job_doc.get('products_deactivated', 0)
+    importer.errors = job_doc.get('errors', [])
+    importer.total_errors = job_doc.get('total_errors', 0)
+
+    with open(file_path, 'rb') as f:
+        await import_products_csv(f, importer=importer)
+
+@api_router.post("/products/upload-csv", response_model=Job, status_code=202)
+async def upload_products_csv(
+    file: UploadFile = File(...),
+    batch_size: int = Query(CSV_IMPORT_BATCH_SIZE, ge=1, le=CSV_IMPORT_MAX_BATCH_SIZE),
+    deactivate_missing: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """Upload products from CSV file. Supports both comma (,) and semicolon (;) delimiters.
+    The import runs in the background; poll GET /api/jobs/{id} for progress.
+    With deactivate_missing, active products whose code is not in the file are deactivated."""
+    job = Job(
+        type="product_csv_import",
+        file_name=file.filename,
+        params={"batch_size": batch_size, "deactivate_missing": deactivate_missing},
+        created_by=current_user.id,
+        created_by_name=current_user.full_name,
+    )
+    file_path = JOB_STORAGE_DIR / f"{job.id}.csv"
+    JOB_STORAGE_DIR.mkdir(parents=True, exist_ok=True)
+
+    def store_upload():
+        with open(file_path, 'wb') as out:
+            shutil.copyfileobj(file.file, out, 1024 * 1024)
+
+    await run_in_threadpool(store_upload)
+    return await job_runner.submit(job, file_path)
+
+@api_router.post("/products/upload-csv/dry-run")
+async def dry_run_products_csv(
+    file: UploadFile = File(...),
+    batch_size: int = Query(CSV_IMPORT_BATCH_SIZE, ge=1, le=CSV_IMPORT_MAX_BATCH_SIZE),
+    current_user: User = Depends(get_current_user)
+):
+    """Compare a CSV file with the catalog without writing anything"""
+    importer = ProductCsvImport(batch_size, dry_run=True)
+    await import_products_csv(file.file, importer=importer)
+    result = {
+        "added": importer.products_added,
+        "changed": importer.products_updated,
+        "unchanged": importer.products_unchanged,
+        "removed": importer.products_deactivated,
+    }
+    if importer.errors:
+        result["errors"] = importer.errors
+        result["total_errors"] = importer.total_errors
+    return result
+
+# ==================== DASHBOARD COUNTERS ====================
+
+# Dashboard totals are kept in one document, updated with $inc by the order / order item
+# writes whenever a tracked field changes; a periodic recount fixes any drift
+# (crashed requests, writes made outside the API).
+DASHBOARD_COUNTERS_ID = "dashboard"
+DASHBOARD_RECONCILE_SECONDS = int(os.environ.get('DASHBOARD_RECONCILE_SECONDS', '600'))
+
+def counter_key(value: Any) -> str:
+    """Counter field name for a dimension value (no dots or leading $ in Mongo paths)"""
+    return "none" if value is None else str(value).replace('.', '_').lstrip('$') or "empty"
+
+def order_counter_fields(order: Optional[Dict[str, Any]]) -> set:
+    if not order:
+        return set()
+    general_status = order.get('general_status')
+    is_open = general_status != OrderStatus.COMPLETED
+    fields = {
+        "total_orders",
+        f"general_status.{counter_key(general_status)}",
+        f"invoice_status.{counter_key(order.get('invoice_status'))}",
+    }
+    if (order.get('delivery_method') == DeliveryMethod.CARGO
+            and order.get('cargo_barcode_status') == CargoBarcodeStatus.NOT_PRINTED and is_open):
+        fields.add("cargo_barcode_not_printed")
+    if order.get('assigned_user_id') and is_open:
+        fields.add(f"assigned_open.{counter_key(order['assigned_user_id'])}")
+    return fields
+
+def item_counter_fields(item: Optional[Dict[str, Any]]) -> set:
+    return {f"item_status.{counter_key(item.get('item_status'))}"} if item else set()
+
+def counter_deltas(old_fields: set, new_fields: set) -> Dict[str, int]:
+    deltas = {field: -1 for field in old_fields - new_fields}
+    deltas.update({field: 1 for field in new_fields - old_fields})
+    return deltas
+
+class DashboardCounters:
+    def __init__(self, reconcile_seconds: int):
+        self.reconcile_seconds = reconcile_seconds
+        self.reconciliations = 0
+        self.drift_corrections = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def apply(self, deltas: Dict[str, int]):
+        if deltas:
+            await db.dashboard_counters.update_one({"_id": DASHBOARD_COUNTERS_ID}, {"$inc": deltas}, upsert=True)
+
+    async def order_changed(self, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]):
+        await self.apply(counter_deltas(order_counter_fields(old), order_counter_fields(new)))
+
+    async def item_changed(self, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]):
+        await self.apply(counter_deltas(item_counter_fields(old), item_counter_fields(new)))
+
+    async def read(self) -> Dict[str, Any]:
+        doc = await db.dashboard_counters.find_one({"_id": DASHBOARD_COUNTERS_ID})
+        return doc if doc is not None else await self.reconcile()
+
+    async def count(self) -> Dict[str, Any]:
+        """Recount everything from the collections"""
+        def grouped(field: str, match: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+            return [*([{"$match": match}] if match else []), {"$group": {"_id": f"${field}", "n": {"$sum": 1}}}]
+
+        open_match = {"general_status": {"$ne": OrderStatus.COMPLETED}}
+        facets, item_rows = await asyncio.gather(
+            db.orders.aggregate([{"$facet": {
+                "total_orders": [{"$count": "n"}],
+                "general_status": grouped("general_status"),
+                "invoice_status": grouped("invoice_status"),
+                "cargo_barcode_not_printed": [{"$match": {
+                    **open_match,
+                    "delivery_method": DeliveryMethod.CARGO,
+                    "cargo_barcode_status": CargoBarcodeStatus.NOT_PRINTED,
+                }}, {"$count": "n"}],
+                "assigned_open": grouped("assigned_user_id", {**open_match, "assigned_user_id": {"$nin": [None, ""]}}),
+            }}]).to_list(1),
+            db.order_items.aggregate(grouped("item_status")).to_list(None),
+        )
+        facets = facets[0] if facets else {}
+
+        def total(name: str) -> int:
+            rows = facets.get(name) or []
+            return rows[0]["n"] if rows else 0
+
+        def by_key(rows: List[Dict[str, Any]]) -> Dict[str, int]:
+            counts: Dict[str, int] = {}
+            for row in rows:
+                counts[counter_key(row["_id"])] = counts.get(counter_key(row["_id"]), 0) + row["n"]
+            return counts
+
+        return {
+            "total_orders": total("total_orders"),
+            "general_status": by_key(facets.get("general_status", [])),
+            "invoice_status": by_key(facets.get("invoice_status", [])),
+            "cargo_barcode_not_printed": total("cargo_barcode_not_printed"),
+            "assigned_open": by_key(facets.get("assigned_open", [])),
+            "item_status": by_key(item_rows),
+        }
+
+    async def reconcile(self) -> Dict[str, Any]:
+        counts = await self.count()
+        previous = await db.dashboard_counters.find_one_and_replace(
+            {"_id": DASHBOARD_COUNTERS_ID},
+            {**counts, "reconciled_at": datetime.now(timezone.utc).isoformat()},
+            upsert=True
+        )
+        self.reconciliations += 1
+        if previous is not None:
+            previous = {k: v for k, v in previous.items() if k not in ("_id", "reconciled_at")}
+            # Zero entries left behind by $inc are not drift
+            def normalized(doc):
+                return {k: ({kk: vv for kk, vv in v.items() if vv} if isinstance(v, dict) else v) for k, v in doc.items()}
+            if normalized(previous) != normalized(counts):
+                self.drift_corrections += 1
+                logger.warning("Dashboard counters drifted, corrected by reconciliation")
+        return counts
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.reconcile_seconds)
             try:
-                stock = int(float(stock_raw)) if stock_raw and str(stock_raw).strip() else 0
-            except (ValueError, TypeError):
-                stock = 0
-            
-            product_data = {
-                "product_id": product_id,
-                "web_service_code": (row.get('Web Servis Kodu') or row.get('Web Service Code') or '').strip(),
-                "product_name": product_name,
-                "supplier_product_code": (row.get('Tedarikçi Ürün Kodu') or row.get('Tedarikci Urun Kodu') or row.get('Supplier Product Code') or '').strip(),
-                "barcode": (row.get('Barkod') or row.get('Barcode') or '').strip(),
-                "stock": stock,
-                "stock_unit": (row.get('Stok Birimi') or row.get('Stock Unit') or 'Adet').strip(),
-                "is_active": str(row.get('Aktif') or row.get('Active') or 'true').lower() in ['true', '1', 'yes', 'evet'],
-                "brand": (row.get('Marka') or row.get('Brand') or '').strip(),
-                "supplier": (row.get('Tedarikçi') or row.get('Tedarikci') or row.get('Supplier') or '').strip()
-            }
-            
-            # Check if product exists by web_service_code or product_id
-            existing = None
-            if product_data['web_service_code']:
-                existing = await db.products.find_one({"web_service_code": product_data['web_service_code']}, {"_id": 0})
-            
-            if existing:
-                # Update existing
-                await db.products.update_one(
-                    {"id": existing['id']},
-                    {"$set": product_data}
-                )
-                products_updated += 1
+                await self.reconcile()
+            except Exception as e:
+                logger.error(f"Dashboard counter reconciliation error: {e}")
+
+    async def start(self):
+        await self.reconcile()
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "reconciliations": self.reconciliations,
+            "drift_corrections": self.drift_corrections,
+            "reconcile_seconds": self.reconcile_seconds,
+        }
+
+dashboard_counters = DashboardCounters(DASHBOARD_RECONCILE_SECONDS)
+
+# ==================== ORDER HISTORY ====================
+
+# History entries live in their own append-only collection: writers insert, never rewrite
+# the order, so concurrent edits can't drop each other's entries.
+ORDER_HISTORY_SORT = [("created_at", DESCENDING), ("id", DESCENDING)]
+ORDER_HISTORY_INLINE_LIMIT = 200  # newest entries embedded in GET /orders/{id}
+
+async def append_order_history(order_id: str, entries: List[Dict[str, Any]]):
+    if entries:
+        # Copies, so insert_many's _id doesn't leak into entries returned to the client
+        await db.order_history.insert_many([{**entry, "order_id": order_id} for entry in entries])
+
+async def load_order_history(order_id: str, limit: int = ORDER_HISTORY_INLINE_LIMIT) -> List[Dict[str, Any]]:
+    """Newest `limit` entries, oldest first like the former embedded list"""
+    entries = await db.order_history.find(
+        {"order_id": order_id}, {"_id": 0, "order_id": 0}
+    ).sort(ORDER_HISTORY_SORT).limit(limit).to_list(limit)
+    entries.reverse()
+    return entries
+
+@migration("move_order_history")
+async def move_embedded_order_history(batch_size: int = 200):
+    """Copy embedded order.history arrays into order_history, then drop them from the orders"""
+    moved = 0
+
+    async def move(orders: List[Dict[str, Any]]) -> int:
+        entries = [
+            {**entry, "id": entry.get("id") or str(uuid.uuid4()), "order_id": order["id"]}
+            for order in orders for entry in (order.get("history") or [])
+        ]
+        if entries:
+            try:
+                await db.order_history.insert_many(entries, ordered=False)
+            except BulkWriteError as e:
+                # Entries copied by an interrupted earlier run already exist
+                if any(err.get('code') != 11000 for err in e.details.get('writeErrors', [])):
+                    raise
+        await db.orders.update_many(
+            {"id": {"$in": [order["id"] for order in orders]}},
+            {"$unset": {"history": ""}}
+        )
+        return len(entries)
+
+    batch: List[Dict[str, Any]] = []
+    cursor = db.orders.find({"history": {"$exists": True}}, {"_id": 0, "id": 1, "history": 1}).batch_size(batch_size)
+    async for order in cursor:
+        batch.append(order)
+        if len(batch) >= batch_size:
+            moved += await move(batch)
+            batch = []
+    if batch:
+        moved += await move(batch)
+    logger.info(f"Moved {moved} embedded order history entries")
+
+# ==================== ORDER ATTACHMENTS ====================
+
+# Attachment bytes live in a content-addressed store on local disk; orders keep only
+# metadata ({id, name, type, size, sha256, uploadedAt}). Identical files are stored once.
+ATTACHMENTS_DIR = Path(os.environ.get('ATTACHMENTS_DIR', str(ROOT_DIR / 'uploads' / 'attachments')))
+ATTACHMENT_MAX_BYTES = int(os.environ.get('ATTACHMENT_MAX_BYTES', str(10 * 1024 * 1024)))
+ATTACHMENT_CHUNK_SIZE = 256 * 1024
+ATTACHMENT_GC_GRACE_SECONDS = 3600  # unreferenced blobs younger than this may belong to an upload in flight
+SHA256_HEX = re.compile(r'[0-9a-f]{64}')
+
+def is_sha256(value: Any) -> bool:
+    return isinstance(value, str) and SHA256_HEX.fullmatch(value) is not None
+
+class AttachmentTooLarge(Exception):
+    pass
+
+class BlobStore:
+    """Write-once files at <root>/<sha256[:2]>/<sha256>; the hash doubles as a strong ETag"""
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def path(self, sha256: str) -> Path:
+        # The digest becomes a file name; anything else (e.g. "../..") must never reach the filesystem
+        if not is_sha256(sha256):
+            raise ValueError(f"Invalid blob digest: {sha256!r}")
+        return self.root / sha256[:2] / sha256
+
+    def put_stream(self, source, max_bytes: int = ATTACHMENT_MAX_BYTES) -> Tuple[str, int]:
+        """Copy a binary file object in chunks while hashing it (blocking, run in a thread)"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.root / f".upload-{uuid.uuid4()}"
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as out:
+                while chunk := source.read(ATTACHMENT_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise AttachmentTooLarge()
+                    digest.update(chunk)
+                    out.write(chunk)
+            sha256 = digest.hexdigest()
+            target = self.path(sha256)
+            if target.exists():
+                # Same content already stored: keep the existing file, touch it for the GC grace period
+                os.utime(target)
             else:
-                # Create new
-                product = Product(**product_data)
-                doc = product.model_dump()
-                doc['created_at'] = doc['created_at'].isoformat()
-                await db.products.insert_one(doc)
-                products_added += 1
-                
-        except Exception as e:
-            errors.append(f"Satır {row_num}: {str(e)}")
-            logger.error(f"CSV row {row_num} error: {e}")
-            continue
-    
-    result = {
-        "message": "CSV yükleme tamamlandı",
-        "products_added": products_added,
-        "products_updated": products_updated,
-        "total": products_added + products_updated
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, target)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        return sha256, size
+
+    def put_bytes(self, data: bytes) -> str:
+        return self.put_stream(io.BytesIO(data), max_bytes=len(data))[0]
+
+    def iter_range(self, sha256: str, start: int, end: int) -> Iterator[bytes]:
+        """Yield bytes start..end (inclusive)"""
+        with open(self.path(sha256), 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(ATTACHMENT_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def collect_garbage(self, referenced: set) -> int:
+        removed = 0
+        cutoff = time.time() - ATTACHMENT_GC_GRACE_SECONDS
+        for blob in self.root.glob('??/*'):
+            if blob.name not in referenced and blob.stat().st_mtime < cutoff:
+                blob.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+attachment_store = BlobStore(ATTACHMENTS_DIR)
+
+def attachment_meta(sha256: str, size: int, name: Optional[str], content_type: Optional[str]) -> Dict[str, Any]:
+    return {
+        "id": str(uuid.uuid4()),
+        "name": name or sha256[:12],
+        "type": content_type or "application/octet-stream",
+        "size": size,
+        "sha256": sha256,
+        "uploadedAt": datetime.now(timezone.utc).isoformat(),
     }
-    
-    if errors:
-        result["errors"] = errors[:10]  # Return first 10 errors only
-        result["total_errors"] = len(errors)
-    
-    logger.info(f"CSV Upload completed: {products_added} added, {products_updated} updated, {len(errors)} errors")
-    
+
+async def externalize_attachments(
+    attachments: Optional[List[Dict[str, Any]]],
+    stored: Optional[List[Dict[str, Any]]] = None,
+) -> List[Dict[str, Any]]:
+    """Move inline base64 data URLs (older clients) into the blob store, leaving metadata.
+
+    Blob references (`sha256`/`size`) are never taken from the client: they come from the
+    upload itself or from the attachment with the same id already stored on the order."""
+    stored_blobs = {a['id']: a for a in stored or [] if a.get('id') and is_sha256(a.get('sha256'))}
+    result = []
+    for attachment in attachments or []:
+        attachment = dict(attachment)
+        attachment.pop('sha256', None)
+        attachment.pop('size', None)
+        known = stored_blobs.get(attachment.get('id'))
+        if known:
+            attachment.update(sha256=known['sha256'], size=known.get('size'))
+        data = attachment.get('data')
+        if isinstance(data, str) and data.startswith('data:') and ';base64,' in data[:200]:
+            header, encoded = data.split(',', 1)
+            try:
+                raw = base64.b64decode(encoded)
+            except ValueError:
+                logger.error(f"Attachment {attachment.get('name')} has invalid base64 data, kept inline")
+                result.append(attachment)
+                continue
+            sha256 = await asyncio.to_thread(attachment_store.put_bytes, raw)
+            attachment.pop('data')
+            attachment.update(sha256=sha256, size=len(raw))
+            attachment.setdefault('type', header[5:].split(';')[0] or "application/octet-stream")
+        attachment.setdefault('id', str(uuid.uuid4()))
+        result.append(attachment)
     return result
 
+@migration("externalize_order_attachments")
+async def externalize_inline_attachments(batch_size: int = 50):
+    """Pull inline base64 attachments out of existing orders into the blob store"""
+    moved = 0
+    ops: List[Any] = []
+    cursor = db.orders.find(
+        {"$or": [{"attachments.data": {"$exists": True}}, {"attachments": {"$elemMatch": {"id": {"$exists": False}}}}]},
+        {"_id": 0, "id": 1, "attachments": 1}
+    ).batch_size(batch_size)
+    async for order in cursor:
+        attachments = await externalize_attachments(order.get('attachments'), order.get('attachments'))
+        moved += sum(1 for a in order.get('attachments') or [] if 'data' in a)
+        ops.append(UpdateOne({"id": order['id']}, {"$set": {"attachments": attachments}}))
+        if len(ops) >= batch_size:
+            await db.orders.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await db.orders.bulk_write(ops, ordered=False)
+    logger.info(f"Moved {moved} inline order attachments to {ATTACHMENTS_DIR}")
+
+async def collect_attachment_garbage():
+    """Delete blobs no order references any more (maintenance command)"""
+    referenced = set(await db.orders.distinct("attachments.sha256"))
+    removed = await asyncio.to_thread(attachment_store.collect_garbage, referenced)
+    logger.info(f"Removed {removed} unreferenced attachment blobs")
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+def parse_range_header(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Single `bytes=` range -> (start, end) inclusive.
+
+    None means the header is ignored and the full body sent (RFC 9110 allows that for
+    multi-range and malformed headers); RangeNotSatisfiable for a range past the end.
+    """
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', range_header.strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    if match.group(1):
+        start = int(match.group(1))
+        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    else:
+        # Suffix range: the last N bytes
+        start = max(size - int(match.group(2)), 0)
+        end = size - 1
+    if match.group(1) and match.group(2) and int(match.group(2)) < start:
+        return None  # syntactically invalid (last-pos before first-pos)
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+@api_router.post("/orders/{order_id}/attachments")
+async def upload_order_attachments(
+    order_id: str,
+    files: List[UploadFile] = File(...),
+    current_user: User = Depends(get_current_user)
+):
+    """Sipariş eki yükle (multipart). Aynı içerik diskte bir kez saklanır."""
+    order = await db.orders.find_one({"$or": [{"id": order_id}, {"order_code": order_id}]}, {"_id": 0, "id": 1})
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+
+    metas = []
+    for upload in files:
+        try:
+            sha256, size = await run_in_threadpool(attachment_store.put_stream, upload.file)
+        except AttachmentTooLarge:
+            raise HTTPException(status_code=413, detail=f"{upload.filename} {ATTACHMENT_MAX_BYTES // (1024 * 1024)}MB sınırını aşıyor")
+        metas.append(attachment_meta(sha256, size, upload.filename, upload.content_type))
+
+    await db.orders.update_one(
+        {"id": order['id']},
+        {"$push": {"attachments": {"$each": metas}}, "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}}
+    )
+    return metas
+
+@api_router.get("/orders/{order_id}/attachments/{attachment_id}")
+async def download_order_attachment(order_id: str, attachment_id: str, request: Request, current_user: User = Depends(get_current_user)):
+    """Stream an attachment; supports Range (resumable/partial downloads) and If-None-Match"""
+    order = await db.orders.find_one(
+        {"$or": [{"id": order_id}, {"order_code": order_id}]},
+        {"_id": 0, "attachments": {"$elemMatch": {"id": attachment_id}}}
+    )
+    attachment = (order or {}).get('attachments', [None])[0]
+    if not attachment or not attachment.get('sha256'):
+        raise HTTPException(status_code=404, detail="Attachment not found")
+
+    sha256 = attachment['sha256']
+    if not is_sha256(sha256):
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    path = attachment_store.path(sha256)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Attachment file is missing")
+
+    etag = f'"{sha256}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "Content-Disposition": f"inline; filename*=UTF-8''{quote(attachment.get('name') or sha256)}",
+    }
+    if etag in request.headers.get('if-none-match', ''):
+        return Response(status_code=304, headers=headers)
+
+    size = path.stat().st_size
+    start, end, status_code = 0, size - 1, 200
+    range_header = request.headers.get('range')
+    if range_header and size:
+        try:
+            byte_range = parse_range_header(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    return StreamingResponse(
+        attachment_store.iter_range(sha256, start, end),
+        status_code=status_code,
+        media_type=attachment.get('type') or "application/octet-stream",
+        headers=headers
+    )
+
+@api_router.delete("/orders/{order_id}/attachments/{attachment_id}")
+async def delete_order_attachment(order_id: str, attachment_id: str, current_user: User = Depends(get_current_user)):
+    # The blob itself is shared by content; unreferenced ones go with `python server.py gc-attachments`
+    result = await db.orders.update_one(
+        {"$or": [{"id": order_id}, {"order_code": order_id}], "attachments.id": attachment_id},
+        {"$pull": {"attachments": {"id": attachment_id}}, "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    return {"message": "Ek silindi"}
+
+# ==================== PAYMENT DUE DATES ====================
+
+# payment_due_at = (payment_start_at or created_at) + payment_term_days, stored as a BSON
+# date so overdue orders are an index range instead of a scan with date math.
+OVERDUE_ORDER_TYPES = ["teklif", "kurumsal_cari", "kurumsal_pesin"]
+PAYMENT_DUE_FIELDS = ('payment_start_at', 'payment_term_days')
+
+def payment_due_at(order: Dict[str, Any]) -> Optional[datetime]:
+    days = order.get('payment_term_days')
+    start = order.get('payment_start_at') or order.get('created_at')
+    if days is None or not start:
+        return None
+    try:
+        if isinstance(start, str):
+            start = datetime.fromisoformat(start)
+        days = int(days)
+    except (TypeError, ValueError):
+        return None
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    return start + timedelta(days=days)
+
+def overdue_query(now: Optional[datetime] = None) -> Dict[str, Any]:
+    return {"order_type": {"$in": OVERDUE_ORDER_TYPES}, "payment_due_at": {"$lt": now or datetime.now(timezone.utc)}}
+
+@migration("backfill_payment_due_at")
+async def backfill_payment_due_at(batch_size: int = 500):
+    """Compute payment_due_at for orders written before it was stored"""
+    updated = 0
+    ops: List[Any] = []
+    cursor = db.orders.find(
+        {"payment_term_days": {"$ne": None}, "payment_due_at": {"$exists": False}},
+        {"_id": 0, "id": 1, "payment_start_at": 1, "payment_term_days": 1, "created_at": 1}
+    ).batch_size(batch_size)
+    async for order in cursor:
+        due = payment_due_at(order)
+        if due is None:
+            continue
+        ops.append(UpdateOne({"id": order['id']}, {"$set": {"payment_due_at": due}}))
+        if len(ops) >= batch_size:
+            await db.orders.bulk_write(ops, ordered=False)
+            updated += len(ops)
+            ops = []
+    if ops:
+        await db.orders.bulk_write(ops, ordered=False)
+        updated += len(ops)
+    logger.info(f"Backfilled payment_due_at on {updated} orders")
+
 # ==================== ORDER ENDPOINTS ====================
 
 async def get_next_order_number() -> int:
-    # Get the highest order number
-    result = await db.orders.find_one(
-        {},
-        {"_id": 0, "order_number": 1},
-        sort=[("order_number", -1)]
-    )
-    return (result['order_number'] if result else 0) + 1
+    return await next_sequence("order_number")
 
 def get_user_prefix(full_name: str) -> str:
     """Kullanıcı ad soyadından kısaltma oluştur (Furkan Kaya -> FK)"""
@@ -1498,31 +3764,19 @@ async def get_next_order_code(user_id: str, full_name: str) -> str:
     now = datetime.now(timezone.utc)
     date_str = now.strftime("%d%m%y")  # ggaayy formatı
     
-    # Bu kullanıcının bugünkü son sipariş numarasını bul
+    # Kullanıcı kısaltması + gün bazlı sayaç
     today_prefix = f"{prefix}{date_str}"
-    result = await db.orders.find_one(
-        {"order_code": {"$regex": f"^{today_prefix}"}},
-        {"_id": 0, "order_code": 1},
-        sort=[("order_code", -1)]
-    )
+    next_num = await next_sequence(f"order_code:{today_prefix}")
     
-    if result and result.get('order_code'):
-        # Mevcut koddan sıra numarasını çıkar (son 6 hane)
-        try:
-            current_num = int(result['order_code'][-6:])
-            next_num = current_num + 1
-        except (IndexError, ValueError):
-            next_num = 1
-    else:
-        next_num = 1
-    
-    return f"{prefix}{date_str}{next_num:06d}"
+    return f"{today_prefix}{next_num:06d}"
 
 @api_router.post("/orders", response_model=Order)
 async def create_order(order_data: OrderCreate, current_user: User = Depends(get_current_user)):
     # Sipariş numarası kullanıcı bazlı oluşturuluyor (Ad Soyaddan kısaltma)
-    order_number = await get_next_order_number()
-    order_code = await get_next_order_code(current_user.id, current_user.full_name)
+    order_number, order_code = await asyncio.gather(
+        get_next_order_number(),
+        get_next_order_code(current_user.id, current_user.full_name),
+    )
     
     order = Order(
         order_number=order_number,
@@ -1538,15 +3792,23 @@ async def create_order(order_data: OrderCreate, current_user: User = Depends(get
     if order.order_type == "showroom_satis" and order.delivery_method == DeliveryMethod.HAND:
         order.general_status = OrderStatus.COMPLETED
     
-    doc = order.model_dump()
+    doc = order.model_dump(exclude={'history'})  # kept in order_history
     doc['created_at'] = doc['created_at'].isoformat()
     doc['updated_at'] = doc['updated_at'].isoformat()
+    doc['payment_due_at'] = order.payment_due_at = payment_due_at(doc)
+    if doc['attachments']:
+        doc['attachments'] = order.attachments = await externalize_attachments(doc['attachments'])
     
     await db.orders.insert_one(doc)
+    await dashboard_counters.order_changed(None, doc)
     return order
 
+# order_number is unique, so it alone is a stable keyset
+ORDER_LIST_SORT = [("order_number", DESCENDING)]
+
 @api_router.get("/orders", response_model=List[Order])
 async def get_orders(
+    response: Response,
     order_type: Optional[str] = None,
     status: Optional[str] = None,
     invoice_status: Optional[str] = None,
@@ -1559,8 +3821,12 @@ async def get_orders(
     search: Optional[str] = None,
     limit: int = 100,
     skip: int = 0,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
+    """Sipariş listesi. fields=summary tablo için gereken alanları döndürür."""
+    projection = fieldset_projection(fields, Order, OrderSummary, ("id", "order_number")) or {"_id": 0}
     query = {}
     
     # NOT: Tüm roller için ortak sipariş havuzu. Kullanıcılar mevcut tüm siparişleri görebilir.
@@ -1628,7 +3894,40 @@ async def get_orders(
 
         query['$or'] = or_conditions
 
-    orders = await db.orders.find(query, {"_id": 0}).sort("order_number", -1).skip(skip).limit(limit).to_list(limit)
+    if cursor:
+        find = db.orders.find(keyset_query(query, ORDER_LIST_SORT, cursor), projection)
+    else:
+        find = db.orders.find(query, projection).skip(skip)
+    orders = await find.sort(ORDER_LIST_SORT).limit(limit).to_list(limit)
+    next_cursor = set_next_cursor(response, orders, limit, ORDER_LIST_SORT)
+    if fields:
+        return fieldset_response(orders, fields, OrderSummary, next_cursor)
+    for order in orders:
+        if isinstance(order.get('created_at'), str):
+            order['created_at'] = datetime.fromisoformat(order['created_at'])
+        if isinstance(order.get('updated_at'), str):
+            order['updated_at'] = datetime.fromisoformat(order['updated_at'])
+    return orders
+
+OVERDUE_ORDER_SORT = [("payment_due_at", ASCENDING), ("id", ASCENDING)]
+
+@api_router.get("/orders/overdue", response_model=List[Order])
+async def get_overdue_orders(
+    response: Response,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Vadesi geçmiş siparişler, en eski vadeden başlayarak"""
+    projection = fieldset_projection(fields, Order, OrderSummary, ("id", "payment_due_at")) or {"_id": 0}
+    query = overdue_query()
+    if cursor:
+        query = keyset_query(query, OVERDUE_ORDER_SORT, cursor)
+    orders = await db.orders.find(query, projection).sort(OVERDUE_ORDER_SORT).limit(limit).to_list(limit)
+    next_cursor = set_next_cursor(response, orders, limit, OVERDUE_ORDER_SORT)
+    if fields:
+        return fieldset_response(orders, fields, OrderSummary, next_cursor)
     for order in orders:
         if isinstance(order.get('created_at'), str):
             order['created_at'] = datetime.fromisoformat(order['created_at'])
@@ -1676,13 +3975,14 @@ async def convert_order_type(order_id: str, payload: ConvertOrderTypeRequest, cu
 
     # Vade sayacının başlangıcı: teklif başarılı şekilde siparişe dönüştüğü an
     existing["payment_start_at"] = datetime.now(timezone.utc).isoformat()
+    existing["payment_due_at"] = payment_due_at(existing)
 
     old_type = existing.get("order_type")
     existing["order_type"] = target
     existing["updated_at"] = datetime.now(timezone.utc).isoformat()
 
     # Geçmişe kayıt
-    history_entries = existing.get("history", []) or []
+    existing.pop("history", None)
     history_entry = {
         "id": str(uuid.uuid4()),
         "action": "order_type_change",
@@ -1693,10 +3993,10 @@ async def convert_order_type(order_id: str, payload: ConvertOrderTypeRequest, cu
         "user_name": current_user.full_name,
         "created_at": datetime.now(timezone.utc).isoformat(),
     }
-    history_entries.append(history_entry)
-    existing["history"] = history_entries
 
     await db.orders.update_one({"id": existing["id"]}, {"$set": existing})
+    await append_order_history(existing["id"], [history_entry])
+    existing["history"] = await load_order_history(existing["id"])
 
     # Tip dönüşümünden sonra modeli tekrar oluştur
     if isinstance(existing.get("created_at"), str):
@@ -1724,7 +4024,10 @@ async def get_order(order_id: str, current_user: User = Depends(get_current_user
     
     # Get order items - order.id kullan
     actual_order_id = order.get('id')
-    items = await db.order_items.find({"order_id": actual_order_id}, {"_id": 0}).to_list(1000)
+    items, order['history'] = await asyncio.gather(
+        db.order_items.find({"order_id": actual_order_id}, {"_id": 0}).to_list(1000),
+        load_order_history(actual_order_id),
+    )
     for item in items:
         if isinstance(item.get('created_at'), str):
             item['created_at'] = datetime.fromisoformat(item['created_at'])
@@ -1735,19 +4038,42 @@ async def get_order(order_id: str, current_user: User = Depends(get_current_user
 
 @api_router.put("/orders/{order_id}", response_model=Order)
 async def update_order(order_id: str, order_data: Dict[str, Any], current_user: User = Depends(get_current_user)):
-    # order_id veya order_code ile arama yap
-    existing = await db.orders.find_one({"id": order_id}, {"_id": 0})
-    if not existing:
-        existing = await db.orders.find_one({"order_code": order_id}, {"_id": 0})
-    if not existing:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
+    """Siparişi tek istekte güncelle. Yanıttaki `history` yalnızca bu düzenlemenin eklediği
+    kayıtları içerir; tam geçmiş için GET /orders/{id}/history kullanılır."""
     # Partial update - sadece gönderilen alanları güncelle
-    update_data = {k: v for k, v in order_data.items() if v is not None}
+    # (geçmiş order_history koleksiyonunda, istemcinin gönderdiği kopya yok sayılır)
+    # payment_due_at sunucuda hesaplanır
+    update_data = {k: v for k, v in order_data.items()
+                   if v is not None and k not in ('history', 'id', '_id', 'payment_due_at')}
     update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
+    # Tam form kaydında vade alanlarının ikisi de gelir; vade sonu aynı istekte yazılır
+    due_fields_sent = [f for f in PAYMENT_DUE_FIELDS if f in update_data]
+    if len(due_fields_sent) == len(PAYMENT_DUE_FIELDS):
+        update_data['payment_due_at'] = payment_due_at(update_data)
+    if update_data.get('attachments'):
+        current = await db.orders.find_one(
+            {"$or": [{"id": order_id}, {"order_code": order_id}]}, {"_id": 0, "attachments": 1}
+        )
+        update_data['attachments'] = await externalize_attachments(
+            update_data['attachments'], (current or {}).get('attachments')
+        )
     
-    # Track changes in history
-    history_entries = existing.get('history', [])
+    # order_id veya order_code ile arama yap; eski hali geçmiş karşılaştırması için döner
+    existing = await update_and_fetch(
+        db.orders,
+        {"$or": [{"id": order_id}, {"order_code": order_id}]},
+        {"$set": update_data},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not existing:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if due_fields_sent and 'payment_due_at' not in update_data:
+        # Vade alanlarından yalnızca biri değişti: diğeri mevcut kayıttan
+        update_data['payment_due_at'] = payment_due_at({**existing, **update_data})
+        await db.orders.update_one({"id": existing['id']}, {"$set": {"payment_due_at": update_data['payment_due_at']}})
+    
+    # Track changes in history (new entries only)
+    history_entries = []
     changes = []
     
     # Check for status changes
@@ -1814,11 +4140,10 @@ async def update_order(order_id: str, order_data: Dict[str, Any], current_user:
             }
             history_entries.append(history_entry)
 
-    # Geçmişi güncelle
-    update_data['history'] = history_entries
-
-    await db.orders.update_one({"id": existing['id']}, {"$set": update_data})
-    updated = await db.orders.find_one({"id": existing['id']}, {"_id": 0})
+    await append_order_history(existing['id'], history_entries)
+    existing.pop('history', None)
+    updated = {**existing, **update_data, 'history': history_entries}
+    await dashboard_counters.order_changed(existing, updated)
     if isinstance(updated.get('created_at'), str):
         updated['created_at'] = datetime.fromisoformat(updated['created_at'])
     if isinstance(updated.get('updated_at'), str):
@@ -1868,8 +4193,6 @@ async def update_order(order_id: str, order_data: Dict[str, Any], current_user:
         if not any(c.startswith(('Genel Durum', 'Fatura', 'İrsaliye', 'Kargo')) for c in changes):
             history_entries.append(history_entry)
     
-    update_data['history'] = history_entries
-    
     # Gerçek order id'yi kullan (order_code ile arama yapılmış olabilir)
     actual_id = existing.get('id')
     await db.orders.update_one({"id": actual_id}, {"$set": update_data})
@@ -1902,7 +4225,6 @@ async def add_order_note(order_id: str, request: AddHistoryNoteRequest, current_
         raise HTTPException(status_code=404, detail="Order not found")
     
     actual_id = existing.get('id')
-    history_entries = existing.get('history', [])
     history_entry = {
         "id": str(uuid.uuid4()),
         "action": "note_added",
@@ -1913,7 +4235,6 @@ async def add_order_note(order_id: str, request: AddHistoryNoteRequest, current_
         "user_name": current_user.full_name,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-    history_entries.append(history_entry)
 
     # Mention tespiti (@kullaniciadi)
     note_text = request.note or ""
@@ -1944,19 +4265,33 @@ async def add_order_note(order_id: str, request: AddHistoryNoteRequest, current_
         if notifications:
             await db.notifications.insert_many(notifications)
 
+    await append_order_history(actual_id, [history_entry])
     await db.orders.update_one(
         {"id": actual_id}, 
-        {"$set": {"history": history_entries, "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"updated_at": datetime.now(timezone.utc).isoformat()}}
     )
 
     return {"message": "Not eklendi", "entry": history_entry}
 
-    await db.orders.update_one(
-        {"id": actual_id}, 
-        {"$set": {"history": history_entries, "updated_at": datetime.now(timezone.utc).isoformat()}}
-    )
+@api_router.get("/orders/{order_id}/history", response_model=List[OrderHistoryEntry])
+async def get_order_history(
+    order_id: str,
+    response: Response,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Sipariş geçmişi, en yeni kayıt önce. Sonraki sayfa X-Next-Cursor ile alınır."""
+    order = await db.orders.find_one({"$or": [{"id": order_id}, {"order_code": order_id}]}, {"_id": 0, "id": 1})
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
 
-    return {"message": "Not eklendi", "entry": history_entry}
+    query = {"order_id": order['id']}
+    if cursor:
+        query = keyset_query(query, ORDER_HISTORY_SORT, cursor)
+    entries = await db.order_history.find(query, {"_id": 0, "order_id": 0}).sort(ORDER_HISTORY_SORT).limit(limit).to_list(limit)
+    set_next_cursor(response, entries, limit, ORDER_HISTORY_SORT)
+    return entries
 
 
 class NotificationOut(BaseModel):
@@ -1971,14 +4306,24 @@ class NotificationOut(BaseModel):
     created_at: datetime
     read: bool
 
+NOTIFICATION_LIST_SORT = [("created_at", DESCENDING), ("id", DESCENDING)]
+
 @api_router.get("/notifications", response_model=List[NotificationOut])
-async def get_notifications(limit: int = 20, skip: int = 0, current_user: User = Depends(get_current_user)):
+async def get_notifications(
+    response: Response,
+    limit: int = 20,
+    skip: int = 0,
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
     """Geçerli kullanıcı için son bildirimleri döndür"""
-    cursor = db.notifications.find(
-        {"user_id": current_user.id},
-        {"_id": 0}
-    ).sort("created_at", -1).skip(skip).limit(limit)
-    notifs = await cursor.to_list(limit)
+    query = {"user_id": current_user.id}
+    if cursor:
+        find = db.notifications.find(keyset_query(query, NOTIFICATION_LIST_SORT, cursor), {"_id": 0})
+    else:
+        find = db.notifications.find(query, {"_id": 0}).skip(skip)
+    notifs = await find.sort(NOTIFICATION_LIST_SORT).limit(limit).to_list(limit)
+    set_next_cursor(response, notifs, limit, NOTIFICATION_LIST_SORT)
     # created_at string geldiyse datetime'a çevir
     for n in notifs:
         if isinstance(n.get("created_at"), str):
@@ -2015,8 +4360,13 @@ async def delete_order(order_id: str, current_user: User = Depends(get_current_u
     if current_user.role != UserRole.ADMIN and existing.get('created_by') != current_user.id:
         raise HTTPException(status_code=403, detail="Bu siparişi silme yetkiniz yok")
     
-    # Sipariş kalemlerini sil
+    # Sipariş kalemlerini ve geçmişini sil
+    item_statuses = await db.order_items.aggregate([
+        {"$match": {"order_id": actual_id}},
+        {"$group": {"_id": "$item_status", "n": {"$sum": 1}}},
+    ]).to_list(None)
     await db.order_items.delete_many({"order_id": actual_id})
+    await db.order_history.delete_many({"order_id": actual_id})
     
     # Siparişi sil
     result = await db.orders.delete_one({"id": actual_id})
@@ -2024,6 +4374,11 @@ async def delete_order(order_id: str, current_user: User = Depends(get_current_u
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Order not found")
     
+    deltas = counter_deltas(order_counter_fields(existing), set())
+    for row in item_statuses:
+        deltas[f"item_status.{counter_key(row['_id'])}"] = -row["n"]
+    await dashboard_counters.apply(deltas)
+    
     return {"message": f"Sipariş #{existing.get('order_code', existing.get('order_number'))} silindi"}
 
 # ==================== ORDER ITEM ENDPOINTS ====================
@@ -2035,12 +4390,14 @@ async def create_order_item(item_data: OrderItemCreate, current_user: User = Dep
     doc['created_at'] = doc['created_at'].isoformat()
     doc['updated_at'] = doc['updated_at'].isoformat()
     await db.order_items.insert_one(doc)
+    await dashboard_counters.item_changed(None, doc)
     return item
 
 @api_router.get("/order-items", response_model=List[OrderItem])
 async def get_order_items(
     order_id: Optional[str] = None,
     item_status: Optional[str] = None,
+    fields: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
     query = {}
@@ -2049,7 +4406,10 @@ async def get_order_items(
     if item_status:
         query['item_status'] = item_status
     
-    items = await db.order_items.find(query, {"_id": 0}).to_list(1000)
+    projection = fieldset_projection(fields, OrderItem, OrderItemSummary) or {"_id": 0}
+    items = await db.order_items.find(query, projection).to_list(1000)
+    if fields:
+        return fieldset_response(items, fields, OrderItemSummary)
     for item in items:
         if isinstance(item.get('created_at'), str):
             item['created_at'] = datetime.fromisoformat(item['created_at'])
@@ -2059,16 +4419,16 @@ async def get_order_items(
 
 @api_router.put("/order-items/{item_id}", response_model=OrderItem)
 async def update_order_item(item_id: str, item_data: OrderItemCreate, current_user: User = Depends(get_current_user)):
-    existing = await db.order_items.find_one({"id": item_id}, {"_id": 0})
-    if not existing:
-        raise HTTPException(status_code=404, detail="Order item not found")
-    
     update_data = item_data.model_dump()
     update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
     
-    await db.order_items.update_one({"id": item_id}, {"$set": update_data})
+    existing = await update_and_fetch(db.order_items, {"id": item_id}, {"$set": update_data},
+                                      return_document=ReturnDocument.BEFORE)
+    if not existing:
+        raise HTTPException(status_code=404, detail="Order item not found")
     
-    updated = await db.order_items.find_one({"id": item_id}, {"_id": 0})
+    updated = {**existing, **update_data}
+    await dashboard_counters.item_changed(existing, updated)
     if isinstance(updated.get('created_at'), str):
         updated['created_at'] = datetime.fromisoformat(updated['created_at'])
     if isinstance(updated.get('updated_at'), str):
@@ -2077,9 +4437,10 @@ async def update_order_item(item_id: str, item_data: OrderItemCreate, current_us
 
 @api_router.delete("/order-items/{item_id}")
 async def delete_order_item(item_id: str, current_user: User = Depends(get_current_user)):
-    result = await db.order_items.delete_one({"id": item_id})
-    if result.deleted_count == 0:
+    deleted = await db.order_items.find_one_and_delete({"id": item_id}, projection={"_id": 0, "id": 1, "item_status": 1})
+    if not deleted:
         raise HTTPException(status_code=404, detail="Order item not found")
+    await dashboard_counters.item_changed(deleted, None)
     return {"message": "Order item deleted"}
 
 # ==================== DASHBOARD STATS ====================
@@ -2087,80 +4448,61 @@ async def delete_order_item(item_id: str, current_user: User = Depends(get_curre
 @api_router.get("/dashboard/stats")
 async def get_dashboard_stats(current_user: User = Depends(get_current_user)):
     # Ortak sipariş havuzu: tüm roller aynı toplamları görür
-    query = {}
+    # Sayaçlar tek belgeden okunur; yalnızca zamana bağlı vade aşımı sorgulanır
+    # Overdue quotes (for finance/admin)
+    include_overdue = current_user.role in [UserRole.FINANCE, UserRole.ADMIN]
+
+    async def compute():
+        if not include_overdue:
+            return await dashboard_counters.read(), 0
+        return await asyncio.gather(dashboard_counters.read(), db.orders.count_documents(overdue_query()))
+
+    # Kullanıcıya özel alanlar (my_assigned_orders) paylaşılan sayaç belgesinden okunur,
+    # bu yüzden anahtar yalnızca sonucu değiştiren role göre ayrılır
+    counters, overdue_quotes = await read_cache.get(("dashboard", include_overdue), compute)
+    general_status = counters.get("general_status", {})
 
-    total_orders = await db.orders.count_documents(query)
-    
-    waiting_info_query = {**query, "general_status": OrderStatus.WAITING_INFO}
-    waiting_info = await db.orders.count_documents(waiting_info_query)
-    
-    in_progress_query = {**query, "general_status": OrderStatus.IN_PROGRESS}
-    in_progress = await db.orders.count_documents(in_progress_query)
-    
-    ready_query = {**query, "general_status": OrderStatus.READY}
-    ready = await db.orders.count_documents(ready_query)
-    
     # Pending invoices (for accounting)
     pending_invoices = 0
     if current_user.role in [UserRole.ACCOUNTING, UserRole.FINANCE, UserRole.ADMIN]:
-        pending_invoices = await db.orders.count_documents({"invoice_status": InvoiceStatus.NOT_ISSUED})
+        pending_invoices = counters.get("invoice_status", {}).get(InvoiceStatus.NOT_ISSUED, 0)
     
     # Items to procure (for warehouse/finance)
     items_to_procure = 0
     if current_user.role in [UserRole.WAREHOUSE, UserRole.FINANCE, UserRole.ADMIN]:
-        items_to_procure = await db.order_items.count_documents({"item_status": ItemStatus.TO_BE_PROCURED})
+        items_to_procure = counters.get("item_status", {}).get(ItemStatus.TO_BE_PROCURED, 0)
 
-    # Overdue quotes (for finance/admin)
-    overdue_quotes = 0
-    if current_user.role in [UserRole.FINANCE, UserRole.ADMIN]:
-        cursor = db.orders.find(
-            {"order_type": {"$in": ["teklif", "kurumsal_cari", "kurumsal_pesin"]}, "payment_term_days": {"$ne": None}},
-            {"_id": 0, "payment_start_at": 1, "payment_term_days": 1}
-        )
-        quotes = await cursor.to_list(5000)
-        now = datetime.now(timezone.utc)
-        for q in quotes:
-            start_raw = q.get("payment_start_at") or q.get("created_at")
-            days = q.get("payment_term_days")
-            if not start_raw or days is None:
-                continue
-            if isinstance(start_raw, str):
-                try:
-                    start_dt = datetime.fromisoformat(start_raw)
-                except Exception:
-                    continue
-            else:
-                start_dt = start_raw
-            try:
-                days_int = int(days)
-            except (TypeError, ValueError):
-                continue
-            due_date = start_dt + timedelta(days=days_int)
-            # Ensure both datetimes are timezone-aware
-            if start_dt.tzinfo is None:
-                start_dt = start_dt.replace(tzinfo=timezone.utc)
-            if due_date.tzinfo is None:
-                due_date = due_date.replace(tzinfo=timezone.utc)
-            if due_date < now:
-                overdue_quotes += 1
-    
     return {
-        "total_orders": total_orders,
-        "waiting_info": waiting_info,
-        "in_progress": in_progress,
-        "ready": ready,
+        "total_orders": counters.get("total_orders", 0),
+        "waiting_info": general_status.get(OrderStatus.WAITING_INFO, 0),
+        "in_progress": general_status.get(OrderStatus.IN_PROGRESS, 0),
+        "ready": general_status.get(OrderStatus.READY, 0),
         "pending_invoices": pending_invoices,
         "items_to_procure": items_to_procure,
         "overdue_quotes": overdue_quotes,
-        "cargo_barcode_not_printed": await db.orders.count_documents({
-            "delivery_method": "kargo", 
-            "cargo_barcode_status": CargoBarcodeStatus.NOT_PRINTED,
-            "general_status": {"$nin": [OrderStatus.COMPLETED]}
-        }),
-        "my_assigned_orders": await db.orders.count_documents({
-            "assigned_user_id": current_user.id,
-            "general_status": {"$nin": [OrderStatus.COMPLETED]}
-        })
+        "cargo_barcode_not_printed": counters.get("cargo_barcode_not_printed", 0),
+        "my_assigned_orders": counters.get("assigned_open", {}).get(counter_key(current_user.id), 0),
+    }
+
+# ==================== SYSTEM ====================
+
+@api_router.get("/system/stats")
+async def get_system_stats(current_user: User = Depends(get_current_user)):
+    """In-process cache counters of this worker (admin only)"""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    return {
+        "auth_cache": principal_cache.stats(),
+        "presence": presence_tracker.stats(),
+        "product_search": product_search_index.stats(),
+        "search_cache": search_session_cache.stats(),
+        "jobs": job_runner.stats(),
+        "dashboard_counters": dashboard_counters.stats(),
+        "read_cache": read_cache.stats(),
+        "pdf_render": pdf_render_pool.stats(),
+        "pdf_cache": pdf_cache.stats(),
+        "pdf_settings": pdf_settings_cache.stats(),
     }
 
 # Include router
@@ -2172,6 +4514,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 logging.basicConfig(
@@ -2182,7 +4525,18 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await presence_tracker.stop()
+    product_search_index.stop()
+    job_runner.stop()
+    dashboard_counters.stop()
+    pdf_render_pool.stop()
     client.close()
+    password_executor.shutdown(wait=False)
+
+@app.on_event("startup")
+async def ensure_database_indexes():
+    await ensure_indexes()
+    await run_migrations()
 
 # Initialize default data on startup
 @app.on_event("startup")
@@ -2202,7 +4556,7 @@ async def create_default_data():
         
         for user_data in default_users:
             password = user_data.pop('password')
-            hashed_password = hash_password(password)
+            hashed_password = await hash_password_async(password)
             user = User(**user_data)
             doc = user.model_dump()
             doc['password'] = hashed_password
@@ -2227,4 +4581,37 @@ async def create_default_data():
             doc['created_at'] = doc['created_at'].isoformat()
             await db.order_types.insert_one(doc)
         
-        logger.info("Default order types created successfully")
\ No newline at end of file
+        logger.info("Default order types created successfully")
+
+@app.on_event("startup")
+async def start_presence_tracker():
+    await presence_tracker.start()
+
+@app.on_event("startup")
+async def start_product_search_index():
+    await product_search_index.start()
+
+@app.on_event("startup")
+async def start_job_runner():
+    await job_runner.start()
+
+@app.on_event("startup")
+async def start_dashboard_counters():
+    await dashboard_counters.start()
+
+# ==================== MAINTENANCE COMMANDS ====================
+
+MAINTENANCE_COMMANDS = {
+    "ensure-indexes": ensure_indexes,
+    "migrate": run_migrations,
+    "gc-attachments": collect_attachment_garbage,
+    "reconcile-dashboard": dashboard_counters.reconcile,
+}
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="OrderMate maintenance commands")
+    parser.add_argument("command", choices=sorted(MAINTENANCE_COMMANDS))
+    args = parser.parse_args()
+    asyncio.run(MAINTENANCE_COMMANDS[args.command]())
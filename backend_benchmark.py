@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+"""
+Performance benchmarks for the OrderMate backend
+Usage: python backend_benchmark.py <benchmark> [base_url]
+
+Benchmarks:
+  login   - latency of an unrelated endpoint while 50 users log in at once
+  search  - in-process product search index latency over a synthetic 100k catalog
+  dashboard - /dashboard/stats counters document vs the former serial counts, 100k orders
+  polling - database queries/s behind /dashboard/stats and /users/online-stats as polling
+            clients grow, with and without the single-flight read cache
+  pdf     - quote PDF render time, size, page count and peak RSS against the order's item count
+  logo    - quote PDF size and render time with a raw uploaded logo vs the normalized one
+
+In-process benchmarks import backend/server.py and need the backend requirements.
+The dashboard and polling benchmarks seed the MongoDB at MONGO_URL (database DB_NAME, default
+ordermate_benchmark) on first run.
+"""
+
+import requests
+import io
+import os
+import sys
+import json
+import time
+import random
+import threading
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+DEFAULT_BASE_URL = "https://msgorder.preview.emergentagent.com/api"
+
+
+def import_server():
+    """Import backend/server.py for in-process benchmarks (no database calls are made)"""
+    os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+    os.environ.setdefault('DB_NAME', 'ordermate_benchmark')
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+    import server
+    return server
+
+
+async def seed_orders(server, order_count: int, items_per_order=2):
+    """Top the benchmark database up to `order_count` synthetic orders"""
+    db = server.db
+    existing = await db.orders.count_documents({})
+    rng = random.Random(existing)
+    statuses = [server.OrderStatus.WAITING_INFO, server.OrderStatus.IN_PROGRESS, server.OrderStatus.READY,
+                server.OrderStatus.COMPLETED]
+    order_types = ["teklif", "kurumsal_cari", "kurumsal_pesin", "showroom_satis"]
+    now = datetime.now(timezone.utc)
+    for start in range(existing, order_count, 5000):
+        orders, items = [], []
+        for n in range(start, min(start + 5000, order_count)):
+            created = now - timedelta(days=rng.randint(0, 365), seconds=rng.randint(0, 86400))
+            order_type = rng.choice(order_types)
+            orders.append({
+                "id": f"bench-order-{n}",
+                "order_number": n + 1,
+                "order_code": f"BN{n:012d}",
+                "order_type": order_type,
+                "created_by": "bench",
+                "created_by_name": "Benchmark",
+                "general_status": rng.choice(statuses),
+                "invoice_status": rng.choice(["kesilmedi", "kesildi"]),
+                "delivery_method": rng.choice(["kargo", "elden", None]),
+                "cargo_barcode_status": rng.choice(["yazdirilmadi", "yazdirildi"]),
+                "assigned_user_id": f"bench-user-{rng.randint(0, 20)}",
+                "payment_term_days": rng.choice([None, 15, 30, 60]) if order_type != "showroom_satis" else None,
+                "payment_start_at": created.isoformat() if order_type != "teklif" else None,
+                "created_at": created.isoformat(),
+                "updated_at": created.isoformat(),
+            })
+            items.extend({
+                "id": f"bench-item-{n}-{i}",
+                "order_id": f"bench-order-{n}",
+                "product_name": "Benchmark Ürün",
+                "quantity": 1,
+                "item_status": rng.choice([server.ItemStatus.TO_BE_CONFIRMED, server.ItemStatus.TO_BE_PROCURED, server.ItemStatus.READY]),
+            } for i in range(items_per_order))
+        await db.orders.insert_many(orders, ordered=False)
+        await db.order_items.insert_many(items, ordered=False)
+
+
+async def legacy_dashboard_stats(server, user) -> Dict[str, int]:
+    """get_dashboard_stats before the $facet rewrite: serial counts plus a capped scan"""
+    db = server.db
+    stats = {
+        "total_orders": await db.orders.count_documents({}),
+        "waiting_info": await db.orders.count_documents({"general_status": server.OrderStatus.WAITING_INFO}),
+        "in_progress": await db.orders.count_documents({"general_status": server.OrderStatus.IN_PROGRESS}),
+        "ready": await db.orders.count_documents({"general_status": server.OrderStatus.READY}),
+        "pending_invoices": await db.orders.count_documents({"invoice_status": server.InvoiceStatus.NOT_ISSUED}),
+        "items_to_procure": await db.order_items.count_documents({"item_status": server.ItemStatus.TO_BE_PROCURED}),
+    }
+    quotes = await db.orders.find(
+        {"order_type": {"$in": ["teklif", "kurumsal_cari", "kurumsal_pesin"]}, "payment_term_days": {"$ne": None}},
+        {"_id": 0, "payment_start_at": 1, "payment_term_days": 1}
+    ).to_list(5000)
+    now = datetime.now(timezone.utc)
+    overdue = 0
+    for quote in quotes:
+        start_raw = quote.get("payment_start_at") or quote.get("created_at")
+        if start_raw and datetime.fromisoformat(start_raw) + timedelta(days=int(quote["payment_term_days"])) < now:
+            overdue += 1
+    stats["overdue_quotes"] = overdue
+    stats["cargo_barcode_not_printed"] = await db.orders.count_documents({
+        "delivery_method": "kargo",
+        "cargo_barcode_status": server.CargoBarcodeStatus.NOT_PRINTED,
+        "general_status": {"$nin": [server.OrderStatus.COMPLETED]}
+    })
+    stats["my_assigned_orders"] = await db.orders.count_documents({
+        "assigned_user_id": user.id,
+        "general_status": {"$nin": [server.OrderStatus.COMPLETED]}
+    })
+    return stats
+
+
+def render_pdf_sample(item_count: int) -> Dict[str, float]:
+    """Render one synthetic quote; runs in a fresh process so ru_maxrss is this render's peak"""
+    import resource
+    server = import_server()
+    import pdf_renderer
+    pdf_renderer.register_fonts()
+    order = {"id": "bench-order", "order_number": 1, "customer_name": "Benchmark Müşteri A.Ş.",
+             "customer_phone": "0212 000 00 00", "created_at": datetime.now(timezone.utc).isoformat()}
+    items = [{"id": f"bench-item-{i}", "product_name": f"Benchmark Ürün {i} Şarj Kablosu 1m", "quantity": i % 7 + 1,
+              "unit_price": 12.5 + i % 100} for i in range(item_count)]
+    settings = server.PdfSettings(template=server.PDFTemplateSettings(payment_terms="Peşin", notes="Not"),
+                                  bank_accounts=[server.BankAccount(bank_name="Banka", account_holder="OrderMate",
+                                                                    iban="TR00")], version="bench")
+    spec = server.pdf_render_spec(order, items, settings)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    pdf = pdf_renderer.render_order_pdf(spec)
+    seconds = time.perf_counter() - started
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "render_seconds": round(seconds, 3),
+        "pdf_kb": round(len(pdf) / 1024, 1),
+        "pages": pdf.count(b"/Type /Page\n"),
+        "peak_rss_mb": round(rss_after / 1024, 1),
+        "render_rss_growth_mb": round((rss_after - rss_before) / 1024, 1),
+    }
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds"""
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3) if samples else 0.0,
+    }
+
+
+class OrderMateBenchmark:
+    def __init__(self, base_url=DEFAULT_BASE_URL):
+        self.base_url = base_url
+        self.results = {}
+
+    def login(self, username: str, password: str) -> requests.Response:
+        return requests.post(f"{self.base_url}/auth/login", json={"username": username, "password": password})
+
+    def get_token(self, username="admin", password="admin123") -> str:
+        response = self.login(username, password)
+        response.raise_for_status()
+        return response.json()["access_token"]
+
+    def probe_latency(self, token: str, stop: threading.Event, samples: List[float], interval=0.02):
+        """Repeatedly time a cheap authenticated endpoint until stop is set"""
+        headers = {"Authorization": f"Bearer {token}"}
+        session = requests.Session()
+        while not stop.is_set():
+            started = time.perf_counter()
+            session.get(f"{self.base_url}/auth/me", headers=headers)
+            samples.append(time.perf_counter() - started)
+            time.sleep(interval)
+
+    def bench_concurrent_logins(self, concurrency=50, rounds=3):
+        """Event-loop latency seen by /auth/me while `concurrency` logins run in parallel"""
+        print(f"\n🔐 Benchmark: /auth/me latency under {concurrency} concurrent logins")
+        token = self.get_token()
+
+        # Baseline without login load
+        baseline: List[float] = []
+        stop = threading.Event()
+        probe = threading.Thread(target=self.probe_latency, args=(token, stop, baseline))
+        probe.start()
+        time.sleep(3)
+        stop.set()
+        probe.join()
+
+        # Same probe while a burst of logins hits the server
+        loaded: List[float] = []
+        login_times: List[float] = []
+        stop = threading.Event()
+        probe = threading.Thread(target=self.probe_latency, args=(token, stop, loaded))
+        probe.start()
+
+        def timed_login(_):
+            started = time.perf_counter()
+            self.login("admin", "admin123")
+            login_times.append(time.perf_counter() - started)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for _ in range(rounds):
+                list(pool.map(timed_login, range(concurrency)))
+        stop.set()
+        probe.join()
+
+        result = {
+            "baseline_probe": summarize(baseline),
+            "probe_under_login_load": summarize(loaded),
+            "login": summarize(login_times),
+        }
+        self.results["login"] = result
+        print(json.dumps(result, indent=2))
+        return result
+
+    def bench_search_index(self, product_count=100_000, rounds=200):
+        """Product search index latency (target: p99 under 5 ms at 100k products)"""
+        print(f"\n🔎 Benchmark: product search index over {product_count} products")
+        server = import_server()
+        rng = random.Random(42)
+        words = ['Kablo', 'KILIF', 'Şarj', 'Adaptör', 'Işıklı', 'Çanta', 'Güç', 'USB', 'HDMI', 'Tablet',
+                 'Kalem', 'Klavye', 'Mouse', 'Monitör', 'Ekran', 'Koruyucu', 'Cam', 'Batarya', 'Hoparlör', 'Kulaklık']
+        brands = ['Samsung', 'Apple', 'Xiaomi', 'Anker', 'Baseus', 'TTEC', 'Philips', 'Logitech']
+        products = [{
+            "id": f"bench-{i}",
+            "product_name": " ".join(rng.choice(words) for _ in range(rng.randint(3, 6))) + f" {rng.randint(1, 999)}cm",
+            "web_service_code": f"WS{i:06d}",
+            "barcode": str(8690000000000 + i),
+            "supplier_product_code": f"SP-{i % 5000}",
+            "brand": rng.choice(brands),
+        } for i in range(product_count)]
+
+        index = server.ProductSearchIndex()
+        started = time.perf_counter()
+        index.build(products)
+        build_seconds = time.perf_counter() - started
+
+        queries = ['ka', 'kab', 'kabl', 'kablo', 'kilif', 'şarj', 'sarj', 'WS000123', '8690000012345',
+                   'sp-12', 'usb kab', 'hoparlor', 'ışık', 'isik', 'sa', 'ekran koru', 'xyzzy', 'tt']
+        samples: List[float] = []
+        for _ in range(rounds):
+            for query in queries:
+                started = time.perf_counter()
+                index.search(query, 20)
+                samples.append(time.perf_counter() - started)
+
+        result = {
+            "products": product_count,
+            "build_seconds": round(build_seconds, 2),
+            "search": summarize(samples),
+        }
+        self.results["search"] = result
+        print(json.dumps(result, indent=2))
+        return result
+
+    def bench_dashboard(self, order_count=100_000, rounds=20):
+        """Dashboard stats: current implementation vs the former serial count_documents version"""
+        print(f"\n📊 Benchmark: dashboard stats over {order_count} orders")
+        server = import_server()
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        async def run():
+            server.db = AsyncIOMotorClient(os.environ['MONGO_URL'])[os.environ['DB_NAME']]
+            await server.ensure_indexes()
+            await seed_orders(server, order_count)
+            # Seeding bypasses the API, so bring the counters document up to date first
+            await server.dashboard_counters.reconcile()
+            admin = server.User(id="bench-user-1", username="bench", full_name="Bench Admin",
+                                role=server.UserRole.ADMIN, created_at=datetime.now(timezone.utc))
+
+            async def timed(fn) -> List[float]:
+                await fn()  # warm-up
+                samples = []
+                for _ in range(rounds):
+                    started = time.perf_counter()
+                    await fn()
+                    samples.append(time.perf_counter() - started)
+                return samples
+
+            legacy = await timed(lambda: legacy_dashboard_stats(server, admin))
+            current = await timed(lambda: server.get_dashboard_stats(current_user=admin))
+            started = time.perf_counter()
+            await server.dashboard_counters.reconcile()
+            return {
+                "orders": await server.db.orders.count_documents({}),
+                "legacy": summarize(legacy),
+                "current": summarize(current),
+                "reconcile_seconds": round(time.perf_counter() - started, 4),
+                "legacy_result": await legacy_dashboard_stats(server, admin),
+                "current_result": await server.get_dashboard_stats(current_user=admin),
+            }
+
+        result = asyncio.run(run())
+        self.results["dashboard"] = result
+        print(json.dumps(result, indent=2))
+        return result
+
+    def bench_polling(self, client_counts=(1, 10, 50, 200), seconds=5.0, poll_interval=1.0, order_count=100_000):
+        """DB query rate while N clients poll the dashboard and online stats every poll_interval"""
+        print(f"\n📡 Benchmark: polling clients {list(client_counts)}, {seconds}s each")
+        server = import_server()
+        from motor.motor_asyncio import AsyncIOMotorClient
+        from pymongo import monitoring
+
+        class QueryCounter(monitoring.CommandListener):
+            """Counts the read commands sent to MongoDB"""
+            READ_COMMANDS = {"find", "aggregate", "count", "distinct"}
+
+            def __init__(self):
+                self.queries = 0
+
+            def started(self, event):
+                if event.command_name in self.READ_COMMANDS:
+                    self.queries += 1
+
+            def succeeded(self, event):
+                pass
+
+            def failed(self, event):
+                pass
+
+        async def run():
+            counter = QueryCounter()
+            server.db = AsyncIOMotorClient(os.environ['MONGO_URL'], event_listeners=[counter])[os.environ['DB_NAME']]
+            await server.ensure_indexes()
+            await seed_orders(server, order_count)
+            await server.dashboard_counters.reconcile()
+            roles = [server.UserRole.ADMIN, server.UserRole.FINANCE, server.UserRole.WAREHOUSE, server.UserRole.SHOWROOM]
+
+            async def poll(user, deadline, latencies):
+                # Clients start at random offsets of the same timer, like browsers opened at different times
+                await asyncio.sleep(random.uniform(0, poll_interval))
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    await asyncio.gather(server.get_dashboard_stats(current_user=user),
+                                         server.get_online_stats(current_user=user))
+                    latencies.append(time.perf_counter() - started)
+                    await asyncio.sleep(poll_interval)
+
+            async def measure(clients: int, ttl: float) -> Dict[str, object]:
+                server.read_cache = server.SingleFlightCache(ttl)
+                users = [server.User(id=f"bench-user-{i % 50}", username=f"bench{i}", full_name="Bench User",
+                                     role=roles[i % len(roles)], created_at=datetime.now(timezone.utc))
+                         for i in range(clients)]
+                latencies: List[float] = []
+                counter.queries = 0
+                started = time.perf_counter()
+                await asyncio.gather(*(poll(u, started + seconds, latencies) for u in users))
+                elapsed = time.perf_counter() - started
+                return {
+                    "requests_per_second": round(len(latencies) * 2 / elapsed, 1),
+                    "db_queries_per_second": round(counter.queries / elapsed, 1),
+                    "latency": summarize(latencies),
+                    "cache": server.read_cache.stats(),
+                }
+
+            rows = {}
+            for clients in client_counts:
+                rows[clients] = {
+                    "uncached": await measure(clients, 0),
+                    "cached": await measure(clients, server.READ_CACHE_TTL_SECONDS),
+                }
+            return rows
+
+        result = asyncio.run(run())
+        self.results["polling"] = result
+        print(json.dumps(result, indent=2))
+        return result
+
+
+    def bench_pdf_render(self, item_counts=(10, 100, 1000, 5000)):
+        """Quote PDF render cost as the item count grows, one fresh process per size"""
+        print(f"\n🧾 Benchmark: quote PDF render for {list(item_counts)} items")
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        result = {}
+        for item_count in item_counts:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                result[item_count] = pool.submit(render_pdf_sample, item_count).result()
+        self.results["pdf"] = result
+        print(json.dumps(result, indent=2))
+        return result
+
+
+    def bench_logo(self, rounds=20):
+        """PDF size and render time with the logo as uploaded vs after normalize_logo"""
+        print(f"\n🖼️ Benchmark: quote PDF with raw vs normalized logo, {rounds} renders each")
+        import hashlib
+        import tempfile
+        from PIL import Image, ImageDraw
+        server = import_server()
+        import pdf_renderer
+        pdf_renderer.register_fonts()
+
+        # Typical oversized uploads under the 500KB limit: a scanned JPEG and a large transparent PNG
+        photo = Image.effect_noise((2000, 1000), 12).convert("RGB")
+        photo_upload = io.BytesIO()
+        photo.save(photo_upload, format="JPEG", quality=75)
+        flat = Image.new("RGBA", (2400, 1200), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(flat)
+        draw.ellipse((100, 100, 1100, 1100), fill=(220, 40, 40, 255))
+        draw.rectangle((1300, 300, 2300, 900), fill=(30, 60, 200, 255))
+        flat_upload = io.BytesIO()
+        flat.save(flat_upload, format="PNG")
+        uploads = {"photo_jpeg": photo_upload.getvalue(), "flat_png": flat_upload.getvalue()}
+
+        order = {"id": "bench-order", "order_number": 1, "customer_name": "Benchmark Müşteri",
+                 "created_at": datetime.now(timezone.utc).isoformat()}
+        items = [{"id": f"bench-item-{i}", "product_name": f"Benchmark Ürün {i}", "quantity": 1, "unit_price": 10.0}
+                 for i in range(10)]
+
+        def measure(directory: str, data: bytes) -> Dict[str, object]:
+            digest = hashlib.sha256(data).hexdigest()
+            path = os.path.join(directory, f"logo-{digest}")
+            with open(path, 'wb') as f:
+                f.write(data)
+            settings = server.PdfSettings(template=server.PDFTemplateSettings(), version=digest,
+                                          logo={"sha256": digest, "path": path})
+            spec = server.pdf_render_spec(order, items, settings)
+            pdf = pdf_renderer.render_order_pdf(spec)  # warm-up, as the render workers keep the logo
+            samples = []
+            for _ in range(rounds):
+                started = time.perf_counter()
+                pdf_renderer.render_order_pdf(spec)
+                samples.append(time.perf_counter() - started)
+            return {"logo_kb": round(len(data) / 1024, 1), "pdf_kb": round(len(pdf) / 1024, 1),
+                    "render": summarize(samples)}
+
+        result = {}
+        with tempfile.TemporaryDirectory() as directory:
+            for name, upload in uploads.items():
+                started = time.perf_counter()
+                normalized = server.normalize_logo(upload)
+                result[name] = {
+                    "normalize_ms": round((time.perf_counter() - started) * 1000, 1),
+                    "raw": measure(directory, upload),
+                    "normalized": measure(directory, normalized),
+                }
+        self.results["logo"] = result
+        print(json.dumps(result, indent=2))
+        return result
+
+
+BENCHMARKS = {
+    "login": OrderMateBenchmark.bench_concurrent_logins,
+    "search": OrderMateBenchmark.bench_search_index,
+    "dashboard": OrderMateBenchmark.bench_dashboard,
+    "polling": OrderMateBenchmark.bench_polling,
+    "pdf": OrderMateBenchmark.bench_pdf_render,
+    "logo": OrderMateBenchmark.bench_logo,
+}
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(__doc__)
+        return 1
+
+    base_url = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_BASE_URL
+    bench = OrderMateBenchmark(base_url)
+    print(f"Benchmarking against: {base_url}")
+    BENCHMARKS[sys.argv[1]](bench)
+
+    with open(f"/app/test_reports/benchmark_{sys.argv[1]}.json", 'w') as f:
+        json.dump({'timestamp': datetime.now().isoformat(), 'results': bench.results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Concurrency tests for OrderMate backend
+Verifies that parallel writes do not produce duplicate sequence numbers
+"""
+
+import requests
+import sys
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict
+
+
+class ConcurrencyTester:
+    def __init__(self, base_url="https://msgorder.preview.emergentagent.com/api"):
+        self.base_url = base_url
+        self.admin_token = None
+        self.tests_run = 0
+        self.tests_passed = 0
+        self.test_results = []
+
+    def log_test(self, name: str, success: bool, details: str = ""):
+        """Log test result"""
+        self.tests_run += 1
+        if success:
+            self.tests_passed += 1
+
+        result = {
+            "test": name,
+            "success": success,
+            "details": details,
+            "timestamp": datetime.now().isoformat()
+        }
+        self.test_results.append(result)
+
+        status = "✅ PASS" if success else "❌ FAIL"
+        print(f"{status} - {name}")
+        if details:
+            print(f"    {details}")
+
+    def make_request(self, method: str, endpoint: str, data: Dict = None,
+                     token: str = None) -> tuple[bool, Dict, int]:
+        """Make HTTP request with error handling"""
+        url = f"{self.base_url}/{endpoint}"
+        headers = {'Content-Type': 'application/json'}
+
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+
+        try:
+            if method == 'GET':
+                response = requests.get(url, headers=headers)
+            elif method == 'POST':
+                response = requests.post(url, json=data, headers=headers)
+            elif method == 'PUT':
+                response = requests.put(url, json=data, headers=headers)
+            elif method == 'DELETE':
+                response = requests.delete(url, headers=headers)
+            else:
+                return False, {}, 0
+
+            try:
+                response_data = response.json() if response.content else {}
+            except:
+                response_data = {"raw_response": response.text}
+
+            return response.status_code < 400, response_data, response.status_code
+
+        except Exception as e:
+            return False, {"error": str(e)}, 0
+
+    def setup_authentication(self):
+        """Setup authentication tokens"""
+        print("🔐 Setting up authentication...")
+
+        success, data, status = self.make_request('POST', 'auth/login', {
+            "username": "admin",
+            "password": "admin123"
+        })
+
+        if success and 'access_token' in data:
+            self.admin_token = data['access_token']
+            self.log_test("Admin login", True, "Admin token obtained")
+            return True
+
+        self.log_test("Admin login", False, f"Status: {status}")
+        return False
+
+    def test_parallel_order_creates(self, count=200, workers=50):
+        """Create orders in parallel and check order_number/order_code uniqueness"""
+        print(f"\n🔢 Testing {count} parallel order creates...")
+
+        def create(idx):
+            return self.make_request('POST', 'orders', {
+                "order_type": "teklif",
+                "customer_name": f"Concurrency Test {idx}",
+                "customer_email": "concurrency@example.com",
+                "tax_id_type": "vkn",
+                "tax_number": "1234567890",
+                "company_name": "Concurrency Test A.Ş.",
+                "notes": "Parallel create test"
+            }, token=self.admin_token)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            responses = list(pool.map(create, range(count)))
+
+        created = [data for success, data, _ in responses if success]
+        failures = [status for success, _, status in responses if not success]
+        self.log_test(
+            "All parallel creates succeeded",
+            not failures,
+            f"Created: {len(created)}, failed: {len(failures)} {failures[:5]}"
+        )
+
+        order_numbers = [o.get('order_number') for o in created]
+        order_codes = [o.get('order_code') for o in created]
+        self.log_test(
+            "Order numbers unique",
+            len(set(order_numbers)) == len(order_numbers),
+            f"{len(order_numbers) - len(set(order_numbers))} duplicates"
+        )
+        self.log_test(
+            "Order codes unique",
+            len(set(order_codes)) == len(order_codes),
+            f"{len(order_codes) - len(set(order_codes))} duplicates"
+        )
+
+        # Cleanup
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(
+                lambda o: self.make_request('DELETE', f"orders/{o['id']}", token=self.admin_token),
+                created
+            ))
+
+    def run_all_tests(self):
+        """Run all concurrency tests"""
+        print("🚀 Starting Concurrency API Tests")
+        print(f"Testing against: {self.base_url}")
+        print("=" * 60)
+
+        try:
+            if not self.setup_authentication():
+                print("❌ Authentication setup failed")
+                return False
+
+            self.test_parallel_order_creates()
+
+        except Exception as e:
+            print(f"\n❌ Test suite failed with error: {e}")
+            return False
+
+        # Print summary
+        print("\n" + "=" * 60)
+        print(f"📊 Concurrency Test Summary: {self.tests_passed}/{self.tests_run} tests passed")
+
+        if self.tests_passed == self.tests_run:
+            print("🎉 All concurrency tests passed!")
+            return True
+        else:
+            print(f"⚠️  {self.tests_run - self.tests_passed} tests failed")
+            return False
+
+
+def main():
+    tester = ConcurrencyTester()
+    success = tester.run_all_tests()
+
+    # Save detailed results
+    with open('/app/test_reports/concurrency_test_results.json', 'w') as f:
+        json.dump({
+            'summary': {
+                'total_tests': tester.tests_run,
+                'passed_tests': tester.tests_passed,
+                'success_rate': tester.tests_passed / tester.tests_run if tester.tests_run > 0 else 0,
+                'timestamp': datetime.now().isoformat()
+            },
+            'detailed_results': tester.test_results
+        }, f, indent=2)
+
+    return 0 if success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
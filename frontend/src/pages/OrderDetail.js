@@ -74,6 +74,14 @@ const OrderDetail = () => {
     fetchOrderDetail();
   }, [id]);
 
+  // Önizleme kapanınca/değişince geçici blob URL'ini serbest bırak
+  useEffect(() => {
+    const url = previewDialog.url;
+    return () => {
+      if (url?.startsWith('blob:')) window.URL.revokeObjectURL(url);
+    };
+  }, [previewDialog.url]);
+
   // Ürün arama effect'i
   useEffect(() => {
     const searchProducts = async () => {
@@ -128,43 +136,29 @@ const OrderDetail = () => {
     const files = Array.from(e.target.files);
     if (files.length === 0) return;
 
-    setUploading(true);
-    const newAttachments = [...(order.attachments || [])];
-
+    const formData = new FormData();
     for (const file of files) {
       // Max 10MB
       if (file.size > 10 * 1024 * 1024) {
         toast.error(`${file.name} 10MB'dan büyük, atlandı`);
         continue;
       }
-
-      try {
-        // Base64'e çevir
-        const reader = new FileReader();
-        const base64 = await new Promise((resolve, reject) => {
-          reader.onload = () => resolve(reader.result);
-          reader.onerror = reject;
-          reader.readAsDataURL(file);
-        });
-
-        newAttachments.push({
-          name: file.name,
-          type: file.type,
-          size: file.size,
-          data: base64,
-          uploadedAt: new Date().toISOString()
-        });
-      } catch (err) {
-        toast.error(`${file.name} yüklenemedi`);
-      }
+      formData.append('files', file);
+    }
+    if (!formData.has('files')) {
+      if (fileInputRef.current) fileInputRef.current.value = '';
+      return;
     }
 
+    setUploading(true);
     try {
-      await axios.put(`${API_URL}/orders/${order.id}`, { ...editData, attachments: newAttachments });
+      await axios.post(`${API_URL}/orders/${order.id}/attachments`, formData, {
+        headers: { 'Content-Type': 'multipart/form-data' }
+      });
       toast.success('Dosyalar yüklendi');
       fetchOrderDetail();
     } catch (error) {
-      toast.error('Dosya yüklenemedi');
+      toast.error('Dosya yüklenemedi: ' + (error.response?.data?.detail || error.message));
     } finally {
       setUploading(false);
       if (fileInputRef.current) fileInputRef.current.value = '';
@@ -172,12 +166,9 @@ const OrderDetail = () => {
   };
 
   // Dosya silme
-  const handleDeleteAttachment = async (index) => {
-    const newAttachments = [...(order.attachments || [])];
-    newAttachments.splice(index, 1);
-    
+  const handleDeleteAttachment = async (attachment) => {
     try {
-      await axios.put(`${API_URL}/orders/${order.id}`, { ...editData, attachments: newAttachments });
+      await axios.delete(`${API_URL}/orders/${order.id}/attachments/${attachment.id}`);
       toast.success('Dosya silindi');
       fetchOrderDetail();
     } catch (error) {
@@ -185,6 +176,28 @@ const OrderDetail = () => {
     }
   };
 
+  // Ek içeriğini yetkili istekle alıp tarayıcıda geçici URL oluştur
+  const getAttachmentUrl = async (attachment) => {
+    if (attachment.data) return attachment.data;
+    const response = await axios.get(`${API_URL}/orders/${order.id}/attachments/${attachment.id}`, {
+      responseType: 'blob'
+    });
+    return window.URL.createObjectURL(response.data);
+  };
+
+  const downloadAttachment = async (attachment) => {
+    try {
+      const url = await getAttachmentUrl(attachment);
+      const a = document.createElement('a');
+      a.href = url;
+      a.download = attachment.name;
+      a.click();
+      if (url.startsWith('blob:')) setTimeout(() => window.URL.revokeObjectURL(url), 0);
+    } catch (error) {
+      toast.error('Dosya indirilemedi');
+    }
+  };
+
   // Dosya türüne göre ikon
   const getFileIcon = (type) => {
     if (type?.startsWith('image/')) return <Image className="h-4 w-4" />;
@@ -192,19 +205,27 @@ const OrderDetail = () => {
   };
 
   // Dosya önizleme
-  const openPreview = (attachment) => {
-    setPreviewDialog({
-      open: true,
-      url: attachment.data,
-      type: attachment.type,
-      name: attachment.name
-    });
+  const openPreview = async (attachment) => {
+    try {
+      setPreviewDialog({
+        open: true,
+        url: await getAttachmentUrl(attachment),
+        type: attachment.type,
+        name: attachment.name
+      });
+    } catch (error) {
+      toast.error('Önizleme açılamadı');
+    }
   };
 
   const handleSaveOrder = async () => {
     setSaving(true);
     try {
-      await axios.put(`${API_URL}/orders/${order.id}`, editData);
+      // Ekler kendi uç noktalarıyla yönetilir, eski listeyi geri göndermeyelim
+      const payload = { ...editData };
+      delete payload.attachments;
+      delete payload.history;
+      await axios.put(`${API_URL}/orders/${order.id}`, payload);
       toast.success('Sipariş güncellendi');
       setEditMode(false);
       fetchOrderDetail();
@@ -471,6 +492,7 @@ const OrderDetail = () => {
                     a.href = url;
                     a.download = `teklif_${order.order_number}.pdf`;
                     a.click();
+                    setTimeout(() => window.URL.revokeObjectURL(url), 0);
                   } catch (error) {
                     toast.error('PDF indirilemedi');
                   }
@@ -1249,7 +1271,7 @@ const OrderDetail = () => {
               <p className="text-zinc-500 text-sm text-center py-4">Henüz dosya eklenmemiş.</p>
             ) : (
               order.attachments.map((attachment, idx) => (
-                <div key={idx} className="flex items-center justify-between p-3 bg-zinc-50 rounded-lg hover:bg-zinc-100 transition-colors">
+                <div key={attachment.id || idx} className="flex items-center justify-between p-3 bg-zinc-50 rounded-lg hover:bg-zinc-100 transition-colors">
                   <div className="flex items-center gap-3">
                     <div className={`p-2 rounded ${attachment.type?.startsWith('image/') ? 'bg-blue-100 text-blue-600' : 'bg-zinc-200 text-zinc-600'}`}>
                       {getFileIcon(attachment.type)}
@@ -1267,12 +1289,10 @@ const OrderDetail = () => {
                         <Eye className="h-4 w-4" />
                       </Button>
                     )}
-                    <a href={attachment.data} download={attachment.name}>
-                      <Button variant="ghost" size="sm">
-                        <FileDown className="h-4 w-4" />
-                      </Button>
-                    </a>
-                    <Button variant="ghost" size="sm" onClick={() => handleDeleteAttachment(idx)} className="text-red-600 hover:text-red-700">
+                    <Button variant="ghost" size="sm" onClick={() => downloadAttachment(attachment)}>
+                      <FileDown className="h-4 w-4" />
+                    </Button>
+                    <Button variant="ghost" size="sm" onClick={() => handleDeleteAttachment(attachment)} className="text-red-600 hover:text-red-700">
                       <Trash2 className="h-4 w-4" />
                     </Button>
                   </div>
@@ -1379,7 +1399,7 @@ const OrderDetail = () => {
       </Dialog>
 
       {/* File Preview Dialog */}
-      <Dialog open={previewDialog.open} onOpenChange={(open) => setPreviewDialog({ ...previewDialog, open })}>
+      <Dialog open={previewDialog.open} onOpenChange={(open) => setPreviewDialog(open ? { ...previewDialog, open } : { open: false, url: '', type: '', name: '' })}>
         <DialogContent className="max-w-3xl">
           <DialogHeader>
             <DialogTitle>Önizleme: {previewDialog.name}</DialogTitle>
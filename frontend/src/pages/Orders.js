@@ -55,6 +55,7 @@ const Orders = () => {
     setLoading(true);
     try {
       const params = new URLSearchParams();
+      params.append('fields', 'summary');
       if (filters.status) params.append('status', filters.status);
       if (filters.invoice_status) params.append('invoice_status', filters.invoice_status);
       if (filters.waybill_status) params.append('waybill_status', filters.waybill_status);
@@ -65,7 +66,7 @@ const Orders = () => {
       if (filters.my_orders) params.append('my_orders', 'true');
       if (searchTerm) params.append('search', searchTerm.trim());
       
-      const url = `${API_URL}/orders${params.toString() ? '?' + params.toString() : ''}`;
+      const url = `${API_URL}/orders?${params.toString()}`;
       const response = await axios.get(url);
       setOrders(response.data);
     } catch (error) {
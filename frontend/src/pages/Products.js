@@ -83,7 +83,20 @@ const Products = () => {
       const response = await axios.post(`${API_URL}/products/upload-csv`, formData, {
         headers: { 'Content-Type': 'multipart/form-data' }
       });
-      toast.success(`${response.data.total} ürün yüklendi/güncellendi!`);
+      // Import runs in the background, poll the job until it finishes
+      let job = response.data;
+      while (job.status === 'queued' || job.status === 'running') {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        job = (await axios.get(`${API_URL}/jobs/${job.id}`)).data;
+      }
+      const total = job.products_added + job.products_updated;
+      if (job.status === 'completed') {
+        toast.success(`${total} ürün yüklendi/güncellendi, ${job.products_unchanged} ürün değişmedi!`);
+      } else if (job.status === 'cancelled') {
+        toast.warning(`CSV yükleme iptal edildi (${total} ürün işlendi)`);
+      } else {
+        toast.error('CSV yükleme başarısız: ' + (job.error || 'Bilinmeyen hata'));
+      }
       fetchProducts();
     } catch (error) {
       toast.error('CSV yükleme başarısız: ' + (error.response?.data?.detail || error.message));
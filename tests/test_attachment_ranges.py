@@ -0,0 +1,60 @@
+"""
+Range header handling of attachment downloads.
+
+A single satisfiable range is served as 206; a range past the end is 416; anything the
+server does not serve (multi-range, other units, malformed) is ignored and gets a 200.
+"""
+
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'ordermate_test')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import server  # noqa: E402
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", (0, 9)),
+    ("bytes=90-", (90, 99)),
+    ("bytes=-3", (97, 99)),
+    ("bytes=50-500", (50, 99)),
+])
+def test_single_range(header, expected):
+    assert server.parse_range_header(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=0-1,5-6", "bytes=9-2", "items=0-1", "bytes=-", "garbage"])
+def test_unserved_range_is_ignored(header):
+    assert server.parse_range_header(header, 100) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=200-300", "bytes=-0"])
+def test_range_past_end_is_not_satisfiable(header):
+    with pytest.raises(server.RangeNotSatisfiable):
+        server.parse_range_header(header, 100)
+
+
+@pytest.mark.parametrize("digest", ["../../etc/passwd", "ab/../../x", "A" * 64, "0" * 63, ""])
+def test_blob_path_rejects_non_digests(tmp_path, digest):
+    with pytest.raises(ValueError):
+        server.BlobStore(tmp_path).path(digest)
+
+
+def test_client_blob_references_are_ignored():
+    import asyncio
+
+    own, foreign = "a" * 64, "b" * 64
+    stored = [{"id": "kept", "name": "a.pdf", "sha256": own, "size": 10}]
+    sent = [
+        {"id": "kept", "name": "renamed.pdf", "sha256": foreign, "size": 1},
+        {"id": "forged", "name": "x.pdf", "sha256": foreign, "size": 99},
+    ]
+
+    result = asyncio.run(server.externalize_attachments(sent, stored))
+
+    assert result[0] == {"id": "kept", "name": "renamed.pdf", "sha256": own, "size": 10}
+    assert result[1] == {"id": "forged", "name": "x.pdf"}
@@ -0,0 +1,32 @@
+"""
+ProductCsvImport dry runs: counts match what a real import would do to the catalog.
+"""
+
+from tests.test_update_round_trips import fake_db, run, seed, server  # noqa: F401
+
+
+def import_rows(rows, batch_size):
+    importer = server.ProductCsvImport(batch_size, dry_run=True)
+
+    async def go():
+        for row_num, row in enumerate(rows, start=2):
+            await importer.add_row(row_num, row)
+        await importer.finish()
+    run(go())
+    return importer
+
+
+def test_dry_run_counts_repeated_code_once(fake_db):
+    seed(fake_db, 'products', {"id": "p1", "web_service_code": "OLD", "content_hash": "stale", "is_active": True})
+    rows = [
+        {"Web Servis Kodu": "NEW", "Ürün Adı": "Yeni"},
+        {"Web Servis Kodu": "OLD", "Ürün Adı": "Eski"},
+        {"Web Servis Kodu": "NEW", "Ürün Adı": "Yeni v2"},
+        {"Web Servis Kodu": "OLD", "Ürün Adı": "Eski v2"},
+    ]
+
+    # Repeats inside one batch force a flush, batch_size=1 flushes every row
+    for batch_size in (100, 1):
+        importer = import_rows(rows, batch_size)
+        assert (importer.products_added, importer.products_updated) == (1, 1)
+        assert fake_db.calls[('products', 'bulk_write')] == 0
@@ -0,0 +1,62 @@
+"""
+Incremental dashboard counter deltas.
+
+An order or item write changes only the counter fields whose dimension value moved; a
+reconciliation afterwards must find nothing to correct.
+"""
+
+import os
+import sys
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'ordermate_test')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import server  # noqa: E402
+
+
+def order(**fields):
+    return {"general_status": "bilgi_bekliyor", "invoice_status": "kesilmedi", "delivery_method": "kargo",
+            "cargo_barcode_status": "yazdirilmadi", "assigned_user_id": "u1", **fields}
+
+
+def deltas(old, new):
+    return server.counter_deltas(server.order_counter_fields(old), server.order_counter_fields(new))
+
+
+def test_new_order_increments_every_dimension():
+    assert deltas(None, order()) == {
+        "total_orders": 1,
+        "general_status.bilgi_bekliyor": 1,
+        "invoice_status.kesilmedi": 1,
+        "cargo_barcode_not_printed": 1,
+        "assigned_open.u1": 1,
+    }
+
+
+def test_untracked_edit_has_no_deltas():
+    assert deltas(order(), order(notes="Kapıda teslim")) == {}
+
+
+def test_completing_an_order_closes_open_counters():
+    assert deltas(order(), order(general_status="tamamlandi")) == {
+        "general_status.bilgi_bekliyor": -1,
+        "general_status.tamamlandi": 1,
+        "cargo_barcode_not_printed": -1,
+        "assigned_open.u1": -1,
+    }
+
+
+def test_reassignment_moves_open_count():
+    assert deltas(order(), order(assigned_user_id="u2")) == {"assigned_open.u1": -1, "assigned_open.u2": 1}
+
+
+def test_delete_decrements_item_status():
+    old = server.item_counter_fields({"item_status": "temin_edilecek"})
+    assert server.counter_deltas(old, server.item_counter_fields(None)) == {"item_status.temin_edilecek": -1}
+
+
+def test_counter_keys_are_safe_field_names():
+    assert server.counter_key(None) == "none"
+    assert server.counter_key("a.b") == "a_b"
+    assert server.counter_key("$x") == "x"
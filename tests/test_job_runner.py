@@ -0,0 +1,41 @@
+"""
+JobRunner ownership: a worker only writes progress and final status for jobs it still holds.
+"""
+
+import pytest
+
+from tests.test_update_round_trips import fake_db, run, seed, server  # noqa: F401
+
+
+@pytest.fixture
+def runner():
+    return server.JobRunner()
+
+
+def test_progress_stops_handler_after_takeover(fake_db, runner, tmp_path):
+    upload = tmp_path / "upload.csv"
+    upload.write_text("code\n")
+    seed(fake_db, 'jobs', {"id": "j1", "type": "test", "status": server.JobStatus.RUNNING,
+                           "worker_id": "other-worker"})
+    reached = []
+
+    async def handler(job_doc):
+        await runner.progress(job_doc['id'], rows_processed=10)
+        reached.append(True)
+    runner.handler("test")(handler)
+
+    run(runner._run({"id": "j1", "type": "test", "file_path": str(upload)}))
+
+    assert not reached
+    assert fake_db.calls[('jobs', 'update_one')] == 0  # no final status written
+    assert fake_db.jobs.docs[0] == {"id": "j1", "type": "test", "status": server.JobStatus.RUNNING,
+                                    "worker_id": "other-worker"}
+    assert upload.exists()  # the new owner still reads it
+
+
+def test_progress_writes_while_owned(fake_db, runner):
+    seed(fake_db, 'jobs', {"id": "j1", "status": server.JobStatus.RUNNING, "worker_id": server.WORKER_ID})
+
+    run(runner.progress("j1", rows_processed=10))
+
+    assert fake_db.jobs.docs[0]["rows_processed"] == 10
@@ -0,0 +1,29 @@
+"""
+Keyset cursors on list endpoints, including sparse-fieldset responses.
+"""
+
+from tests.test_update_round_trips import ADMIN, fake_db, run, seed, server  # noqa: F401
+
+
+def seed_products(database, count):
+    for i in range(count):
+        seed(database, 'products', {"id": f"p{i}", "product_name": f"Ürün {i}", "web_service_code": f"C{i}",
+                                    "created_at": f"2024-01-{i + 1:02d}T00:00:00+00:00"})
+
+
+def test_summary_fieldset_keeps_next_cursor(fake_db):
+    seed_products(fake_db, 3)
+
+    response = run(server.get_products(server.Response(), limit=2, fields="summary", current_user=ADMIN))
+
+    token = response.headers.get(server.NEXT_CURSOR_HEADER)
+    assert token
+    assert server.decode_cursor(token, server.PRODUCT_LIST_SORT) == ["2024-01-02T00:00:00+00:00", "p1"]
+
+
+def test_last_page_has_no_cursor(fake_db):
+    seed_products(fake_db, 1)
+
+    response = run(server.get_products(server.Response(), limit=2, fields="summary", current_user=ADMIN))
+
+    assert server.NEXT_CURSOR_HEADER not in response.headers
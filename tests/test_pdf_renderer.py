@@ -0,0 +1,247 @@
+"""
+Quote PDF rendering from a plain render spec, and the bounded render pool.
+"""
+
+import asyncio
+import io
+import os
+import pickle
+import sys
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import pytest
+from PIL import Image
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'ordermate_test')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import pdf_renderer  # noqa: E402
+import server  # noqa: E402
+
+
+def pdf_settings(logo=None, version="v1"):
+    return server.PdfSettings(
+        template=server.PDFTemplateSettings(notes="Satır 1\nSatır 2", payment_terms="Peşin"),
+        bank_accounts=[server.BankAccount(bank_name="Banka", account_holder="OrderMate", iban="TR00")],
+        logo=logo, version=version)
+
+
+def render_spec(item_count=3, logo=None):
+    order = {"id": "o1", "order_number": 42, "customer_name": "Çağrı Şahin", "customer_email": "a@b.co",
+             "created_at": datetime(2026, 1, 5, tzinfo=timezone.utc).isoformat(), "history": [{"id": "h"}]}
+    items = [{"id": f"i{i}", "order_id": "o1", "product_name": f"Ürün {i}", "quantity": 2, "unit_price": 10.5}
+             for i in range(item_count)]
+    return server.pdf_render_spec(order, items, pdf_settings(logo))
+
+
+def test_spec_is_plain_data():
+    spec = render_spec()
+    assert pickle.loads(pickle.dumps(spec)) == spec
+    assert set(spec["order"]) == set(server.PDF_ORDER_FIELDS)
+
+
+def test_render_order_pdf():
+    pdf = pdf_renderer.render_order_pdf(render_spec())
+    assert pdf.startswith(b"%PDF-")
+    assert pdf.rstrip().endswith(b"%%EOF")
+
+
+def test_long_order_flows_over_numbered_pages():
+    from pypdf import PdfReader
+
+    reader = PdfReader(io.BytesIO(pdf_renderer.render_order_pdf(render_spec(item_count=120))))
+    pages = [page.extract_text() for page in reader.pages]
+
+    assert len(pages) > 2
+    for number, text in enumerate(pages, 1):
+        assert f"Sayfa {number} / {len(pages)}" in text
+    # Table header repeats on every page the table continues on
+    assert all("S.No" in text for text in pages[:-1])
+    assert "Ürün 119" in pages[-1] or "Ürün 119" in pages[-2]
+
+
+def test_order_pdf_endpoint_renders_every_item(monkeypatch, tmp_path):
+    from pypdf import PdfReader
+    from tests.test_update_round_trips import ADMIN, CountingDatabase
+
+    database = CountingDatabase()
+    monkeypatch.setattr(server, 'db', database)
+    monkeypatch.setattr(server, 'pdf_cache', server.PdfCache(tmp_path / "pdf", max_bytes=10**8))
+    monkeypatch.setattr(server, 'pdf_settings_cache', server.PdfSettingsCache(tmp_path / "assets", sync_seconds=60))
+
+    async def render_inline(spec):
+        return pdf_renderer.render_order_pdf(spec)
+    monkeypatch.setattr(server.pdf_render_pool, 'render', render_inline)
+
+    database.orders.docs.append({"id": "o1", "order_number": 7, "order_code": "AU010126000007",
+                                 "created_at": datetime(2026, 1, 5, tzinfo=timezone.utc).isoformat()})
+    database.order_items.docs.extend({"id": f"i{i}", "order_id": "o1", "product_name": f"Ürün {i}",
+                                      "quantity": 1, "unit_price": 1.0} for i in range(1200))
+
+    class Request:
+        headers = {}
+
+    response = asyncio.run(server.generate_order_pdf("o1", Request(), current_user=ADMIN))
+    text = "".join(page.extract_text() for page in PdfReader(io.BytesIO(response.body)).pages)
+
+    assert "Ürün 1199" in text
+    assert "1,200.00 ₺" in text
+
+
+def test_render_with_logo_file(tmp_path):
+    path = tmp_path / "logo"
+    Image.new("RGB", (40, 20), (200, 30, 30)).save(path, format="PNG")
+    logo = {"sha256": "abc", "path": str(path)}
+
+    assert pdf_renderer.render_order_pdf(render_spec(logo=logo)).startswith(b"%PDF-")
+    assert pdf_renderer.logo_image(logo) is pdf_renderer.logo_image(logo)
+
+
+def test_normalize_logo_fits_print_box():
+    photo = io.BytesIO()
+    exif = Image.Exif()
+    exif[0x010E] = "camera description"
+    Image.effect_noise((3000, 1000), 60).convert("RGB").save(photo, format="JPEG", quality=95, exif=exif)
+
+    logo = server.normalize_logo(photo.getvalue())
+    image = Image.open(io.BytesIO(logo))
+    assert image.size == (500, 167)
+    assert "exif" not in image.info
+    assert len(logo) < len(photo.getvalue())
+
+    transparent = io.BytesIO()
+    Image.new("RGBA", (200, 100), (0, 0, 0, 0)).save(transparent, format="PNG")
+    image = Image.open(io.BytesIO(server.normalize_logo(transparent.getvalue())))
+    assert (image.format, image.mode, image.size) == ("PNG", "RGBA", (200, 100))
+
+    with pytest.raises(ValueError):
+        server.normalize_logo(b"not an image")
+
+
+def test_saturated_pool_rejects(monkeypatch):
+    release = threading.Event()
+
+    def blocked_render(spec):
+        release.wait(5)
+        return b"%PDF-stub"
+
+    monkeypatch.setattr(server, 'render_order_pdf', blocked_render)
+    pool = server.PdfRenderPool(workers=1, queue_size=1)
+    pool._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def scenario():
+        running = [asyncio.create_task(pool.render({})) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(server.PdfPoolSaturated):
+            await pool.render({})
+        release.set()
+        return await asyncio.gather(*running)
+
+    try:
+        assert asyncio.run(scenario()) == [b"%PDF-stub", b"%PDF-stub"]
+    finally:
+        pool.stop()
+    assert pool.stats()["rejected"] == 1
+    assert pool.stats()["pending"] == 0
+
+
+def test_pdf_cache_coalesces_and_evicts(tmp_path):
+    cache = server.PdfCache(tmp_path, max_bytes=10)
+    renders = []
+
+    async def render():
+        renders.append(1)
+        await asyncio.sleep(0.01)
+        return b"%PDF-aaaa"
+
+    async def scenario():
+        results = await asyncio.gather(*(cache.get_or_render("k1", render) for _ in range(5)))
+        again = await cache.get_or_render("k1", render)
+        return results, again
+
+    results, again = asyncio.run(scenario())
+    assert len(renders) == 1
+    assert set(results) == {again} == {b"%PDF-aaaa"}
+    assert cache.stats()["hits"] == 1
+
+    cache.put("k2", b"%PDF-bbbb")
+    assert not cache.path("k1").exists()
+    assert cache.get("k2") == b"%PDF-bbbb"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_pdf_cache_limit_covers_all_workers(tmp_path):
+    # Two workers sharing the directory, each only aware of its own writes
+    workers = [server.PdfCache(tmp_path, max_bytes=20) for _ in range(2)]
+    for n in range(6):
+        workers[n % 2].put(f"k{n}", b"%PDF-" + bytes([n]) * 4)
+
+    assert sum(f.stat().st_size for f in tmp_path.glob("*.pdf")) <= 20
+    assert workers[1].path("k5").exists()
+
+
+def test_pdf_cache_bookkeeping_is_thread_safe(tmp_path):
+    # Switch threads as often as possible to make interleavings likely
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    cache = server.PdfCache(tmp_path, max_bytes=40)
+    keys = [f"k{n}" for n in range(8)]
+
+    def churn(seed):
+        for n in range(300):
+            key = keys[(seed + n) % len(keys)]
+            if cache.get(key) is None:
+                cache.put(key, b"%PDF-" + key.encode())
+
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(churn, range(8)))
+    finally:
+        sys.setswitchinterval(interval)
+
+    # Every call succeeded and the size still matches the index
+    assert cache.stats()["bytes"] == sum(cache._index.values()) <= 40
+
+
+def test_pdf_cache_key_changes_with_inputs():
+    order = {"id": "o1", "order_number": 1, "updated_at": "2026-01-01T00:00:00"}
+    items = [{"id": "i1", "quantity": 1}, {"id": "i2", "quantity": 2}]
+    key = server.pdf_cache_key(order, items, "v1")
+
+    assert server.pdf_cache_key(order, list(reversed(items)), "v1") == key
+    assert server.pdf_cache_key(order, items[:1], "v1") != key
+    assert server.pdf_cache_key({**order, "updated_at": "2026-01-02T00:00:00"}, items, "v1") != key
+    assert server.pdf_cache_key(order, items, "v2") != key
+
+
+def test_zip_stream_buffer_produces_valid_archive():
+    sink = server.ZipStreamBuffer()
+    chunks = []
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for n in range(3):
+            archive.writestr(f"teklif_{n}.pdf", b"%PDF-" + bytes([n]) * 1000)
+            chunks.append(sink.drain())
+    chunks.append(sink.drain())
+
+    assert all(chunks[:3])
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert archive.namelist() == ["teklif_0.pdf", "teklif_1.pdf", "teklif_2.pdf"]
+    assert archive.read("teklif_2.pdf") == b"%PDF-" + b"\x02" * 1000
+
+
+def test_pdf_batch_query():
+    by_ids = server.pdf_batch_query(server.PdfBatchRequest(order_ids=["o1", "AU010126000001"]))
+    assert by_ids == {"$or": [{"id": {"$in": ["o1", "AU010126000001"]}},
+                              {"order_code": {"$in": ["o1", "AU010126000001"]}}]}
+
+    by_filter = server.pdf_batch_query(server.PdfBatchRequest(
+        order_type="kurumsal_cari", created_from=datetime(2026, 10, 16), created_to=datetime(2026, 10, 17)))
+    assert by_filter == {"order_type": "kurumsal_cari", "created_at": {
+        "$gte": "2026-10-16T00:00:00+00:00", "$lt": "2026-10-17T00:00:00+00:00"}}
+
+    with pytest.raises(server.HTTPException):
+        server.pdf_batch_query(server.PdfBatchRequest())
@@ -0,0 +1,32 @@
+"""
+PresenceTracker flushes: one bulk_write per interval, and entries that leave the online
+window are persisted with their final timestamp before being evicted.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from tests.test_update_round_trips import fake_db, run, server  # noqa: F401
+
+
+def test_stale_activity_within_min_delta_is_flushed_then_evicted(fake_db):
+    tracker = server.PresenceTracker(flush_seconds=60, min_delta_seconds=60)
+    old = datetime.now(timezone.utc) - timedelta(minutes=server.ONLINE_WINDOW_MINUTES + 5)
+    # Flushed while online; the last request came a few seconds later, then the user went idle
+    tracker._flushed["u1"] = old
+    tracker._seen["u1"] = old + timedelta(seconds=5)
+
+    run(tracker.flush())
+
+    assert tracker.writes == 1
+    assert "u1" not in tracker._seen and "u1" not in tracker._flushed
+
+
+def test_recent_activity_within_min_delta_waits(fake_db):
+    tracker = server.PresenceTracker(flush_seconds=60, min_delta_seconds=60)
+    tracker.touch("u1")
+    run(tracker.flush())
+    tracker._seen["u1"] += timedelta(seconds=5)
+    run(tracker.flush())
+
+    assert tracker.writes == 1
+    assert fake_db.calls[('users', 'bulk_write')] == 1
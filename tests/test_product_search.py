@@ -0,0 +1,37 @@
+"""
+Product search index ranking: exact code, then prefix, then substring matches, the same
+whether a query is answered from the index directly or from a cached match list.
+"""
+
+from tests.test_update_round_trips import server
+
+
+def build_index():
+    index = server.ProductSearchIndex()
+    index.build([
+        {"id": "sub", "web_service_code": "X1", "product_name": "Büyük kablo"},
+        {"id": "prefix", "web_service_code": "X2", "product_name": "Kablo makarası"},
+        {"id": "exact", "web_service_code": "KABLO", "product_name": "Set"},
+        {"id": "other", "web_service_code": "X3", "product_name": "Priz"},
+    ])
+    return index
+
+
+def test_ranked_matches_search():
+    index = build_index()
+    assert index.search("kablo", 10) == ["exact", "prefix", "sub"]
+
+    nums = index.match("kab", server.SEARCH_CACHE_MAX_CANDIDATES)
+    assert index.ranked("kablo", index.refine("kablo", nums), 10) == ["exact", "prefix", "sub"]
+    assert index.ranked("kablo", nums, 2) == ["exact", "prefix"]
+
+
+def test_session_cache_refines_without_private_access(monkeypatch):
+    monkeypatch.setattr(server, 'product_search_index', build_index())
+    cache = server.SearchSessionCache(max_bytes=10**6)
+
+    cache.lookup("ka")
+    entry = cache.lookup("kabl")
+
+    assert cache.stats()["refinement_hits"] == 1
+    assert sorted(server.product_search_index.product_ids(entry["nums"])) == ["exact", "prefix", "sub"]
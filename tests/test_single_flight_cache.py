@@ -0,0 +1,99 @@
+"""
+SingleFlightCache behaviour: concurrent callers share one computation, results live for
+the TTL, failures are not cached.
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'ordermate_test')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import server  # noqa: E402
+
+
+class SlowQuery:
+    def __init__(self, fail=False):
+        self.calls = 0
+        self.fail = fail
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise RuntimeError("db down")
+        return {"calls": self.calls}
+
+
+def test_concurrent_callers_share_one_computation():
+    cache = server.SingleFlightCache(ttl_seconds=60)
+    query = SlowQuery()
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get("dashboard", query) for _ in range(50)))
+
+    results = asyncio.run(scenario())
+
+    assert query.calls == 1
+    assert all(result == {"calls": 1} for result in results)
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["coalesced"] == 49
+
+
+def test_cached_until_ttl_expires():
+    cache = server.SingleFlightCache(ttl_seconds=0.05)
+    query = SlowQuery()
+
+    async def scenario():
+        await cache.get("k", query)
+        await cache.get("k", query)
+        await asyncio.sleep(0.06)
+        return await cache.get("k", query)
+
+    assert asyncio.run(scenario()) == {"calls": 2}
+    assert cache.stats()["hits"] == 1
+
+
+def test_keys_are_independent():
+    cache = server.SingleFlightCache(ttl_seconds=60)
+    query = SlowQuery()
+
+    async def scenario():
+        await asyncio.gather(cache.get(("dashboard", True), query), cache.get(("dashboard", False), query))
+
+    asyncio.run(scenario())
+    assert query.calls == 2
+
+
+def test_failures_are_shared_but_not_cached():
+    cache = server.SingleFlightCache(ttl_seconds=60)
+    query = SlowQuery(fail=True)
+
+    async def scenario():
+        results = await asyncio.gather(*(cache.get("k", query) for _ in range(5)), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        query.fail = False
+        return await cache.get("k", query)
+
+    assert asyncio.run(scenario()) == {"calls": 2}
+    assert cache.stats()["errors"] == 1
+
+
+def test_cancelled_caller_does_not_cancel_others():
+    cache = server.SingleFlightCache(ttl_seconds=60)
+    query = SlowQuery()
+
+    async def scenario():
+        first = asyncio.create_task(cache.get("k", query))
+        second = asyncio.create_task(cache.get("k", query))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == {"calls": 1}
@@ -0,0 +1,346 @@
+"""
+Round-trip counts of the PUT endpoints.
+
+Each edit should reach its collection exactly once in the common case. The endpoint
+functions run against a small in-memory database that counts every call it receives.
+"""
+
+import asyncio
+import base64
+import hashlib
+import io
+import os
+import sys
+from collections import Counter
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+from pymongo import ReturnDocument
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'ordermate_test')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+import server  # noqa: E402
+
+
+def matches(doc, query):
+    for key, value in query.items():
+        if key == '$or':
+            if not any(matches(doc, sub) for sub in value):
+                return False
+        elif isinstance(value, dict) and '$in' in value:
+            if doc.get(key) not in value['$in']:
+                return False
+        elif doc.get(key) != value:
+            return False
+    return True
+
+
+def project(doc, projection):
+    excluded = {k for k, v in (projection or {}).items() if not v}
+    return {k: v for k, v in doc.items() if k not in excluded}
+
+
+class Result:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            self.docs.sort(key=lambda d: d.get(field), reverse=direction < 0)
+        return self
+
+    def skip(self, count):
+        self.docs = self.docs[count:]
+        return self
+
+    def limit(self, count):
+        if count:
+            self.docs = self.docs[:count]
+        return self
+
+    async def to_list(self, length):
+        return self.docs[:length]
+
+    async def __aiter__(self):
+        for doc in self.docs:
+            yield doc
+
+
+class CountingCollection:
+    def __init__(self, name, calls):
+        self.name = name
+        self.calls = calls
+        self.docs = []
+
+    def count(self, method):
+        self.calls[(self.name, method)] += 1
+
+    async def find_one(self, query, projection=None):
+        self.count('find_one')
+        return next((project(dict(d), projection) for d in self.docs if matches(d, query)), None)
+
+    async def find_one_and_update(self, query, update, projection=None, return_document=ReturnDocument.BEFORE, upsert=False):
+        self.count('find_one_and_update')
+        doc = next((d for d in self.docs if matches(d, query)), None)
+        before = dict(doc) if doc else None
+        if doc is None:
+            if not upsert:
+                return None
+            doc = {k: v for k, v in query.items() if not k.startswith('$')}
+            doc.update(update.get('$setOnInsert', {}))
+            self.docs.append(doc)
+        doc.update(update.get('$set', {}))
+        for key, step in update.get('$inc', {}).items():
+            doc[key] = doc.get(key, 0) + step
+        for key in update.get('$unset', {}):
+            doc.pop(key, None)
+        result = dict(doc) if return_document == ReturnDocument.AFTER else before
+        return project(result, projection) if result else None
+
+    def find(self, query, projection=None):
+        self.count('find')
+        return Cursor([project(dict(d), projection) for d in self.docs if matches(d, query)])
+
+    async def update_one(self, query, update, upsert=False):
+        self.count('update_one')
+        return Result(matched_count=0, modified_count=0)
+
+    async def bulk_write(self, ops, ordered=True):
+        self.count('bulk_write')
+        self.docs.extend({"op": op} for op in ops)
+
+    async def insert_many(self, docs, ordered=True):
+        self.count('insert_many')
+        self.docs.extend(dict(d) for d in docs)
+
+
+class CountingDatabase:
+    def __init__(self):
+        self.calls = Counter()
+        self.collections = {}
+
+    def __getattr__(self, name):
+        if name not in self.collections:
+            self.collections[name] = CountingCollection(name, self.calls)
+        return self.collections[name]
+
+    def round_trips(self, collection):
+        return sum(n for (name, _), n in self.calls.items() if name == collection)
+
+
+ADMIN = server.User(id='admin-id', username='admin', full_name='Admin User', role=server.UserRole.ADMIN,
+                    created_at=datetime.now(timezone.utc))
+NOW = datetime.now(timezone.utc).isoformat()
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    database = CountingDatabase()
+    monkeypatch.setattr(server, 'db', database)
+    return database
+
+
+def seed(database, collection, doc):
+    getattr(database, collection).docs.append(doc)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_update_user_single_round_trip(fake_db, monkeypatch):
+    seed(fake_db, 'users', {"id": "u1", "username": "old", "full_name": "Old Name", "role": "satis",
+                            "password": "hash", "is_active": True, "created_at": NOW})
+
+    async def fast_hash(password):
+        return "new-hash"
+    monkeypatch.setattr(server, 'hash_password_async', fast_hash)
+
+    user = run(server.update_user("u1", server.UserCreate(
+        username="new", password="secret", full_name="New Name", role="satis"), current_user=ADMIN))
+
+    assert user.username == "new"
+    assert fake_db.round_trips('users') == 1
+
+
+def test_update_user_to_taken_username_is_400(fake_db, monkeypatch):
+    async def duplicate(*args, **kwargs):
+        raise server.DuplicateKeyError("E11000 duplicate key error")
+    monkeypatch.setattr(fake_db.users, 'find_one_and_update', duplicate)
+
+    with pytest.raises(HTTPException) as exc:
+        run(server.update_user("u1", server.UserCreate(
+            username="taken", password="", full_name="Name", role="satis"), current_user=ADMIN))
+    assert exc.value.status_code == 400
+
+
+def test_update_product_single_round_trip(fake_db):
+    seed(fake_db, 'products', {"id": "p1", "product_name": "Kablo", "web_service_code": "WS1",
+                               "content_hash": "abc", "created_at": NOW})
+
+    product = run(server.update_product("p1", server.ProductCreate(product_name="Kablo 2m", web_service_code="WS1"),
+                                        current_user=ADMIN))
+
+    assert product.product_name == "Kablo 2m"
+    assert fake_db.round_trips('products') == 1
+    assert "content_hash" not in fake_db.products.docs[0]
+    # The shared catalog version bump is the only other write
+    assert fake_db.round_trips('counters') == 1
+
+
+def test_update_order_type_single_round_trip(fake_db):
+    seed(fake_db, 'order_types', {"id": "t1", "name": "Teklif", "code": "teklif", "created_at": NOW})
+
+    order_type = run(server.update_order_type("t1", server.OrderTypeCreate(name="Teklif (Yeni)", code="teklif"),
+                                              current_user=ADMIN))
+
+    assert order_type.name == "Teklif (Yeni)"
+    assert fake_db.round_trips('order_types') == 1
+
+
+def test_update_pdf_template_single_round_trip(fake_db):
+    settings = run(server.update_pdf_template(server.PDFTemplateUpdate(company_name="Acme"), current_user=ADMIN))
+    assert settings.company_name == "Acme"
+    assert fake_db.round_trips('pdf_settings') == 1
+
+    # Second save updates the document created by the first
+    settings = run(server.update_pdf_template(server.PDFTemplateUpdate(company_name="Acme A.Ş."), current_user=ADMIN))
+    assert settings.company_name == "Acme A.Ş."
+    assert len(fake_db.pdf_settings.docs) == 1
+    assert fake_db.round_trips('pdf_settings') == 2
+
+
+def test_update_bank_account_single_round_trip(fake_db):
+    seed(fake_db, 'bank_accounts', {"id": "b1", "bank_name": "Banka", "account_holder": "OrderMate",
+                                    "iban": "TR00"})
+
+    account = run(server.update_bank_account("b1", server.BankAccountCreate(
+        bank_name="Banka", account_holder="OrderMate", iban="TR01"), current_user=ADMIN))
+
+    assert account.iban == "TR01"
+    assert fake_db.round_trips('bank_accounts') == 1
+
+
+def test_update_order_item_single_round_trip(fake_db):
+    seed(fake_db, 'order_items', {"id": "i1", "order_id": "o1", "product_name": "Kablo", "quantity": 1,
+                                  "created_at": NOW, "updated_at": NOW})
+
+    item = run(server.update_order_item("i1", server.OrderItemCreate(order_id="o1", product_name="Kablo", quantity=3),
+                                        current_user=ADMIN))
+
+    assert item.quantity == 3
+    assert fake_db.round_trips('order_items') == 1
+
+
+def order_doc(**fields):
+    return {"id": "o1", "order_number": 1, "order_code": "AU010126000001", "order_type": "teklif",
+            "created_by": "admin-id", "created_by_name": "Admin User", "general_status": "bilgi_bekliyor",
+            "invoice_status": "kesilmedi", "waybill_status": "kesilmedi", "cargo_status": "yok",
+            "created_at": NOW, "updated_at": NOW, **fields}
+
+
+def test_update_order_single_round_trip(fake_db):
+    seed(fake_db, 'orders', order_doc())
+
+    order = run(server.update_order("AU010126000001", {
+        "general_status": "bilgi_bekliyor", "invoice_status": "kesilmedi", "waybill_status": "kesilmedi",
+        "cargo_status": "yok", "notes": "Kapıda teslim",
+    }, current_user=ADMIN))
+
+    assert order.notes == "Kapıda teslim"
+    assert fake_db.round_trips('orders') == 1
+    assert fake_db.round_trips('order_history') == 0
+
+
+def test_update_order_history_is_one_insert(fake_db):
+    seed(fake_db, 'orders', order_doc())
+
+    order = run(server.update_order("o1", {
+        "general_status": "islemde", "invoice_status": "kesildi", "waybill_status": "kesilmedi",
+        "cargo_status": "yok",
+    }, current_user=ADMIN))
+
+    assert [entry.new_value for entry in order.history] == ["islemde", "kesildi"]
+    assert fake_db.round_trips('orders') == 1
+    assert fake_db.calls[('order_history', 'insert_many')] == 1
+
+
+def test_update_order_payment_due_at_in_same_round_trip(fake_db):
+    seed(fake_db, 'orders', order_doc())
+
+    order = run(server.update_order("o1", {
+        "payment_start_at": "2026-01-01T00:00:00+00:00", "payment_term_days": 30,
+        "payment_due_at": "1999-01-01T00:00:00+00:00",  # client copy is ignored
+    }, current_user=ADMIN))
+
+    assert order.payment_due_at == datetime(2026, 1, 31, tzinfo=timezone.utc)
+    assert fake_db.orders.docs[0]["payment_due_at"] == order.payment_due_at
+    assert fake_db.round_trips('orders') == 1
+
+
+@pytest.mark.parametrize("endpoint, args", [
+    (server.update_order_type, ("missing", server.OrderTypeCreate(name="x", code="x"))),
+    (server.update_bank_account, ("missing", server.BankAccountCreate(bank_name="x", account_holder="x", iban="x"))),
+    (server.update_order_item, ("missing", server.OrderItemCreate(order_id="o", product_name="x", quantity=1))),
+    (server.update_order, ("missing", {"notes": "x"})),
+])
+def test_missing_document_is_404_in_one_round_trip(fake_db, endpoint, args):
+    with pytest.raises(HTTPException) as error:
+        run(endpoint(*args, current_user=ADMIN))
+
+    assert error.value.status_code == 404
+    assert sum(fake_db.calls.values()) == 1
+
+
+def test_pdf_settings_loaded_once_until_invalidated(fake_db, tmp_path):
+    seed(fake_db, 'bank_accounts', {"id": "b1", "bank_name": "Banka", "account_holder": "OrderMate",
+                                    "iban": "TR00", "is_active": True})
+    cache = server.PdfSettingsCache(tmp_path, sync_seconds=60)
+
+    async def scenario():
+        first = await asyncio.gather(*(cache.get() for _ in range(5)))
+        await server.update_bank_account("b1", server.BankAccountCreate(
+            bank_name="Banka", account_holder="OrderMate", iban="TR01"), current_user=ADMIN)
+        await cache.invalidate()
+        return first, await cache.get()
+
+    first, second = run(scenario())
+
+    assert {settings.version for settings in first} == {first[0].version}
+    assert [account.iban for account in second.bank_accounts] == ["TR01"]
+    assert second.version != first[0].version
+    assert cache.stats()["loads"] == 2
+    assert fake_db.calls[('bank_accounts', 'find')] == 2
+
+
+def test_update_pdf_template_logo(fake_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, 'pdf_settings_cache', server.PdfSettingsCache(tmp_path, sync_seconds=60))
+    png = io.BytesIO()
+    Image.new("RGB", (2000, 1000), "red").save(png, format="PNG")
+
+    def save(logo_base64):
+        return run(server.update_pdf_template(server.PDFTemplateUpdate(logo_base64=logo_base64), current_user=ADMIN))
+
+    settings = save(base64.b64encode(png.getvalue()).decode())
+    assert Image.open(io.BytesIO(base64.b64decode(settings.logo_base64))).size == (500, 250)
+    assert settings.logo_sha256 == hashlib.sha256(base64.b64decode(settings.logo_base64)).hexdigest()
+
+    # The form echoes the stored logo back with every other field
+    assert save(settings.logo_base64).logo_sha256 == settings.logo_sha256
+
+    for invalid in ("not base64!", base64.b64encode(b"not an image").decode()):
+        with pytest.raises(HTTPException) as exc:
+            save(invalid)
+        assert exc.value.status_code == 400
+
+    cleared = save(None)
+    assert (cleared.logo_base64, cleared.logo_sha256) == (None, None)